@@ -84,7 +84,29 @@ async def run(master: labManager.master.Master, use_GUI_login: bool = False):
     # print output of first task as run on first client (task_refs are indexed by client id)
     task = master.task_groups[tg_id].tasks[master.clients[client_id].id]
     print(f'ran "{task.payload}" on {master.clients[task.client].name} ({master.clients[task.client].online.host}) which finished with exit code {task.return_code}, got:')
-    print(task.output)
+    print(task.get_output())
+
+    # call a python function on all clients and collect what it returns, as each client finishes
+    # NB: the function is pickled, so it must be importable on the clients (here it is, platform
+    # is part of the standard library), unless cloudpickle is installed on the master and clients
+    import platform
+    async for result in master.map(platform.python_version, '*', timeout=10):
+        if result.error:
+            print(f'{master.clients[result.client].name}: call failed: {result.error}')
+        else:
+            print(f'{master.clients[result.client].name} runs python {result.value}')
+
+    # run multiple steps that depend on each other. Each client starts a step as soon as the steps it
+    # depends on are done on that client, without waiting for the other clients. The state file records
+    # which steps finished on which client, so that these are not run again when running the pipeline again
+    from labManager.common import pipeline, task
+    steps = [
+        pipeline.Step('prepare', task.TaskDef(type=task.Type.Shell_command, payload_text='echo preparing {hostname}', placeholders=True)),
+        pipeline.Step('run',     task.TaskDef(type=task.Type.Shell_command, payload_text='echo running'), depends_on=['prepare']),
+    ]
+    pipe = await master.run_pipeline(steps, '*', state_file='pipeline_state.json')
+    for c,status in (await pipe.wait()).items():
+        print(f'{master.clients[c].name}: {", ".join(f"{s}: {st.value}" for s,st in status.items())}')
 
     # get some file listings on the client
     # make this waiter before the request to ensure no race condition
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import traceback
 import platform
 import pathlib
@@ -6,8 +7,9 @@ import pathvalidate
 import json
 import threading
 from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
 
-from labManager.common import config, eye_tracker, file_actions, message, share, structs, task
+from labManager.common import config, eye_tracker, file_actions, file_hash, file_pull, file_sync, message, payload_cache, python_worker, share, structs, task
 from labManager.common.network import comms, ifs, keepalive, mdns, nmb, ssdp
 
 
@@ -22,10 +24,24 @@ class ConnectedMaster:
     local_addr:     tuple[str,int]
 
     handler:        asyncio.Task            = None
+    client_id:      int                     = None  # id under which this master knows us
 
     task_list:      list[task.RunningTask]  = field(default_factory=list)
     mounted_drives: set[str]                = field(default_factory=set)
 
+    # payloads requested from this master: hash -> future, and task id -> (hash, file suffix)
+    payload_fetches:dict[str, asyncio.Future]       = field(default_factory=dict)
+    payload_requests:dict[int, tuple[str, str]]     = field(default_factory=dict)
+
+    # directories watched for this master: path -> watcher task
+    dir_watches:    dict[str, asyncio.Task]         = field(default_factory=dict)
+    # file searches running for this master: search id -> search task
+    file_searches:  dict[int, asyncio.Task]         = field(default_factory=dict)
+    # file actions running in the background for this master: action id -> task
+    file_actions:   dict[int, asyncio.Task]         = field(default_factory=dict)
+    # files being sent to this master: transfer id -> task
+    file_pulls:     dict[int, asyncio.Task]         = field(default_factory=dict)
+
 class Client:
     def __init__(self, network = None):
         self.network  = network or config.client['network']
@@ -46,6 +62,18 @@ class Client:
         self.masters:                       dict[int,ConnectedMaster]   = {}
         self.master_lock                                                = threading.Lock()
 
+        task_config = config.client['tasks'] if config.client and 'tasks' in config.client else {}
+        self._task_scheduler:               task.Scheduler              = task.Scheduler(task_config.get('max_concurrent'))
+        self._task_stats_interval:          float                       = task_config.get('stats_interval', 1.)
+        self._payload_cache:                payload_cache.PayloadCache  = payload_cache.PayloadCache(task_config.get('payload_cache_path'), task_config.get('payload_cache_size', 256)*1024*1024)
+        self._python_workers:               python_worker.WorkerPool    = None
+        if 'python_workers' in task_config:
+            worker_config = task_config['python_workers']
+            self._python_workers = python_worker.WorkerPool(worker_config['number'], worker_config['preload'], worker_config['max_runs'], worker_config['max_memory_growth']*1024*1024)
+        self._listing_cache:                file_actions.ListingCache   = file_actions.ListingCache()
+        self._hash_cache:                   file_hash.HashCache         = file_hash.HashCache()
+        self._file_action_config:           dict                        = config.client['file_actions'] if config.client and 'file_actions' in config.client else {}
+
     async def run(self, server_addr: tuple[str,int] = None, *, discoverer='mdns'):
         # 1. get interfaces we can work with
         for i in range(1,config.client['network_retry']['number_tries']+1):
@@ -65,7 +93,11 @@ class Client:
         # 3. start eye tracker poller
         self._poll_for_eyetrackers_task = asyncio.create_task(self._poll_for_eyetrackers())
 
-        # 4. discover master, if needed
+        # 4. start warm python workers, if configured
+        if self._python_workers:
+            self._python_workers.start()
+
+        # 5. discover master, if needed
         if not server_addr:
             if discoverer.casefold()=='ssdp':
                 # start SSDP client
@@ -106,6 +138,15 @@ class Client:
                 # cancel running tasks
                 for t in self.masters[m].task_list:
                     t.handler.cancel()
+                # stop watching directories and searching
+                for w in self.masters[m].dir_watches.values():
+                    w.cancel()
+                for s in self.masters[m].file_searches.values():
+                    s.cancel()
+                for a in self.masters[m].file_actions.values():
+                    a.cancel()
+                for p in self.masters[m].file_pulls.values():
+                    p.cancel()
 
                 # cancel master itself
                 self.masters[m].handler.cancel()
@@ -121,6 +162,8 @@ class Client:
         all_waiters = tasks + running_tasks + close_waiters + master_handlers
         if self._ssdp_client:
             all_waiters.append(self._ssdp_client.stop())
+        if self._python_workers:
+            all_waiters.append(asyncio.create_task(self._python_workers.close()))
         if all_waiters:
             await asyncio.wait(
                 all_waiters,
@@ -198,6 +241,8 @@ class Client:
                             with open(info_file) as f:
                                 info = json.load(f)
                         await comms.typed_send(writer, message.Message.IDENTIFY, {'name': self.name, 'MACs': self._if_macs, 'image_info': info})
+                    case message.Message.CLIENT_ID:
+                        self.masters[m].client_id = msg['client_id']
 
                     case message.Message.ET_STATUS_REQUEST:
                         if not self.connected_eye_tracker:
@@ -226,15 +271,25 @@ class Client:
                         self.masters[m].mounted_drives.discard(msg['drive'])
 
                     case message.Message.TASK_CREATE:
-                        new_task = task.RunningTask(msg['task_id'], )
-                        new_task.handler = asyncio.create_task(
-                            task.Executor().run(
-                                msg['task_id'],msg['type'],msg['payload'],msg['cwd'],msg['env'],msg['interactive'],msg['python_unbuf'],
-                                new_task,
-                                writer)
-                        )
-                        self.masters[m].task_list.append(new_task)
-                        new_task.handler.add_done_callback(lambda tsk: self._remove_finished_task(m, tsk))
+                        self._create_task(m, msg, writer)
+                    case message.Message.TASK_GROUP_CREATE:
+                        # message is sent to all clients in the group, pick out our task, if any
+                        task_id = msg.pop('task_ids').get(self.masters[m].client_id)
+                        if task_id is not None:
+                            msg['task_id'] = task_id
+                            self._create_task(m, msg, writer)
+                    case message.Message.TASK_PAYLOAD:
+                        if msg['task_id'] in self.masters[m].payload_requests:
+                            payload_hash, suffix = self.masters[m].payload_requests.pop(msg['task_id'])
+                            fut = self.masters[m].payload_fetches.pop(payload_hash)
+                            if 'error' in msg:
+                                # e.g. master doesn't know the task (anymore)
+                                fut.set_exception(RuntimeError(f'Master could not provide task payload: {msg["error"]}'))
+                            else:
+                                try:
+                                    fut.set_result(await self._payload_cache.put(payload_hash, suffix, msg['payload']))
+                                except Exception as exc:
+                                    fut.set_exception(exc)
                     case message.Message.TASK_INPUT:
                         # find if there is a running task with this id and which has an input queue, else ignore the input
                         my_task = None
@@ -244,6 +299,20 @@ class Client:
                                 break
                         if my_task and my_task.input:
                             await my_task.input.put(msg['payload'])
+                    case message.Message.TASK_INPUT_RAW:
+                        task_id, payload = task.unpack_raw_input(msg)
+                        for t in self.masters[m].task_list:
+                            if task_id==t.id and not t.handler.done():
+                                if t.input:
+                                    await t.input.put(payload)
+                                break
+                    case message.Message.TASK_RESIZE:
+                        # find if there is a running task with this id that runs in a pseudo-terminal, else ignore the request
+                        for t in self.masters[m].task_list:
+                            if msg['task_id']==t.id and not t.handler.done():
+                                if t.resize:
+                                    t.resize(msg['rows'], msg['cols'])
+                                break
                     case message.Message.TASK_CANCEL:
                         # find if there is a running task with this id, else ignore the request
                         my_task = None
@@ -279,10 +348,15 @@ class Client:
                                                out
                                               )
                     case message.Message.FILE_GET_LISTING:
+                        request = msg
                         msg = {'path': str(msg['path'])}
                         try:
                             pathvalidate.validate_filepath(msg['path'], "auto")
-                            msg['listing'] = await file_actions.get_dir_list(msg['path'])
+                            if 'limit' in request:
+                                # a page of the sorted and filtered listing
+                                msg['listing'] = await self._listing_cache.get_page(msg['path'], request.get('offset',0), request['limit'], request.get('sort_key','name'), request.get('descending',False), request.get('filter',''), request.get('refresh',False))
+                            else:
+                                msg['listing'] = await file_actions.get_dir_list(msg['path'])
                         except Exception as exc:
                             if isinstance(exc,pathvalidate.ValidationError):
                                 exc = str(exc)  # these don't unpickle well, also can't assume receiver to have the same package installed
@@ -292,6 +366,18 @@ class Client:
                                                message.Message.FILE_LISTING,
                                                msg
                                               )
+                    case message.Message.FILE_WATCH:
+                        path = str(msg['path'])
+                        if path not in self.masters[m].dir_watches:
+                            self.masters[m].dir_watches[path] = asyncio.create_task(self._watch_directory(m, path, writer))
+                    case message.Message.FILE_UNWATCH:
+                        if (w := self.masters[m].dir_watches.pop(str(msg['path']), None)) is not None:
+                            w.cancel()
+                    case message.Message.FILE_SEARCH:
+                        self.masters[m].file_searches[msg['search_id']] = asyncio.create_task(self._run_file_search(m, msg, writer))
+                    case message.Message.FILE_SEARCH_CANCEL:
+                        if (s := self.masters[m].file_searches.get(msg['search_id'])) is not None:
+                            s.cancel()
 
                     case message.Message.FILE_MAKE:
                         out = msg
@@ -342,31 +428,8 @@ class Client:
                                                out
                                               )
                     case message.Message.FILE_COPY_MOVE:
-                        out = msg
-                        out['status'] = structs.Status.Running
-                        await comms.typed_send(writer,
-                                               message.Message.FILE_ACTION_STATUS,
-                                               out
-                                              )
-
-                        try:
-                            if msg['is_move']:
-                                return_path = await file_actions.move_path(msg['source_path'], msg['dest_path'])
-                            else:
-                                return_path = await file_actions.copy_path(msg['source_path'], msg['dest_path'], msg['dirs_exist_ok'])
-                        except Exception as exc:
-                            if isinstance(exc,pathvalidate.ValidationError):
-                                exc = str(exc)  # these don't unpickle well, also can't assume receiver to have the same package installed
-                            out['error'] = exc
-                            out['status'] = structs.Status.Errored
-                        else:
-                            out['return_path'] = pathlib.Path(return_path)
-                            out['status'] = structs.Status.Finished
-
-                        await comms.typed_send(writer,
-                                               message.Message.FILE_ACTION_STATUS,
-                                               out
-                                              )
+                        # NB: can take long, run in the background
+                        self.masters[m].file_actions[msg['action_id']] = asyncio.create_task(self._run_file_action(m, msg, writer, self._copy_move_path))
                     case message.Message.FILE_DELETE:
                         out = msg
                         out['status'] = structs.Status.Running
@@ -389,6 +452,20 @@ class Client:
                                                message.Message.FILE_ACTION_STATUS,
                                                out
                                               )
+                    case message.Message.FILE_HASH:
+                        # NB: can take long, run in the background
+                        self.masters[m].file_actions[msg['action_id']] = asyncio.create_task(self._run_file_action(m, msg, writer, self._hash_path))
+                    case message.Message.FILE_SYNC:
+                        # NB: can take long, run in the background
+                        self.masters[m].file_actions[msg['action_id']] = asyncio.create_task(self._run_file_action(m, msg, writer, self._sync_path))
+                    case message.Message.FILE_ACTION_CANCEL:
+                        if (a := self.masters[m].file_actions.get(msg['action_id'])) is not None:
+                            a.cancel()
+                    case message.Message.FILE_PULL:
+                        self.masters[m].file_pulls[msg['transfer_id']] = asyncio.create_task(self._send_file(m, msg, writer))
+                    case message.Message.FILE_PULL_CANCEL:
+                        if (p := self.masters[m].file_pulls.get(msg['transfer_id'])) is not None:
+                            p.cancel()
 
 
             except Exception as exc:
@@ -399,6 +476,21 @@ class Client:
         # remote connection closed, we're done
         writer.close()
 
+        # tasks still waiting for their payload will not get it anymore
+        for fut in self.masters[m].payload_fetches.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError('Connection to master lost before task payload was received'))
+
+        # stop watching directories and searching for this master
+        for w in self.masters[m].dir_watches.values():
+            w.cancel()
+        for s in self.masters[m].file_searches.values():
+            s.cancel()
+        for a in self.masters[m].file_actions.values():
+            a.cancel()
+        for p in self.masters[m].file_pulls.values():
+            p.cancel()
+
         # clean up any drives mounted by this master
         for drive in self.masters[m].mounted_drives:
             share.unmount_share(drive)
@@ -408,6 +500,271 @@ class Client:
             if m in self.masters:
                 del self.masters[m]
 
+    async def _watch_directory(self, m: int, path: str, writer: asyncio.streams.StreamWriter):
+        async def send_changes(added: structs.DirListing, removed: list[str], changed: structs.DirListing):
+            # keep a cached listing of the directory up to date
+            self._listing_cache.apply_changes(path, added, removed, changed)
+            await comms.typed_send(writer,
+                                   message.Message.FILE_CHANGES,
+                                   {'path': path, 'added': added, 'removed': removed, 'changed': changed}
+                                  )
+
+        try:
+            pathvalidate.validate_filepath(path, "auto")
+            await file_actions.DirWatcher(path, send_changes).run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            if isinstance(exc,pathvalidate.ValidationError):
+                exc = str(exc)  # these don't unpickle well, also can't assume receiver to have the same package installed
+            try:
+                await comms.typed_send(writer,
+                                       message.Message.FILE_CHANGES,
+                                       {'path': path, 'added': structs.DirListing(path), 'removed': [], 'changed': structs.DirListing(path), 'error': exc}
+                                      )
+            except Exception:
+                pass    # connection may already be gone
+        finally:
+            if m in self.masters and self.masters[m].dir_watches.get(path) is asyncio.current_task():
+                del self.masters[m].dir_watches[path]
+
+    async def _run_file_search(self, m: int, msg: dict, writer: asyncio.streams.StreamWriter):
+        root = str(msg['root'])
+        out = {'search_id': msg['search_id'], 'root': root, 'status': structs.Status.Running}
+        try:
+            pathvalidate.validate_filepath(root, "auto")
+            # NB: aclosing() so that the search stops right away when we're cancelled
+            async with contextlib.aclosing(file_actions.search(root, msg['pattern'], msg['is_regex'],
+                                                               msg['min_size'], msg['max_size'], msg['min_mtime'], msg['max_mtime'],
+                                                               msg['max_depth'], msg['include_dirs'])) as batches:
+                async for batch in batches:
+                    await comms.typed_send(writer,
+                                           message.Message.FILE_SEARCH_RESULTS,
+                                           out | {'results': batch}
+                                          )
+        except asyncio.CancelledError:
+            out['cancelled'] = True
+            out['status'] = structs.Status.Finished
+        except Exception as exc:
+            if isinstance(exc,pathvalidate.ValidationError):
+                exc = str(exc)  # these don't unpickle well, also can't assume receiver to have the same package installed
+            out['error'] = exc
+            out['status'] = structs.Status.Errored
+        else:
+            out['status'] = structs.Status.Finished
+        finally:
+            if m in self.masters:
+                self.masters[m].file_searches.pop(msg['search_id'], None)
+
+        try:
+            await comms.typed_send(writer,
+                                   message.Message.FILE_SEARCH_RESULTS,
+                                   out | {'results': structs.DirListing(root)}
+                                  )
+        except Exception:
+            pass    # connection may already be gone
+
+    async def _run_file_action(self, m: int, msg: dict, writer: asyncio.streams.StreamWriter, action: Callable[[dict, Callable[..., None]], Awaitable[dict[str, Any]]]):
+        # run a file action that can take long. Its status updates include progress while it runs
+        out = msg
+        out['status'] = structs.Status.Running
+        await comms.typed_send(writer,
+                               message.Message.FILE_ACTION_STATUS,
+                               out
+                              )
+
+        progress_sends: set[asyncio.Task] = set()
+        def send_progress(*progress):
+            # NB: last progress is also included in the final status
+            out['progress'] = progress
+            t = asyncio.create_task(comms.typed_send(writer,
+                                                     message.Message.FILE_ACTION_STATUS,
+                                                     out.copy()
+                                                    ))
+            progress_sends.add(t)
+            t.add_done_callback(progress_sends.discard)
+
+        try:
+            out |= await action(msg, send_progress)
+        except asyncio.CancelledError:
+            out['error'] = 'Cancelled'
+            out['cancelled'] = True
+            out['status'] = structs.Status.Errored
+        except Exception as exc:
+            if isinstance(exc,pathvalidate.ValidationError):
+                exc = str(exc)  # these don't unpickle well, also can't assume receiver to have the same package installed
+            out['error'] = exc
+            out['status'] = structs.Status.Errored
+        else:
+            out['status'] = structs.Status.Finished
+        finally:
+            if m in self.masters:
+                self.masters[m].file_actions.pop(msg['action_id'], None)
+
+        try:
+            # final status should arrive after any progress updates
+            if progress_sends:
+                await asyncio.wait(progress_sends)
+            await comms.typed_send(writer,
+                                   message.Message.FILE_ACTION_STATUS,
+                                   out
+                                  )
+        except Exception:
+            pass    # connection may already be gone
+
+    async def _send_file(self, m: int, msg: dict, writer: asyncio.streams.StreamWriter):
+        out = {'transfer_id': msg['transfer_id']}
+        try:
+            out |= await file_pull.send_file(writer, msg['transfer_id'], msg['path'], msg['offset'], msg['compress'])
+        except asyncio.CancelledError:
+            return  # master is no longer interested
+        except Exception as exc:
+            out['error'] = str(exc) or type(exc).__name__
+        finally:
+            if m in self.masters:
+                self.masters[m].file_pulls.pop(msg['transfer_id'], None)
+
+        try:
+            await comms.typed_send(writer,
+                                   message.Message.FILE_PULL_END,
+                                   out
+                                  )
+        except Exception:
+            pass    # connection may already be gone
+
+    async def _copy_move_path(self, msg: dict, progress: Callable[..., None]) -> dict[str, Any]:
+        # progress: (files done, files total, bytes done, bytes total, bytes per second)
+        max_workers = msg.get('max_workers') or self._get_copy_workers(msg['dest_path'])
+        if msg['is_move']:
+            return_path = await file_actions.move_path(msg['source_path'], msg['dest_path'], progress, max_workers=max_workers)
+        else:
+            return_path = await file_actions.copy_path(msg['source_path'], msg['dest_path'], msg['dirs_exist_ok'], progress, max_workers=max_workers)
+        return {'return_path': pathlib.Path(return_path)}
+
+    def _get_copy_workers(self, dest_path: str|pathlib.Path) -> int:
+        # number of files to copy at the same time to the destination: configured for
+        # the destination (longest matching path wins), else depending on whether the
+        # destination is on a network share
+        dest_path = pathlib.Path(dest_path)
+        best = None
+        for path, workers in self._file_action_config.get('copy_workers_destinations', {}).items():
+            path = pathlib.Path(path)
+            if (dest_path==path or path in dest_path.parents) and (best is None or len(path.parts)>len(best[0].parts)):
+                best = (path, workers)
+        if best:
+            return best[1]
+        try:
+            is_network = file_actions.is_network_path(dest_path)
+        except OSError:
+            is_network = False
+        if is_network:
+            return self._file_action_config.get('copy_workers_network', 16)
+        return self._file_action_config.get('copy_workers', file_actions.default_copy_workers)
+
+    async def _hash_path(self, msg: dict, progress: Callable[..., None]) -> dict[str, Any]:
+        # progress: (files done, files total, bytes done, bytes total)
+        pathvalidate.validate_filepath(msg['path'], "auto")
+        manifest = await file_hash.hash_path(msg['path'], msg['algorithm'],
+                                             self._hash_cache if msg['use_cache'] else None,
+                                             progress)
+        return {'manifest': manifest}
+
+    async def _sync_path(self, msg: dict, progress: Callable[..., None]) -> dict[str, Any]:
+        # progress: (files done, files total, bytes done, bytes total, bytes per second)
+        plan = await file_sync.sync_path(msg['source_path'], msg['dest_path'],
+                                         msg['compare_hash'], cache=self._hash_cache,
+                                         delete_policy=msg['delete_policy'], dry_run=msg['dry_run'],
+                                         use_manifest=msg['use_manifest'],
+                                         manifest_folder=self._file_action_config.get('sync_manifest_path'),
+                                         progress=progress,
+                                         max_workers=msg.get('max_workers') or self._get_copy_workers(msg['dest_path']))
+        return {'plan': plan}
+
+    def _create_task(self, m: int, msg: dict, writer: asyncio.streams.StreamWriter):
+        new_task = task.RunningTask(msg['task_id'], priority=msg.get('priority', 0))
+        new_task.handler = asyncio.create_task(self._run_task(m, new_task, msg, writer))
+        self.masters[m].task_list.append(new_task)
+        new_task.handler.add_done_callback(lambda tsk: self._remove_finished_task(m, tsk))
+
+    async def _run_task(self, m: int, running_task: task.RunningTask, msg: dict, writer: asyncio.streams.StreamWriter):
+        placeholders = {'hostname': self.name, 'client_id': self.masters[m].client_id} if msg.get('placeholders') else None
+        if placeholders:
+            if msg['payload']:
+                msg['payload'] = task.expand_placeholders(msg['payload'], placeholders)
+            if msg['cwd']:
+                msg['cwd'] = task.expand_placeholders(msg['cwd'], placeholders)
+            if msg['env']:
+                msg['env'] = {k:task.expand_placeholders(v, placeholders) for k,v in msg['env'].items()}
+
+        payload_file = None
+        if msg.get('payload_hash'):
+            try:
+                payload_file = await self._get_task_payload(m, msg, writer)
+                if placeholders:
+                    payload_file = await self._expand_task_payload(payload_file, placeholders)
+            except asyncio.CancelledError as exc:
+                await task.send_error(exc, msg['task_id'], writer)
+                raise
+            except Exception as exc:
+                await task.send_error(exc, msg['task_id'], writer)
+                return None
+
+        with self._payload_cache.in_use(payload_file) if payload_file else contextlib.nullcontext():
+            return await self._task_scheduler.run(
+                running_task, m, writer,
+                lambda: task.Executor(self._task_stats_interval).run(
+                    msg['task_id'],msg['type'],msg['payload'],msg['cwd'],msg['env'],msg['interactive'],msg['python_unbuf'],
+                    running_task,
+                    writer,
+                    payload_file=payload_file,
+                    worker_pool=self._python_workers,
+                    limits=task.Limits(**msg['limits']) if msg.get('limits') else None,
+                    use_pty=msg.get('pty', False),
+                    raw_output=msg.get('raw_output', False))
+            )
+
+    async def _expand_task_payload(self, payload_file: pathlib.Path, placeholders: dict) -> pathlib.Path:
+        # the payload the master sent is shared by all clients, store our expanded version
+        # of it in the cache as well, so that it is reused by later runs.
+        # NB: if the expanded payload is returned, payload_file is released
+        try:
+            payload = await asyncio.to_thread(payload_file.read_text)
+            expanded = task.expand_placeholders(payload, placeholders)
+            if expanded==payload:
+                return payload_file
+            expanded_file = await self._payload_cache.put(payload_cache.digest(expanded), payload_file.suffix, expanded)
+        except BaseException:
+            self._payload_cache.release(payload_file)
+            raise
+        self._payload_cache.release(payload_file)
+        return expanded_file
+
+    async def _get_task_payload(self, m: int, msg: dict, writer: asyncio.streams.StreamWriter) -> pathlib.Path:
+        # NB: returned payload is marked in use in the cache, release it when done
+        payload_hash, suffix = msg['payload_hash'], task.cached_payload_types[msg['type']]
+        master = self.masters[m]
+        while not (path := self._payload_cache.get(payload_hash, suffix)):
+            # not cached, ask master for it. If another task already asked for the same
+            # payload, wait for that instead and then get it from the cache
+            # NB: shield, so that cancellation of this task doesn't cancel the fetch for others waiting on it
+            if payload_hash in master.payload_fetches:
+                await asyncio.shield(master.payload_fetches[payload_hash])
+                continue
+            fut = master.payload_fetches[payload_hash] = asyncio.get_running_loop().create_future()
+            master.payload_requests[msg['task_id']] = (payload_hash, suffix)
+            await comms.typed_send(writer,
+                                   message.Message.TASK_PAYLOAD_REQUEST,
+                                   {'task_id': msg['task_id'], 'payload_hash': payload_hash}
+                                  )
+            try:
+                # NB: put() already marked the payload in use for us
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # we won't be using it
+                fut.add_done_callback(lambda f: f.cancelled() or f.exception() or self._payload_cache.release(f.result()))
+                raise
+        return path
+
     async def _poll_for_eyetrackers(self):
         try:
             while True:
@@ -0,0 +1,198 @@
+import asyncio
+import ctypes
+import os
+import pathlib
+import shutil
+import socket
+import struct
+import sys
+import psutil
+from smb import SMBConnection, base as smb_base, smb_structs  # from pysmb package
+
+from . import file_actions, structs
+
+# file systems of network drives, CD/DVDs and RAM disks. Drives mounted under one of
+# the removable media folders are assumed to be USB drives
+_NETWORK_FS     = ('cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'afpfs', 'fuse.sshfs', 'davfs')
+_CDROM_FS       = ('iso9660', 'udf')
+_RAMDISK_FS     = ('tmpfs', 'ramfs')
+_REMOVABLE_DIRS = ('/media/', '/run/media/', '/Volumes/')
+_smb_timeout    = 10  # s
+
+
+def get_thispc_listing() -> list[structs.DirEntry]:
+    items = []
+    home = pathlib.Path.home()
+    # NB: Desktop, Documents and Downloads are added if found as subfolders of the user's home folder
+    for path, disp_name in [(home, 'Home'), (home/'Desktop', 'Desktop'), (home/'Documents', 'Documents'), (home/'Downloads', 'Downloads')]:
+        if not path.is_dir():
+            continue
+        stat = path.stat()
+        item = structs.DirEntry(disp_name, True, path,
+                                stat.st_ctime, stat.st_mtime, stat.st_size,
+                                file_actions.guess_mime_type(path))
+        items.append(item)
+    return items
+
+
+def get_drives() -> list[structs.DirEntry]:
+    drives = []
+    for part in psutil.disk_partitions(all=False):
+        mount = part.mountpoint
+        entry = structs.DirEntry(mount,True,pathlib.Path(mount),None,None,None,None)
+        entry.extra['drive_name'] = part.device
+        if part.fstype in _NETWORK_FS:
+            entry.mime_type = 'labManager/drive_network'
+            entry.extra['remote_path'] = part.device
+            # build name: 'share_name (net_name) (mount point)'
+            path_comps = file_actions.split_network_path(part.device)
+            if len(path_comps)>=2:
+                entry.name = f'{path_comps[1]} ({path_comps[0]}) ({mount})'
+        elif part.fstype in _CDROM_FS:
+            entry.mime_type = 'labManager/drive_cdrom'
+        elif part.fstype in _RAMDISK_FS:
+            entry.mime_type = 'labManager/drive_ramdisk'
+        elif mount.startswith(_REMOVABLE_DIRS):
+            entry.mime_type = 'labManager/drive_removable'
+            entry.name = f'{pathlib.Path(mount).name} ({mount})'
+        else:
+            entry.mime_type = 'labManager/drive'
+            if mount!='/':
+                entry.name = f'{pathlib.Path(mount).name} ({mount})'
+        # get size information
+        try:
+            usage = shutil.disk_usage(mount)
+        except OSError:
+            # e.g. no permission or stale network mount
+            pass
+        else:
+            entry.size = usage.total
+            entry.extra['free_space'] = usage.free
+
+        drives.append(entry)
+
+    return drives
+
+def get_visible_shares(server: str, user: str='', password: str='', domain=''):
+    # hidden (name ending in $) and special (e.g. IPC$) shares are not listed
+    return [s for s in get_all_shares(server, user, password, domain) if not s.name.endswith('$')]
+
+def get_all_shares(server: str, user: str='', password: str='', domain=''):
+    # similar to get_visible_shares() but also lists hidden shares
+    # NB: no system support for this, so connect to the server ourselves using pysmb
+    server = server.strip('\\/')
+    conn = SMBConnection.SMBConnection(user, password, socket.gethostname(), server, domain=domain, use_ntlm_v2=True, is_direct_tcp=True)
+    try:
+        if not conn.connect(server, 445, timeout=_smb_timeout):
+            raise PermissionError(f'Could not log in to server {server} as user "{user}"')
+        remote_shares = conn.listShares(timeout=_smb_timeout)
+    except (smb_base.SMBTimeout, smb_base.NotConnectedError, smb_base.NotReadyError, smb_structs.OperationFailure) as exc:
+        raise OSError(f'Could not list shares on server {server}: {exc}') from exc
+    finally:
+        conn.close()
+
+    return [structs.DirEntry(share.name,True,pathlib.Path(f'//{server}/{share.name}'),None,None,None,'labManager/net_share') for share in remote_shares]
+
+def check_share(server: str, share: str, user: str='', password: str='', domain=''):
+    # cannot check, report that we don't have access
+    return False
+
+def is_network_path(path: str | pathlib.Path) -> bool:
+    path = str(path)
+    if file_actions.split_network_path(path):
+        return True
+    # find the mount that the path is on: the one with the longest mount point
+    # that the path is below
+    path = os.path.abspath(path)
+    best = None
+    for part in psutil.disk_partitions(all=True):
+        mount = part.mountpoint
+        if (path==mount or path.startswith(mount.rstrip('/')+'/')) and (best is None or len(mount)>len(best.mountpoint)):
+            best = part
+    return best is not None and best.fstype in _NETWORK_FS
+
+
+# directory watching, using inotify on Linux
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ONLYDIR      = 0x01000000
+IN_NONBLOCK     = os.O_NONBLOCK
+IN_CLOEXEC      = os.O_CLOEXEC
+_IN_WATCH_MASK  = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+_IN_GONE_MASK   = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+_inotify_event  = struct.Struct('iIII')     # wd, mask, cookie, len, followed by len bytes of name
+
+_libc = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.inotify_init1.argtypes = ctypes.c_int,
+        _libc.inotify_add_watch.argtypes = ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+    except (OSError, AttributeError):
+        _libc = None
+
+class _Inotify:
+    def __init__(self, path: str | pathlib.Path):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd<0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if _libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_WATCH_MASK)<0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, os.strerror(err), str(path))
+
+    async def wait(self):
+        # wait until there are events to read
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        loop.add_reader(self.fd, lambda: fut.done() or fut.set_result(None))
+        try:
+            await fut
+        finally:
+            loop.remove_reader(self.fd)
+
+    def read_changes(self) -> set[str]|None:
+        # names of entries that changed since last call. None if events were
+        # lost and the directory should be listed again. Raises FileNotFoundError
+        # if the watched directory was removed
+        names = set()
+        while True:
+            try:
+                buf = os.read(self.fd, 64*1024)
+            except BlockingIOError:
+                return names
+            off = 0
+            while off<len(buf):
+                _, mask, _, length = _inotify_event.unpack_from(buf, off)
+                off += _inotify_event.size
+                if mask & _IN_GONE_MASK:
+                    raise FileNotFoundError('Watched directory was removed or moved')
+                if mask & IN_Q_OVERFLOW:
+                    names = None
+                elif names is not None and length:
+                    names.add(os.fsdecode(buf[off:off+length].rstrip(b'\0')))
+                off += length
+
+    def close(self):
+        os.close(self.fd)
+
+def open_dir_watch(path: str | pathlib.Path) -> _Inotify|None:
+    # returns None when changes have to be found by listing the directory again
+    if _libc is None:
+        return None
+    try:
+        return _Inotify(path)
+    except OSError:
+        # e.g. too many watches in use or file system that doesn't support inotify
+        if not os.path.isdir(path):
+            raise
+        return None
@@ -87,11 +87,22 @@ _master_schema = s.Map({
             s.Optional('interactive', default=False):       # Boolean indicating whether this is an interactive task. If true,
                 s.Bool(),                                   # users can send commands to the task as it is running (e.g., use cmd
                                                             # as a remote shell)
+            s.Optional('pty', default=False): s.Bool(),     # if true, interactive tasks are run in a pseudo-terminal, so that
+                                                            # programs behave as when used in a terminal (e.g. prompts and
+                                                            # line editing). Only supported on POSIX clients
+            s.Optional('raw_output', default=False):        # if true, task output is transferred and stored as is, and only
+                s.Bool(),                                   # decoded when viewed. Use for tasks whose output is not UTF-8
+                                                            # (the encoding can be chosen in the task result view) or binary
+            s.Optional('placeholders', default=False):      # if true, {hostname} and {client_id} in the payload, cwd and env
+                s.Bool(),                                   # are replaced on each client by its name and its id on the master
             s.Optional('python_unbuffered', default=False): # if true, appends the -u flag to commands running the python
                 s.Bool(),                                   # executable to put it in unbuffered mode, so that any output is
-        }),                                                 # directly written to stdout/stderr and can be remotely monitored. Does
-    ),                                                      # nothing for task types other than task.Type.Python_module and
+                                                            # directly written to stdout/stderr and can be remotely monitored. Does
+                                                            # nothing for task types other than task.Type.Python_module and
                                                             # task.Type.Python_script
+            s.Optional('priority', default=0): s.Int(),     # Tasks with a higher priority are started first by a client that has
+        }),                                                 # more tasks to run than it runs concurrently
+    ),
 # end::master_schema[]
 })
 _default_master_config_file = 'master.yaml'
@@ -117,6 +128,42 @@ _client_schema = s.Map({
     s.Optional('SSDP'): s.Map({
         'device_type': s.Str(),                 # Device type to announce and listen for when using SSDP, e.g.,
     }),                                         # urn:schemas-upnp-org:device:labManager
+
+    s.Optional('tasks'): s.Map({                # Configuration for running tasks received from a master
+        s.Optional('max_concurrent',            # Maximum number of tasks that are run at the same time. Further
+            default=0): s.Int(),                # tasks are queued until a running task finishes. 0 means as many as
+                                                # the client has CPU cores
+        s.Optional('stats_interval',            # Interval (s) at which the resources (CPU time, memory, I/O) used by
+            default=1.): s.Float(),             # a running task are reported to the master. 0 disables reporting
+        s.Optional('payload_cache_path'):       # Folder in which batch file and python script payloads are cached.
+            s.Str(),                            # Defaults to a folder in the system's temporary directory
+        s.Optional('payload_cache_size',        # Maximum size (MiB) of the payload cache, least recently used payloads
+            default=256): s.Int(),              # are removed when exceeded
+        s.Optional('python_workers'): s.Map({   # Pool of pre-started python interpreters that run non-interactive
+                                                # Python_script and Python_module tasks without environment variables,
+                                                # avoiding interpreter start-up and import time for each task
+            'number': s.Int(),                  # Number of workers to keep ready
+            s.Optional('preload',               # Comma-separated list of modules that workers import when started
+                default=[]): s.CommaSeparated(s.Str()),
+            s.Optional('max_runs',              # Workers are replaced after running this many tasks
+                default=50): s.Int(),
+            s.Optional('max_memory_growth',     # Workers are replaced once their memory use has grown by this
+                default=500): s.Int(),          # many MiB since they were started
+        }),
+    }),
+
+    s.Optional('file_actions'): s.Map({         # Configuration for file actions received from a master
+        s.Optional('copy_workers',              # Number of files copied at the same time when copying a directory
+            default=4): s.Int(),                # to a local drive
+        s.Optional('copy_workers_network',      # Number of files copied at the same time when copying a directory
+            default=16): s.Int(),               # to a network share, where copying small files is bound by latency
+        s.Optional('copy_workers_destinations'):# Number of files copied at the same time for specific destinations.
+            s.MapPattern(s.Str(), s.Int()),     # Example entry: `\\server\share: 8`. Applies to the destination
+                                                # and all paths below it
+        s.Optional('sync_manifest_path'):       # Folder in which the state of destinations of syncs is stored, so that
+            s.Str(),                            # the destination does not need to be listed for the next sync. Defaults
+                                                # to a folder in the system's temporary directory
+    }),
 # end::client_schema[]
 })
 _default_client_config_file = 'client.yaml'
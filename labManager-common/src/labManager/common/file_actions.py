@@ -3,456 +3,315 @@ import mimetypes
 import asyncio
 import aiopath
 import aioshutil
-import string
+import concurrent.futures
+import contextlib
+import errno
+import fnmatch
+import functools
+import os
 import pathvalidate
+import re
+import shutil
+import stat as stat_module
+import sys
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable
 
 from . import structs
 
-import ctypes
-_kernel32 = ctypes.WinDLL('kernel32',use_last_error=True)
-_mpr = ctypes.WinDLL('mpr',use_last_error=True)
-_netapi32 = ctypes.WinDLL('netapi32',use_last_error=True)
-_shell32 = ctypes.WinDLL('shell32',use_last_error=True)
-
-
-ERROR_NO_MORE_ITEMS = 259
-ERROR_EXTENDED_ERROR= 1208
-ERROR_SESSION_CREDENTIAL_CONFLICT = 1219
-
-def _error_check_non0_is_error_ex(allowed, result, func, args):
-    if not result or result in allowed:
-        return result
-    if result==ERROR_EXTENDED_ERROR:
-        last_error = ctypes.wintypes.DWORD()
-        provider = ctypes.create_unicode_buffer(256)
-        description = ctypes.create_unicode_buffer(256)
-        WNetGetLastError(ctypes.byref(last_error),description,ctypes.sizeof(description),provider,ctypes.sizeof(provider))
-        raise ctypes.WinError(last_error.value, f'{provider.value} failed: {description.value}')
-    if (err := ctypes.get_last_error()):
-        result = err
-    raise ctypes.WinError(result)
-def _error_check_non0_is_error(result, func, args):
-    return _error_check_non0_is_error_ex([], result, func, args)
-def _error_check_0_is_error(result, func, args):
-    if not result:
-        raise ctypes.WinError(ctypes.get_last_error())
-
-SHGFP_TYPE_CURRENT  = 0     # Get current, not default value
-CSIDL_DESKTOP       = 0
-CSIDL_PROFILE       = 40
-CSIDL_MYDOCUMENTS   = 5     # AKA CSIDL_PERSONAL
-SHGetFolderPath = _shell32.SHGetFolderPathW
-SHGetFolderPath.argtypes = ctypes.wintypes.HWND, ctypes.c_int, ctypes.wintypes.HANDLE, ctypes.wintypes.DWORD, ctypes.wintypes.LPWSTR
-SHGetFolderPath.restype = ctypes.wintypes.DWORD
-SHGetFolderPath.errcheck = _error_check_non0_is_error
-
-class NETRESOURCE(ctypes.Structure):
-	_fields_ = [
-		('scope', ctypes.wintypes.DWORD),
-		('type', ctypes.wintypes.DWORD),
-		('display_type', ctypes.wintypes.DWORD),
-		('usage', ctypes.wintypes.DWORD),
-		('local_name', ctypes.wintypes.LPWSTR),
-		('remote_name', ctypes.wintypes.LPWSTR),
-		('comment', ctypes.wintypes.LPWSTR),
-		('provider', ctypes.wintypes.LPWSTR),
-	]
-LPNETRESOURCE = ctypes.POINTER(NETRESOURCE)
-
-RESOURCE_CONNECTED  = 0x00000001
-RESOURCE_GLOBALNET  = 0x00000002
-RESOURCE_REMEMBERED = 0x00000003
-RESOURCE_RECENT     = 0x00000004
-RESOURCE_CONTEXT    = 0x00000005
-RESOURCETYPE_ANY        = 0x00000000
-RESOURCETYPE_DISK       = 0x00000001
-RESOURCETYPE_PRINT      = 0x00000002
-RESOURCETYPE_RESERVED   = 0x00000008
-RESOURCETYPE_UNKNOWN    = 0xFFFFFFFF
-RESOURCEUSAGE_CONNECTABLE   = 0x00000001
-RESOURCEUSAGE_CONTAINER     = 0x00000002
-RESOURCEUSAGE_NOLOCALDEVICE = 0x00000004
-RESOURCEUSAGE_SIBLING       = 0x00000008
-RESOURCEUSAGE_ATTACHED      = 0x00000010
-RESOURCEDISPLAYTYPE_GENERIC         = 0x00000000
-RESOURCEDISPLAYTYPE_DOMAIN          = 0x00000001
-RESOURCEDISPLAYTYPE_SERVER          = 0x00000002
-RESOURCEDISPLAYTYPE_SHARE           = 0x00000003
-RESOURCEDISPLAYTYPE_FILE            = 0x00000004
-RESOURCEDISPLAYTYPE_GROUP           = 0x00000005
-RESOURCEDISPLAYTYPE_NETWORK         = 0x00000006
-RESOURCEDISPLAYTYPE_ROOT            = 0x00000007
-RESOURCEDISPLAYTYPE_SHAREADMIN      = 0x00000008
-RESOURCEDISPLAYTYPE_DIRECTORY       = 0x00000009
-RESOURCEDISPLAYTYPE_TREE            = 0x0000000A
-RESOURCEDISPLAYTYPE_NDSCONTAINER    = 0x0000000B
-
-WNetGetLastError = _mpr.WNetGetLastErrorW
-WNetGetLastError.argtypes = ctypes.wintypes.LPDWORD, ctypes.wintypes.LPWSTR, ctypes.wintypes.DWORD, ctypes.wintypes.LPWSTR, ctypes.wintypes.DWORD
-WNetGetLastError.restype = ctypes.wintypes.DWORD
-WNetGetLastError.errcheck = _error_check_non0_is_error
-
-WNetOpenEnum = _mpr.WNetOpenEnumW
-WNetOpenEnum.argtypes = ctypes.wintypes.DWORD, ctypes.wintypes.DWORD, ctypes.wintypes.DWORD, LPNETRESOURCE, ctypes.wintypes.LPHANDLE
-WNetOpenEnum.restype = ctypes.wintypes.DWORD
-WNetOpenEnum.errcheck = _error_check_non0_is_error
-
-WNetEnumResource = _mpr.WNetEnumResourceW
-WNetEnumResource.argtypes = ctypes.wintypes.HANDLE, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPVOID, ctypes.wintypes.LPDWORD
-WNetEnumResource.restype = ctypes.wintypes.DWORD
-WNetEnumResource.errcheck = lambda r,f,a: _error_check_non0_is_error_ex([ERROR_NO_MORE_ITEMS], r, f, a)
-
-CONNECT_TEMPORARY = 0x00000004
-WNetAddConnection2 = _mpr.WNetAddConnection2W
-WNetAddConnection2.argtypes = LPNETRESOURCE, ctypes.wintypes.LPCWSTR, ctypes.wintypes.LPCWSTR, ctypes.wintypes.DWORD
-WNetAddConnection2.restype = ctypes.wintypes.DWORD
-WNetAddConnection2.errcheck = lambda r,f,a: _error_check_non0_is_error_ex([ERROR_SESSION_CREDENTIAL_CONFLICT], r, f, a)
-
-WNetGetUser = _mpr.WNetGetUserW
-WNetGetUser.argtypes = ctypes.wintypes.LPCWSTR, ctypes.wintypes.LPWSTR, ctypes.wintypes.LPDWORD
-WNetGetUser.restype = ctypes.wintypes.DWORD
-WNetGetUser.errcheck = _error_check_non0_is_error
-
-WNetCancelConnection2 = _mpr.WNetCancelConnection2W
-WNetCancelConnection2.argtypes = ctypes.wintypes.LPCWSTR, ctypes.wintypes.DWORD, ctypes.wintypes.BOOL
-WNetCancelConnection2.restype = ctypes.wintypes.DWORD
-WNetCancelConnection2.errcheck = _error_check_non0_is_error
-
-WNetCloseEnum = _mpr.WNetCloseEnum
-WNetCloseEnum.argtypes = ctypes.wintypes.HANDLE,
-WNetCloseEnum.restype = ctypes.wintypes.DWORD
-WNetCloseEnum.errcheck = _error_check_non0_is_error
-
-
-GMEM_FIXED    = 0x0000
-GMEM_MOVEABLE = 0x0002
-GMEM_ZEROINIT = 0x0040
-GHND          = GMEM_ZEROINIT | GMEM_MOVEABLE
-GPTR          = GMEM_ZEROINIT | GMEM_FIXED
-GlobalAlloc = _kernel32.GlobalAlloc
-GlobalAlloc.argtypes = ctypes.wintypes.UINT, ctypes.c_ssize_t
-GlobalAlloc.restype = ctypes.wintypes.HANDLE
-GlobalFree = _kernel32.GlobalFree
-GlobalFree.argtypes = ctypes.wintypes.HANDLE,
-GlobalFree.restype = ctypes.wintypes.HANDLE
-GlobalFree.errcheck = _error_check_non0_is_error
-
-
-class UNIVERSAL_NAME_INFO(ctypes.Structure):
-	_fields_ = [
-		('universal_name', ctypes.wintypes.LPWSTR),
-	]
-LPUNIVERSAL_NAME_INFO = ctypes.POINTER(UNIVERSAL_NAME_INFO)
-class REMOTE_NAME_INFO(ctypes.Structure):
-	_fields_ = [
-		('universal_name', ctypes.wintypes.LPWSTR),
-		('connection_name', ctypes.wintypes.LPWSTR),
-		('remaining_path', ctypes.wintypes.LPWSTR),
-	]
-LPREMOTE_NAME_INFO = ctypes.POINTER(REMOTE_NAME_INFO)
-UNIVERSAL_NAME_INFO_LEVEL   = 0x00000001
-REMOTE_NAME_INFO_LEVEL      = 0x00000002
-WNetGetUniversalName = _mpr.WNetGetUniversalNameW
-WNetGetUniversalName.argtypes = ctypes.wintypes.LPCWSTR, ctypes.wintypes.DWORD, ctypes.wintypes.LPVOID, ctypes.wintypes.LPDWORD
-WNetGetUniversalName.restype = ctypes.wintypes.DWORD
-WNetGetUniversalName.errcheck = _error_check_non0_is_error
-
-GetLogicalDrives = _kernel32.GetLogicalDrives
-GetLogicalDrives.argtypes = None
-GetLogicalDrives.restype = ctypes.wintypes.DWORD
-GetLogicalDrives.errcheck: _error_check_0_is_error
-
-GetVolumeInformation = _kernel32.GetVolumeInformationW
-GetVolumeInformation.argtypes = ctypes.wintypes.LPCWSTR, ctypes.wintypes.LPWSTR, ctypes.wintypes.DWORD, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPWSTR, ctypes.wintypes.DWORD
-GetVolumeInformation.restype = ctypes.wintypes.BOOL
-GetVolumeInformation.errcheck: _error_check_0_is_error
-
-GetDriveType = _kernel32.GetDriveTypeW
-GetDriveType.argtypes = ctypes.wintypes.LPCWSTR,
-GetDriveType.restype = ctypes.wintypes.UINT
-
-GetDiskFreeSpaceEx = _kernel32.GetDiskFreeSpaceExW
-GetDiskFreeSpaceEx.argtypes = ctypes.wintypes.LPCWSTR, ctypes.wintypes.PULARGE_INTEGER, ctypes.wintypes.PULARGE_INTEGER, ctypes.wintypes.PULARGE_INTEGER
-GetDiskFreeSpaceEx.restype = ctypes.wintypes.BOOL
-GetDiskFreeSpaceEx.errcheck: _error_check_0_is_error
-
-
-LMCSTR = ctypes.wintypes.LPCWSTR
-LMSTR = ctypes.wintypes.LPWSTR
-NET_API_STATUS = ctypes.wintypes.DWORD
-NERR_Success = 0
-NERR_NetNameNotFound = 2100+210
-MAX_PREFERRED_LENGTH = ctypes.wintypes.DWORD(-1)
-
-class SHARE_INFO_0(ctypes.Structure):
-	_fields_ = [
-		('netname', LMSTR),
-	]
-LPSHARE_INFO_0 = ctypes.POINTER(SHARE_INFO_0)
-class SHARE_INFO_1(ctypes.Structure):
-	_fields_ = [
-		('netname', LMSTR),
-		('type', ctypes.wintypes.DWORD),
-		('remark', LMSTR),
-	]
-LPSHARE_INFO_1 = ctypes.POINTER(SHARE_INFO_1)
-
-# SHARE_INFO_1.type flags
-STYPE_DISKTREE          = 0
-STYPE_PRINTQ            = 1
-STYPE_DEVICE            = 2
-STYPE_IPC               = 3
-STYPE_TEMPORARY         = 0x40000000
-STYPE_SPECIAL           = 0x80000000
-
-NetShareEnum = _netapi32.NetShareEnum
-NetShareEnum.argtypes = (LMSTR, ctypes.wintypes.DWORD, ctypes.POINTER(ctypes.wintypes.LPBYTE), ctypes.wintypes.DWORD, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPDWORD, ctypes.wintypes.LPDWORD)
-NetShareEnum.restype = NET_API_STATUS
-NetShareEnum.errcheck = _error_check_non0_is_error
-
-NetShareGetInfo = _netapi32.NetShareGetInfo
-NetShareGetInfo.argtypes = (LMSTR, LMSTR, ctypes.wintypes.DWORD, ctypes.POINTER(ctypes.wintypes.LPBYTE))
-NetShareGetInfo.restype = NET_API_STATUS
-NetShareGetInfo.errcheck = lambda r,f,a: _error_check_non0_is_error_ex([NERR_NetNameNotFound], r, f, a)
-
-NetApiBufferFree = _netapi32.NetApiBufferFree
-NetApiBufferFree.argtypes = (ctypes.wintypes.LPVOID,)
-NetApiBufferFree.restype = NET_API_STATUS
-
-
-def get_thispc_listing() -> list[structs.DirEntry]:
-    items = []
-    # NB: we also check for Downloads folder (doesn't have a CSIDL), add if found
-    # expect it as a subfolder of user's profile folder
-    for d, subdir, disp_name in [(CSIDL_DESKTOP, None, 'Desktop'), (CSIDL_MYDOCUMENTS, None, 'My Documents'), (CSIDL_PROFILE, 'Downloads', 'Downloads')]:
-        buf = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH)
-        SHGetFolderPath(None, d, None, SHGFP_TYPE_CURRENT, buf)
-        path = pathlib.Path(buf.value)
-        if subdir:
-            path /= subdir
-            if not path.is_dir():
+# platform-specific parts (drives, special folders, network shares)
+if sys.platform.startswith('win'):
+    from ._file_actions_windows import get_thispc_listing, get_drives, get_visible_shares, get_all_shares, check_share, is_network_path, open_dir_watch
+else:
+    from ._file_actions_posix import get_thispc_listing, get_drives, get_visible_shares, get_all_shares, check_share, is_network_path, open_dir_watch
+
+def guess_mime_type(path: str | pathlib.Path) -> str | None:
+    return _guess_mime_type_name(os.path.basename(path))
+
+def _guess_mime_type_name(name: str) -> str | None:
+    # mimetypes.guess_type() is slow when called for every entry of a large directory,
+    # but its result only depends on the extension, so look it up once per extension.
+    # NB: for compressed files (e.g. .tar.gz), the type is determined by the extension
+    # before the one indicating the encoding, so include that one in the key
+    root, ext = os.path.splitext(name)
+    if ext.lower() in _encoding_suffixes:
+        ext = os.path.splitext(root)[1] + ext
+    return _guess_mime_type_ext(ext)
+_encoding_suffixes = set(mimetypes.suffix_map) | set(mimetypes.encodings_map)
+
+@functools.lru_cache(maxsize=1024)
+def _guess_mime_type_ext(ext: str) -> str | None:
+    return mimetypes.guess_type(f'file{ext}')[0]
+
+def _scan_dir(path: str | pathlib.Path) -> structs.DirListing:
+    # will throw when path doesn't exist or is not a directory
+    # NB: os.scandir() gets the entry type along with the names, and on Windows also the
+    # stat information, so that little or no extra system calls are needed per entry
+    out = structs.DirListing(str(path))
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                is_dir = e.is_dir()
+                stat = e.stat()
+            except OSError:
+                # e.g. broken symlink or no permission
                 continue
-        stat = path.stat()
-        item = structs.DirEntry(disp_name, path.is_dir(), path,
-                                stat.st_ctime, stat.st_mtime, stat.st_size,
-                                mimetypes.guess_type(path)[0])
-        items.append(item)
-    return items
-
-
-def get_drives() -> list[structs.DirEntry]:
-    drives = []
-    bitmask = GetLogicalDrives()
-    for letter in string.ascii_uppercase:
-        if bitmask & 1:
-            drive = f'{letter}:\\'
-            entry = structs.DirEntry(drive[0:-1],True,pathlib.Path(drive),None,None,None,None)
-            # get name of drive
-            drive_name = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH+1)
-            if not GetVolumeInformation(drive,drive_name,ctypes.sizeof(drive_name),None,None,None,None,0):
-                raise ctypes.WinError(ctypes.get_last_error())
-            entry.extra['drive_name'] = drive_name.value
-            # get drive type
-            match GetDriveType(drive):
-                case 0 | 1:     # DRIVE_UNKNOWN, DRIVE_NO_ROOT_DIR
-                    # we skip these
-                    continue
-                case 2:     # DRIVE_REMOVABLE
-                    # assume a USB drive, by far most likely. getting what it truly is seems complicated
-                    entry.mime_type = 'labManager/drive_removable'
-                    display_name = drive_name.value if drive_name.value else 'USB Drive'
-                    entry.name = f'{display_name} ({drive[0:-1]})'
-                case 3:     # DRIVE_FIXED
-                    entry.mime_type = 'labManager/drive'
-                    display_name = drive_name.value if drive_name.value else 'Local Disk'
-                    entry.name = f'{display_name} ({drive[0:-1]})'
-                case 4:     # DRIVE_REMOTE
-                    entry.mime_type = 'labManager/drive_network'
-                    buffer_len = ctypes.wintypes.DWORD(1024)
-                    buffer = ctypes.create_unicode_buffer(buffer_len.value)
-                    un_buffer = ctypes.cast(buffer,LPUNIVERSAL_NAME_INFO)
-                    WNetGetUniversalName(drive, UNIVERSAL_NAME_INFO_LEVEL, un_buffer, ctypes.byref(buffer_len))
-                    entry.extra['remote_path'] = un_buffer[0].universal_name
-                    # build name: 'share_name (net_name) (drive)'
-                    path_comps = split_network_path(entry.extra['remote_path'])
-                    if len(path_comps)>=2:
-                        entry.name = f'{path_comps[1]} ({path_comps[0]}) ({drive[0:-1]})'
-                case 5:     # DRIVE_CDROM
-                    entry.mime_type = 'labManager/drive_cdrom'
-                case 6:     # DRIVE_RAMDISK
-                    entry.mime_type = 'labManager/drive_ramdisk'
-            # get size information
-            total, free = ctypes.wintypes.ULARGE_INTEGER(), ctypes.wintypes.ULARGE_INTEGER()
-            GetDiskFreeSpaceEx(drive,None,ctypes.byref(total),ctypes.byref(free))
-            entry.size = total.value
-            entry.extra['free_space'] = free.value
-
-            drives.append(entry)
-        bitmask >>= 1
-
-    return drives
-
-def get_visible_shares(server: str, user: str='', password: str='', domain=''):
-    shares: list[structs.DirEntry] = []
-
-    # if no user provided, user should be able to connect from the Windows
-    # explorer to this server (e.g. user should have provided credentials)
-    # if you can open it in explorer, you can list it using this call)
-    if user:
-        need_conn_cleanup = _server_login(server, user, password, domain)
-    else:
-        need_conn_cleanup = False
-
-    server = server.strip('\\/')
-    nr = NETRESOURCE(remote_name=f'\\\\{server}')
-
-    hEnum = ctypes.wintypes.HANDLE()
-    WNetOpenEnum(RESOURCE_GLOBALNET, RESOURCETYPE_ANY, 0, nr, ctypes.byref(hEnum))
-
-    # allocate a buffer
-    cbBuffer = ctypes.wintypes.DWORD(16384)     # 16K is a good size
-    mem_handle = GlobalAlloc(GPTR, cbBuffer.value)
-    lpnrLocal = ctypes.cast(mem_handle,LPNETRESOURCE)
-
-    while True:
-        cEntries = ctypes.wintypes.DWORD(-1)        # enumerate all possible entries
-        result = WNetEnumResource(hEnum, ctypes.byref(cEntries),lpnrLocal,ctypes.byref(cbBuffer))
-        if result==ERROR_NO_MORE_ITEMS:
-            break
-
-        for idx in range(cEntries.value):
-            share = lpnrLocal[idx]
-            share_path = share.remote_name
-            path_comps = split_network_path(share_path)
-            if len(path_comps)>=2:
-                shares.append(structs.DirEntry(path_comps[1],True,pathlib.Path(share_path),None,None,None,'labManager/net_share'))
-
-    # clean up
-    GlobalFree(mem_handle)
-    WNetCloseEnum(hEnum)
-    if need_conn_cleanup:
-        _server_logout(server)
-
-    return shares
-
-def get_all_shares(server: str, user: str='', password: str='', domain=''):
-    # similar to get_visible_shares() but also lists hidden shares
-    shares: list[structs.DirEntry] = []
-
-    # if no user provided, user should be able to connect from the Windows
-    # explorer to this server (e.g. user should have provided credentials)
-    # if you can open it in explorer, you can list it using this call)
-    if user:
-        need_conn_cleanup = _server_login(server, user, password, domain)
-    else:
-        need_conn_cleanup = False
-
-    server = server.strip('\\/')
-    buf = ctypes.wintypes.LPBYTE()
-    buf_len = MAX_PREFERRED_LENGTH
-    read, total = ctypes.wintypes.DWORD(0), ctypes.wintypes.DWORD(0)
-    NetShareEnum(f'\\\\{server}', 1, ctypes.byref(buf), buf_len, ctypes.byref(read), ctypes.byref(total), None)
-
-    UserInfoArray = SHARE_INFO_1 * read.value
-    remote_shares = UserInfoArray.from_address(ctypes.addressof(buf.contents))
-    for share in remote_shares:
-        shares.append(structs.DirEntry(share.netname,True,pathlib.Path(f'\\\\{server}\\{share.netname}'),None,None,None,'labManager/net_share'))
-
-    # clean up
-    NetApiBufferFree(buf)
-    if need_conn_cleanup:
-        _server_logout(server)
-
-    return shares
-
-def check_share(server: str, share: str, user: str='', password: str='', domain=''):
-    # if no user provided, user should be able to connect from the Windows
-    # explorer to this server (e.g. user should have provided credentials)
-    # if you can open it in explorer, you can list it using this call)
-    if user:
-        need_conn_cleanup = _server_login(server, user, password, domain)
-    else:
-        need_conn_cleanup = False
-
-    server = server.strip('\\/')
-    buf = ctypes.wintypes.LPBYTE()
-    ret = NetShareGetInfo(server,share,0,buf)   # NB: I never got NetShareCheck to work, always return that share doesn't exist, so using this slightly round-about way (we can't get info of a non-existent share)
-    if ret==NERR_Success:
-        NetApiBufferFree(buf)
-
-    if need_conn_cleanup:
-        _server_logout(server)
-
-    return ret!=NERR_NetNameNotFound
-
-def _server_login(server: str, user: str, password: str, domain=''):
-    # check if we already have a connection with the server, and if so, if
-    # it is the expected user
-    user_name = ctypes.create_unicode_buffer(1024)
-    buf_size = ctypes.wintypes.DWORD(ctypes.sizeof(user_name))
-    server = server.strip('\\/')
-    server = f'\\\\{server}'
-    try:
-        WNetGetUser(server, user_name, ctypes.byref(buf_size))
-    except:
-        need_conn = True
-    else:
-        user_name = user_name.value
-        need_conn = user_name!=user and not user_name.endswith(user)
-    if need_conn:
-        nr = NETRESOURCE(type=RESOURCETYPE_DISK, remote_name=server)
-        if domain:
-            user = f'{domain}\\{user}'
-        res = WNetAddConnection2(nr, password, user, CONNECT_TEMPORARY)
-        if res==ERROR_SESSION_CREDENTIAL_CONFLICT:
-            # apparently we are connected even if WNetGetUser() doesn't know. Carry on and hope for the best
-            need_conn = False
-        elif res!=0:
-            _error_check_non0_is_error(res,None,None)
-    return need_conn
-def _server_logout(server: str):
-    server = server.strip('\\/')
-    server = f'\\\\{server}'
-    try:
-        WNetCancelConnection2(server, 0, True)
-    except:
-        # ok if this fails, we did our best
-        pass
+            out.append(e.name, is_dir, stat.st_ctime, stat.st_mtime, stat.st_size, _guess_mime_type_name(e.name))
+    return out
 
-async def get_dir_list(path: pathlib.Path) -> list[structs.DirEntry]:
+async def get_dir_list(path: str | pathlib.Path) -> structs.DirListing:
     # will throw when path doesn't exist or is not a directory
-    path = aiopath.AsyncPath(path)
-    out = []
-    async for e in path.iterdir():
+    # NB: whole listing is made in a single worker thread
+    return await asyncio.to_thread(_scan_dir, path)
+
+def get_dir_list_sync(path: str | pathlib.Path) -> structs.DirListing:
+    # will throw when path doesn't exist or is not a directory
+    return _scan_dir(path)
+
+class ListingCache:
+    # short-lived cache of directory listings and of the sorted and filtered orders
+    # of their entries, so that successive pages of a large directory can be served
+    # without listing and sorting it again for each page
+    def __init__(self, max_age: float = 5., max_entries: int = 4):
+        self.max_age    = max_age
+        self.max_entries= max_entries
+        self._cache: dict[str, tuple[float, structs.DirListing, dict[tuple[str,str], list[int]], dict[tuple[str,bool,str], list[int]]]] = {}  # path -> (time listed, listing, sorted orders, orders of views)
+
+    async def get_page(self, path: str | pathlib.Path, offset: int = 0, limit: int = None, sort_key: str = 'name', descending: bool = False, filter: str = '', refresh: bool = False) -> structs.DirListing:
+        # will throw when path doesn't exist or is not a directory
+        # sort_key is one of 'name', 'ctime', 'mtime', 'type' or 'size'. Directories are always
+        # listed first. filter: only list entries whose name contains this (case-insensitive)
+        path = str(path)
+        now = time.monotonic()
+        self._cache = {p:c for p,c in self._cache.items() if now-c[0]<=self.max_age}
+        if refresh or path not in self._cache:
+            listing = await get_dir_list(path)
+            self._cache.pop(path, None)
+            self._cache[path] = (time.monotonic(), listing, {}, {})
+            while len(self._cache)>self.max_entries:
+                del self._cache[next(iter(self._cache))]
+        _, listing, sorted_orders, views = self._cache[path]
+
+        view = (sort_key, descending, filter.casefold())
+        if (order := views.get(view)) is None:
+            # NB: the descending order is the ascending order reversed, so we only sort once per key
+            if (sorted_order := sorted_orders.get((sort_key, view[2]))) is None:
+                sorted_order = sorted_orders[(sort_key, view[2])] = await asyncio.to_thread(_sort_listing, listing, sort_key, view[2])
+            order = views[view] = await asyncio.to_thread(_dirs_first, listing, sorted_order[::-1] if descending else sorted_order)
+
+        page = listing.take(order[offset:offset+limit] if limit is not None else order[offset:])
+        page.offset, page.total = offset, len(order)
+        page.sort_key, page.descending, page.filter = sort_key, descending, filter
+        return page
+
+    def invalidate(self, path: str | pathlib.Path):
+        # drop the listing of path, e.g. because the directory changed
+        self._cache.pop(str(path), None)
+
+    def apply_changes(self, path: str | pathlib.Path, added: structs.DirListing, removed: list[str], changed: structs.DirListing):
+        # bring the listing of path (if cached) up to date with changes reported for the
+        # directory, so that it doesn't need to be listed again. Sorted orders refer to
+        # entries by index and are made again when needed
+        if (cached := self._cache.get(str(path))) is None:
+            return
+        _, listing, sorted_orders, views = cached
+        listing.apply_changes(added, removed, changed)
+        sorted_orders.clear()
+        views.clear()
+
+_natural_number = re.compile(r'\d+')
+def _natural_sort_key(name: str) -> str:
+    # sort numbers in names by value, so that e.g. frame2 comes before frame10: prefix
+    # each number with its length, so that plain string comparison does the right thing
+    return _natural_number.sub(_pad_number, name.casefold())
+def _pad_number(match: re.Match) -> str:
+    number = match[0].lstrip('0') or '0'
+    return f'{len(number):03d}{number}'
+
+def _sort_listing(listing: structs.DirListing, sort_key: str, filter: str) -> list[int]:
+    order = range(len(listing))
+    if filter:
+        order = [i for i in order if filter in listing.names[i].casefold()]
+    match sort_key:
+        case 'ctime':
+            key = listing.ctimes.__getitem__
+        case 'mtime':
+            key = listing.mtimes.__getitem__
+        case 'type':
+            key = lambda i: m if (m:=listing.mime_type(i)) else ''
+        case 'size':
+            key = listing.sizes.__getitem__
+        case _:
+            keys = {i:_natural_sort_key(listing.names[i]) for i in order}
+            key = keys.__getitem__
+    return sorted(order, key=key)
+
+def _dirs_first(listing: structs.DirListing, order: list[int]) -> list[int]:
+    # NB: sort is stable, so order is otherwise maintained
+    return sorted(order, key=listing.is_dirs.__getitem__, reverse=True)
+
+class DirWatcher:
+    # watches a directory for entries being added, removed or changed and awaits
+    # callback(added: DirListing, removed: list[str], changed: DirListing) when
+    # there are changes. Where supported (inotify on Linux), the operating system
+    # tells which entries changed so that only those need to be checked. Otherwise,
+    # the directory is listed every poll_interval seconds and compared to the
+    # previous listing. Changes arriving within coalesce seconds of each other are
+    # reported together
+    def __init__(self, path: str | pathlib.Path, callback: Callable[[structs.DirListing, list[str], structs.DirListing], Awaitable[None]], poll_interval: float = 2., coalesce: float = .2):
+        self.path           = str(path)
+        self.callback       = callback
+        self.poll_interval  = poll_interval
+        self.coalesce       = coalesce
+        self._entries: dict[str, tuple[bool, float, float, int]] = {}  # name -> (is_dir, ctime, mtime, size)
+
+    async def run(self):
+        # will throw when path doesn't exist or is not a directory, or when it is removed
+        watch = open_dir_watch(self.path)
         try:
-            stat, is_dir = await asyncio.gather(e.stat(), e.is_dir())
-            item = structs.DirEntry(e.name, is_dir, pathlib.Path(e),
-                                    stat.st_ctime, stat.st_mtime, stat.st_size,
-                                    mimetypes.guess_type(e)[0])
-        except:
-            pass
+            self._entries = await asyncio.to_thread(_stat_dir, self.path)
+            while True:
+                if watch is None:
+                    await asyncio.sleep(self.poll_interval)
+                    names = None
+                else:
+                    await watch.wait()
+                    await asyncio.sleep(self.coalesce)
+                    names = watch.read_changes()
+                    if names is not None and not names:
+                        continue
+                changes = await asyncio.to_thread(self._update, names)
+                if changes is not None:
+                    await self.callback(*changes)
+        finally:
+            if watch is not None:
+                watch.close()
+
+    def _update(self, names: set[str]|None) -> tuple[structs.DirListing, list[str], structs.DirListing]|None:
+        # check given entries, or whole directory if names is None
+        if names is None:
+            new = _stat_dir(self.path)
+            names = self._entries.keys() | new.keys()
         else:
-            out.append(item)
+            new = _stat_names(self.path, names)
+        added   = structs.DirListing(self.path)
+        changed = structs.DirListing(self.path)
+        removed = []
+        for n in names:
+            old_info, new_info = self._entries.get(n), new.get(n)
+            if old_info==new_info:
+                continue
+            if new_info is None:
+                removed.append(n)
+                del self._entries[n]
+                continue
+            (added if old_info is None else changed).append(n, *new_info, _guess_mime_type_name(n))
+            self._entries[n] = new_info
+        if not added and not removed and not changed:
+            return None
+        return added, removed, changed
 
+def _stat_dir(path: str) -> dict[str, tuple[bool, float, float, int]]:
+    # will throw when path doesn't exist or is not a directory
+    out = {}
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                is_dir = e.is_dir()
+                stat = e.stat()
+            except OSError:
+                continue
+            out[e.name] = (is_dir, stat.st_ctime, stat.st_mtime, stat.st_size)
     return out
 
-def get_dir_list_sync(path: pathlib.Path) -> list[structs.DirEntry]:
-    # will throw when path doesn't exist or is not a directory
-    path = pathlib.Path(path)
-    out = []
-    for e in path.iterdir():
+def _stat_names(path: str, names: set[str]) -> dict[str, tuple[bool, float, float, int]]:
+    # entries that no longer exist are not included in the output
+    out = {}
+    for n in names:
         try:
-            stat = e.stat()
-            item = structs.DirEntry(e.name, e.is_dir(), pathlib.Path(e),
-                                    stat.st_ctime, stat.st_mtime, stat.st_size,
-                                    mimetypes.guess_type(e)[0])
-        except:
-            pass
-        else:
-            out.append(item)
-
+            stat = os.stat(os.path.join(path, n))
+        except OSError:
+            continue
+        out[n] = (stat_module.S_ISDIR(stat.st_mode), stat.st_ctime, stat.st_mtime, stat.st_size)
     return out
 
+async def search(root: str | pathlib.Path, pattern: str = '*', is_regex: bool = False,
+                 min_size: int = None, max_size: int = None, min_mtime: float = None, max_mtime: float = None,
+                 max_depth: int = None, include_dirs: bool = False,
+                 batch_size: int = 1000, batch_interval: float = .5) -> AsyncIterator[structs.DirListing]:
+    # find files (and directories if include_dirs) below root whose name matches pattern
+    # (a glob, or a regular expression that is searched for in the name if is_regex) and
+    # whose size (bytes) and modification time (POSIX timestamp) are in the given ranges.
+    # max_depth: 0 to only search root itself, 1 to also search its subdirectories, etc.
+    # Results are yielded in batches as they are found, each a DirListing of root whose
+    # names are paths relative to root. A batch is yielded when it has batch_size entries,
+    # or when batch_interval seconds passed since the previous one.
+    # The directory tree is walked in a worker thread, stopped when iteration is stopped
+    # NB: will throw when root doesn't exist or is not a directory
+    root = str(root)
+    if is_regex:
+        match = re.compile(pattern).search
+    else:
+        # NB: like the file system, case insensitive on Windows
+        match = re.compile(fnmatch.translate(pattern), re.IGNORECASE if sys.platform.startswith('win') else 0).match
+    def keep(stat: os.stat_result):
+        return (min_size  is None or stat.st_size >=min_size)  and (max_size  is None or stat.st_size <=max_size) and \
+               (min_mtime is None or stat.st_mtime>=min_mtime) and (max_mtime is None or stat.st_mtime<=max_mtime)
+
+    loop = asyncio.get_running_loop()
+    batches: asyncio.Queue[structs.DirListing|Exception|None] = asyncio.Queue()
+    stop = threading.Event()
+    batch, last_sent = structs.DirListing(root), time.monotonic()
+    def send(item: structs.DirListing|Exception|None):
+        nonlocal batch, last_sent
+        loop.call_soon_threadsafe(batches.put_nowait, item)
+        batch, last_sent = structs.DirListing(root), time.monotonic()
+    def walk():
+        todo = [('', 0)]    # directories to search: (path relative to root, depth)
+        try:
+            while todo and not stop.is_set():
+                rel_dir, depth = todo.pop()
+                try:
+                    it = os.scandir(os.path.join(root, rel_dir))
+                except OSError:
+                    if not rel_dir:
+                        raise
+                    continue    # e.g. no permission
+                with it:
+                    for e in it:
+                        try:
+                            is_dir = e.is_dir()
+                            # NB: don't recurse into symlinked directories, could loop
+                            if is_dir and (max_depth is None or depth<max_depth) and not e.is_symlink():
+                                todo.append((os.path.join(rel_dir, e.name), depth+1))
+                            if (is_dir and not include_dirs) or not match(e.name):
+                                continue
+                            stat = e.stat()
+                        except OSError:
+                            continue
+                        if keep(stat):
+                            batch.append(os.path.join(rel_dir, e.name), is_dir, stat.st_ctime, stat.st_mtime, stat.st_size, _guess_mime_type_name(e.name))
+                            if len(batch)>=batch_size:
+                                send(batch)
+                if batch and time.monotonic()-last_sent>=batch_interval:
+                    send(batch)
+            if batch:
+                send(batch)
+            send(None)
+        except Exception as exc:
+            send(exc)
+
+    loop.run_in_executor(None, walk)
+    try:
+        while (item := await batches.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # stop the walk, if still running
+        stop.set()
+
 async def make_dir(path: str | pathlib.Path, exist_ok: bool = False):
     pathvalidate.validate_filepath(path, "auto")
     path = aiopath.AsyncPath(path)
@@ -468,22 +327,261 @@ async def rename_path(old_path: str | pathlib.Path, new_path: str | pathlib.Path
     pathvalidate.validate_filepath(new_path, "auto")
     return await aiopath.AsyncPath(old_path).rename(new_path)
 
-async def copy_path(source_path: str | pathlib.Path, dest_path: str | pathlib.Path, dirs_exist_ok: bool = False):
+async def copy_path(source_path: str | pathlib.Path, dest_path: str | pathlib.Path, dirs_exist_ok: bool = False,
+                    progress: Callable[[int, int, int, int, float], None] = None, progress_interval: float = .5,
+                    max_workers: int = None):
+    # copy a file or a directory tree, including metadata. A file copied to an existing
+    # directory is copied into it. progress(files_done, files_total, bytes_done, bytes_total,
+    # bytes_per_s) is called every progress_interval seconds while copying, and once at the end.
+    # The files of a directory tree are copied max_workers at a time.
+    # When cancelled, the partially copied files are removed, files already copied are kept
     pathvalidate.validate_filepath(source_path, "auto")
     pathvalidate.validate_filepath(dest_path, "auto")
-    source_path = aiopath.AsyncPath(source_path)
-    dest_path   = aiopath.AsyncPath(dest_path)
-    if await source_path.is_dir():
-        return await aioshutil.copytree(source_path, dest_path, dirs_exist_ok=dirs_exist_ok)
-    else:
-        return await aioshutil.copy2(source_path, dest_path)
-
-async def move_path(source_path: str | pathlib.Path, dest_path: str | pathlib.Path):
+    return await _CopyJob(progress, progress_interval).run(_copy_path_sync, str(source_path), str(dest_path), dirs_exist_ok, max_workers)
+
+async def move_path(source_path: str | pathlib.Path, dest_path: str | pathlib.Path,
+                    progress: Callable[[int, int, int, int, float], None] = None, progress_interval: float = .5,
+                    max_workers: int = None):
+    # move a file or directory tree. Something moved to an existing directory is moved into it.
+    # Moves within a drive are a rename, else source is copied (with progress and max_workers,
+    # see copy_path()) and then deleted
     pathvalidate.validate_filepath(source_path, "auto")
     pathvalidate.validate_filepath(dest_path, "auto")
-    source_path = aiopath.AsyncPath(source_path)
-    dest_path   = aiopath.AsyncPath(dest_path)
-    return await aioshutil.move(source_path, dest_path)
+    return await _CopyJob(progress, progress_interval).run(_move_path_sync, str(source_path), str(dest_path), max_workers)
+
+class CopyCancelled(Exception):
+    pass
+
+class _CopyJob:
+    # runs a copy or move in a worker thread, keeps track of its progress and reports it,
+    # and stops it when the copy is cancelled
+    def __init__(self, progress: Callable[[int, int, int, int, float], None]|None, interval: float):
+        self.progress   = progress
+        self.interval   = interval
+        self.stop       = threading.Event()
+        self.files_total= self.bytes_total= 0
+        self.files_done = self.bytes_done = 0
+
+        self._lock      = threading.Lock()
+        self._loop      : asyncio.AbstractEventLoop = None
+        self._start     = time.monotonic()
+        self._last      = (self._start, 0)  # time and bytes_done of last progress report
+
+    async def run(self, fun: Callable, *args):
+        self._loop = asyncio.get_running_loop()
+        fut = self._loop.run_in_executor(None, fun, self, *args)
+        try:
+            result = await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            # stop copying, and wait until the partially copied file has been removed
+            self.stop.set()
+            with contextlib.suppress(Exception):
+                await fut
+            raise
+        self.report(final=True)
+        return result
+
+    def add_total(self, files: int = 0, bytes: int = 0):
+        with self._lock:
+            self.files_total += files
+            self.bytes_total += bytes
+
+    def add_done(self, files: int = 0, bytes: int = 0):
+        # NB: raises CopyCancelled if the copy should stop
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += bytes
+        if self.stop.is_set():
+            raise CopyCancelled
+        self.report()
+
+    def report(self, final: bool = False):
+        if not self.progress:
+            return
+        now = time.monotonic()
+        with self._lock:
+            last_time, last_bytes = self._last
+            if not final and now-last_time<self.interval:
+                return
+            # transfer rate since last report, or overall for the final report
+            if final:
+                last_time, last_bytes = self._start, 0
+            rate = (self.bytes_done-last_bytes)/(now-last_time) if now>last_time else 0.
+            self._last = (now, self.bytes_done)
+            progress = (self.files_done, self.files_total, self.bytes_done, self.bytes_total, rate)
+        if final:
+            # NB: called from the event loop
+            self.progress(*progress)
+        else:
+            self._loop.call_soon_threadsafe(self.progress, *progress)
+
+# copy file data in chunks, so that progress can be reported and copying can be stopped
+# mid-file. Where possible, the kernel copies the data without it passing through Python:
+# copy_file_range (Linux, can also do server-side copies on network file systems) or
+# sendfile (Linux). If neither works for a file, large reads and writes are used
+_copy_chunk_size    = 8*1024*1024
+_copy_buffer_size   = 1024*1024
+_copy_temp_suffix   = '.labManager_copy.tmp'
+default_copy_workers= 4                 # number of files of a directory tree copied at the same time
+_kernel_copy_functions: list[Callable[[int, int], int]] = []
+if hasattr(os, 'copy_file_range'):
+    _kernel_copy_functions.append(lambda infd, outfd: os.copy_file_range(infd, outfd, _copy_chunk_size))
+if sys.platform.startswith('linux'):
+    _kernel_copy_functions.append(lambda infd, outfd: os.sendfile(outfd, infd, None, _copy_chunk_size))
+# errors indicating that the copy function is not supported for these files
+_kernel_copy_unsupported = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ETXTBSY}
+
+def _copy_file_data(job: _CopyJob, fsrc, fdst):
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for kernel_copy in _kernel_copy_functions:
+        copied = False
+        try:
+            while (n := kernel_copy(infd, outfd)):
+                copied = True
+                job.add_done(bytes=n)
+            return
+        except OSError as exc:
+            if copied or exc.errno not in _kernel_copy_unsupported:
+                raise
+    buf = bytearray(_copy_buffer_size)
+    view = memoryview(buf)
+    while (n := fsrc.readinto(buf)):
+        fdst.write(view[:n])
+        job.add_done(bytes=n)
+
+def _copy_file(job: _CopyJob, src: str, dst: str) -> str:
+    # copy contents and metadata of a file. Copies to a temporary file that then replaces
+    # dst, so that dst is never left half-written. If copying fails or is stopped, the
+    # partially copied file is removed
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f'{src!r} and {dst!r} are the same file')
+    temp = dst+_copy_temp_suffix
+    with open(src, 'rb') as fsrc:
+        try:
+            with open(temp, 'wb') as fdst:
+                _copy_file_data(job, fsrc, fdst)
+            shutil.copystat(src, temp)
+            os.replace(temp, dst)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(temp)
+            raise
+    job.add_done(files=1)
+    return dst
+
+def _walk_tree(job: _CopyJob, root: str, symlinks: bool) -> tuple[list[str], list[tuple[str, int]], list[str], list[tuple[str, str, str]]]:
+    # single walk over the tree to be copied. Returns the directories (parents before their
+    # children), the files with their size and the symlinks to recreate (only if symlinks
+    # is True, else symlinks are followed, like shutil.copytree() does), all as paths
+    # relative to root, and the errors encountered
+    dirs, files, links, errors = [], [], [], []
+    todo = ['']
+    while todo:
+        if job.stop.is_set():
+            raise CopyCancelled
+        rel_dir = todo.pop()
+        src_dir = os.path.join(root, rel_dir)
+        try:
+            it = os.scandir(src_dir)
+        except OSError as exc:
+            if not rel_dir:
+                raise
+            errors.append((src_dir, rel_dir, str(exc)))
+            continue
+        with it:
+            for e in it:
+                rel_path = os.path.join(rel_dir, e.name)
+                try:
+                    if symlinks and e.is_symlink():
+                        links.append(rel_path)
+                    elif e.is_dir():
+                        dirs.append(rel_path)
+                        todo.append(rel_path)
+                    else:
+                        files.append((rel_path, e.stat().st_size))
+                except OSError as exc:
+                    errors.append((e.path, rel_path, str(exc)))
+    return dirs, files, links, errors
+
+def _copy_tree_sync(job: _CopyJob, source_path: str, dest_path: str, dirs_exist_ok: bool, symlinks: bool, max_workers: int|None) -> str:
+    # like shutil.copytree(), but the files are copied by a pool of threads. Copying many
+    # small files is mostly waiting for the file system (especially on network shares),
+    # which is hidden by having several copies in flight. Files are copied largest first,
+    # so that we're not left waiting for a single large file at the end
+    if os.path.exists(dest_path) and os.path.samefile(source_path, dest_path):
+        raise shutil.SameFileError(f'{source_path!r} and {dest_path!r} are the same directory')
+    dirs, files, links, errors = _walk_tree(job, source_path, symlinks)
+    job.add_total(files=len(files), bytes=sum(f[1] for f in files))
+
+    # create directory skeleton
+    os.makedirs(dest_path, exist_ok=dirs_exist_ok)
+    for d in dirs:
+        os.makedirs(os.path.join(dest_path, d), exist_ok=dirs_exist_ok)
+    for l in links:
+        src, dst = os.path.join(source_path, l), os.path.join(dest_path, l)
+        try:
+            os.symlink(os.readlink(src), dst, target_is_directory=os.path.isdir(src))
+            shutil.copystat(src, dst, follow_symlinks=False)
+        except OSError as exc:
+            errors.append((src, dst, str(exc)))
+
+    # copy files
+    files.sort(key=lambda f: f[1], reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers or default_copy_workers) as executor:
+        futs = {executor.submit(_copy_file, job, os.path.join(source_path, f), os.path.join(dest_path, f)):f for f,_ in files}
+        try:
+            for fut in concurrent.futures.as_completed(futs):
+                try:
+                    fut.result()
+                except OSError as exc:
+                    errors.append((os.path.join(source_path, futs[fut]), os.path.join(dest_path, futs[fut]), str(exc)))
+        except CopyCancelled:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+    # directory metadata last, as copying the files into them changes their modification time.
+    # NB: children before their parents
+    for d in reversed(['']+dirs):
+        src, dst = os.path.join(source_path, d), os.path.join(dest_path, d)
+        try:
+            shutil.copystat(src, dst)
+        except OSError as exc:
+            errors.append((src, dst, str(exc)))
+    if errors:
+        raise shutil.Error(errors)
+    return dest_path
+
+def _copy_path_sync(job: _CopyJob, source_path: str, dest_path: str, dirs_exist_ok: bool, max_workers: int|None) -> str:
+    if os.path.isdir(source_path):
+        return _copy_tree_sync(job, source_path, dest_path, dirs_exist_ok, False, max_workers)
+    if os.path.isdir(dest_path):
+        dest_path = os.path.join(dest_path, os.path.basename(source_path))
+    job.add_total(files=1, bytes=os.stat(source_path).st_size)
+    return _copy_file(job, source_path, dest_path)
+
+def _move_path_sync(job: _CopyJob, source_path: str, dest_path: str, max_workers: int|None) -> str:
+    # NB: same semantics as shutil.move()
+    if os.path.isdir(dest_path):
+        dest_path = os.path.join(dest_path, os.path.basename(source_path.rstrip('\\/')))
+        if os.path.exists(dest_path):
+            raise shutil.Error(f"Destination path '{dest_path}' already exists")
+    try:
+        os.rename(source_path, dest_path)
+        return dest_path
+    except OSError:
+        pass    # e.g. different drive, copy and then delete source instead
+    if os.path.islink(source_path):
+        return shutil.move(source_path, dest_path)
+    if os.path.isdir(source_path):
+        if os.path.commonpath([os.path.abspath(source_path), os.path.abspath(dest_path)])==os.path.abspath(source_path):
+            raise shutil.Error(f"Cannot move a directory '{source_path}' into itself '{dest_path}'")
+        _copy_tree_sync(job, source_path, dest_path, False, True, max_workers)
+        shutil.rmtree(source_path)
+    else:
+        job.add_total(files=1, bytes=os.stat(source_path).st_size)
+        _copy_file(job, source_path, dest_path)
+        os.unlink(source_path)
+    return dest_path
 
 async def delete_path(path: str | pathlib.Path):
     pathvalidate.validate_filepath(path, "auto")
@@ -509,88 +607,3 @@ def get_net_computer(path: str|pathlib.Path):
     if len(net_comp)==1:    # a single name entry, so thats just a computer
         return net_comp[0]
     return None
-
-
-# some functions that could be useful for debug
-
-def _print_share_info_1(share: SHARE_INFO_1):
-    # for debug
-    print(f"\tName:     {share.netname}")
-    print(f"\tType:     {share.type}, ", end='')
-    if (share.type & STYPE_DISKTREE) == STYPE_DISKTREE:
-        print('disk tree ', end='')
-    elif (share.type & STYPE_PRINTQ) == STYPE_PRINTQ:
-        print('print queue ', end='')
-    elif (share.type & STYPE_DEVICE) == STYPE_DEVICE:
-        print('device ', end='')
-    elif (share.type & STYPE_IPC) == STYPE_IPC:
-        print('ipc ', end='')
-    if (share.type & STYPE_TEMPORARY) == STYPE_TEMPORARY:
-        print("(temporary)")
-    elif (share.type & STYPE_SPECIAL) == STYPE_SPECIAL:
-        print("(special)")
-    else:
-        print('')
-    print(f"\tComment:  {share.remark}\n")
-
-def _print_netresource(i: str, lpnr: NETRESOURCE):
-    print(f"NETRESOURCE[{i}] Scope: ", end='')
-    if lpnr.scope==RESOURCE_CONNECTED:
-        print("connected")
-    elif lpnr.scope==RESOURCE_GLOBALNET:
-        print("all resources")
-    elif lpnr.scope==RESOURCE_REMEMBERED:
-        print("remembered")
-    else:
-        print(f"unknown scope {lpnr.scope}")
-
-    print(f"NETRESOURCE[{i}] Type: ", end='')
-    if lpnr.type==RESOURCETYPE_ANY:
-        print("any")
-    elif lpnr.type==RESOURCETYPE_DISK:
-        print("disk")
-    elif lpnr.type==RESOURCETYPE_PRINT:
-        print("print")
-    else:
-        print(f"unknown type {lpnr.type}")
-
-    print(f"NETRESOURCE[{i}] DisplayType: ", end='')
-    if lpnr.display_type==RESOURCEDISPLAYTYPE_GENERIC:
-        print("generic")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_DOMAIN:
-        print("domain")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_SERVER:
-        print("server")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_SHARE:
-        print("share")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_FILE:
-        print("file")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_GROUP:
-        print("group")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_NETWORK:
-        print("network")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_ROOT:
-        print("root")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_SHAREADMIN:
-        print("shareadmin")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_DIRECTORY:
-        print("directory")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_TREE:
-        print("tree")
-    elif lpnr.display_type==RESOURCEDISPLAYTYPE_NDSCONTAINER:
-        print("NDS container")
-    else:
-        print(f"unknown display type {lpnr.display_type}")
-
-    print(f"NETRESOURCE[{i}] Usage: 0x{lpnr.usage:x} = ", end='')
-    if (lpnr.usage & RESOURCEUSAGE_CONNECTABLE) == RESOURCEUSAGE_CONNECTABLE:
-        print("connectable ", end='')
-    if (lpnr.usage & RESOURCEUSAGE_CONTAINER) == RESOURCEUSAGE_CONTAINER:
-        print("container ", end='')
-    print("")
-
-    print(f"NETRESOURCE[{i}] Localname: {lpnr.local_name}")
-    print(f"NETRESOURCE[{i}] Remotename: {lpnr.remote_name}")
-    print(f"NETRESOURCE[{i}] Comment: {lpnr.comment}")
-    print(f"NETRESOURCE[{i}] Provider: {lpnr.provider}")
-    print("")
\ No newline at end of file
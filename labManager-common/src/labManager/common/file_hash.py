@@ -0,0 +1,166 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import threading
+import time
+from typing import Callable
+
+from . import structs
+
+# hashing of files and directory trees. Files are hashed in parallel on a thread pool
+# (hashlib releases the GIL while hashing). Small files are read in one go, large files
+# are mapped into memory so that they don't need to be copied into Python buffers.
+# A HashCache can be used so that files that did not change since they were last
+# hashed (same path, size and modification time) are not read again
+
+mmap_threshold      = 4*1024*1024   # bytes, files this size or larger are mapped instead of read
+read_chunk_size     = 1024*1024     # bytes, read size for large files that cannot be mapped
+default_max_workers = min(8, os.cpu_count() or 1)
+default_max_entries = 200_000
+
+class HashCache:
+    def __init__(self, max_entries: int = None):
+        self.max_entries= max_entries or default_max_entries
+
+        self._entries   : dict[tuple[str, str, int, float], str] = {}   # (algorithm, path, size, mtime) -> digest, least recently used first
+        self._lock      = threading.Lock()
+
+    def get(self, algorithm: str, path: str, size: int, mtime: float) -> str|None:
+        key = (algorithm, path, size, mtime)
+        with self._lock:
+            if (digest := self._entries.pop(key, None)) is not None:
+                # mark as most recently used
+                self._entries[key] = digest
+            return digest
+
+    def put(self, algorithm: str, path: str, size: int, mtime: float, digest: str):
+        with self._lock:
+            self._entries[(algorithm, path, size, mtime)] = digest
+            while len(self._entries)>self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+def hash_file(path: str, algorithm: str = 'sha256', size: int = None) -> str:
+    h = hashlib.new(algorithm)
+    if size is None:
+        size = os.stat(path).st_size
+    with open(path, 'rb', buffering=0) as f:
+        if size<mmap_threshold:
+            h.update(f.read())
+        else:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    h.update(m)
+            except (OSError, ValueError):
+                # e.g. file on a file system that does not support mapping
+                f.seek(0)
+                buf = bytearray(read_chunk_size)
+                view = memoryview(buf)
+                while (n := f.readinto(buf)):
+                    h.update(view[:n])
+    return h.hexdigest()
+
+def _list_files(root: str) -> list[tuple[str, str, int, float]]:
+    # (path relative to root, full path, size, mtime) of all files below root,
+    # or of root itself if it is a file
+    # NB: will throw when root doesn't exist
+    if not os.path.isdir(root):
+        stat = os.stat(root)
+        return [(os.path.basename(root), root, stat.st_size, stat.st_mtime)]
+    files = []
+    todo = ['']
+    while todo:
+        rel_dir = todo.pop()
+        try:
+            it = os.scandir(os.path.join(root, rel_dir))
+        except OSError:
+            if not rel_dir:
+                raise
+            continue    # e.g. no permission
+        with it:
+            for e in it:
+                rel_path = f'{rel_dir}/{e.name}' if rel_dir else e.name
+                try:
+                    if e.is_dir():
+                        # NB: don't recurse into symlinked directories, could loop
+                        if not e.is_symlink():
+                            todo.append(rel_path)
+                        continue
+                    stat = e.stat()
+                except OSError:
+                    continue
+                files.append((rel_path, e.path, stat.st_size, stat.st_mtime))
+    return files
+
+async def hash_path(path: str, algorithm: str = 'sha256', cache: HashCache = None,
+                    progress: Callable[[int, int, int, int], None] = None, progress_interval: float = .5,
+                    max_workers: int = None) -> structs.HashManifest:
+    # hash a file, or all files in a directory tree. Files that cannot be read are
+    # listed in the errors of the returned manifest.
+    # progress(files_done, files_total, bytes_done, bytes_total) is called every
+    # progress_interval seconds while hashing, and once at the end.
+    # NB: will throw when path doesn't exist or algorithm is not known
+    path = str(path)
+    hashlib.new(algorithm)  # check algorithm is known before doing any work
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+
+    def run() -> structs.HashManifest:
+        files = _list_files(path)
+        total_files, total_bytes = len(files), sum(f[2] for f in files)
+        done_files = done_bytes = 0
+        last_report = time.monotonic()
+        digests: list[str|Exception] = [None]*total_files
+
+        def do_one(i: int):
+            if stop.is_set():
+                return
+            _, full_path, size, mtime = files[i]
+            try:
+                digest = hash_file(full_path, algorithm, size)
+            except OSError as exc:
+                digests[i] = exc
+                return
+            digests[i] = digest
+            if cache is not None:
+                cache.put(algorithm, full_path, size, mtime, digest)
+
+        # files already in the cache don't need hashing
+        todo = []
+        for i,(_, full_path, size, mtime) in enumerate(files):
+            if cache is not None and (digest := cache.get(algorithm, full_path, size, mtime)) is not None:
+                digests[i] = digest
+                done_files += 1
+                done_bytes += size
+            else:
+                todo.append(i)
+        # NB: largest files first, so that we're not left waiting for a single large file at the end
+        todo.sort(key=lambda i: files[i][2], reverse=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers or default_max_workers) as executor:
+            futs = {executor.submit(do_one, i):i for i in todo}
+            for fut in concurrent.futures.as_completed(futs):
+                if stop.is_set():
+                    executor.shutdown(cancel_futures=True)
+                    break
+                done_files += 1
+                done_bytes += files[futs[fut]][2]
+                if progress and time.monotonic()-last_report>=progress_interval:
+                    loop.call_soon_threadsafe(progress, done_files, total_files, done_bytes, total_bytes)
+                    last_report = time.monotonic()
+        if progress and not stop.is_set():
+            loop.call_soon_threadsafe(progress, done_files, total_files, done_bytes, total_bytes)
+
+        manifest = structs.HashManifest(path, algorithm)
+        for (rel_path, _, size, mtime), digest in zip(files, digests):
+            if isinstance(digest, Exception):
+                manifest.errors[rel_path] = str(digest)
+            elif digest is not None:
+                manifest.append(rel_path, size, mtime, digest)
+        return manifest
+
+    try:
+        return await asyncio.to_thread(run)
+    finally:
+        # stop hashing if we got cancelled
+        stop.set()
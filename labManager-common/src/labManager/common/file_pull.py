@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import pathlib
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import pathvalidate
+
+from . import message, structs
+from .network import comms
+
+# Pulling files from clients to the master over the master-client connection. A client
+# sends a file in chunks (binary FILE_PULL_DATA messages), compressed on the fly unless
+# the file turns out not to compress, followed by a FILE_PULL_END message with the size,
+# modification time and digest of the whole file. The master writes the chunks to a
+# partial file next to the destination and only renames it once the digest of what it
+# received matches. Partial files are kept when a transfer gets interrupted, the next
+# pull of the same file continues where it left off.
+# A Collection pulls a set of files from a set of clients, with a bounded number of
+# transfers per client and in total, into a folder per client.
+
+chunk_size          = 1024*1024 # bytes, uncompressed
+compress_level      = 1         # fast, aim is to not let compression limit throughput
+min_compression     = .9        # if the first chunk of a file doesn't compress to less than this fraction, the rest isn't compressed
+digest_algorithm    = 'sha256'
+mtime_tolerance     = 2.        # s, files already at the destination with the same size and modification time are not pulled again
+part_suffix         = '.part'
+
+# header of binary FILE_PULL_DATA messages (transfer id, offset in the file, whether data is compressed)
+_chunk_header = struct.Struct('!QQ?')
+
+def pack_chunk(transfer_id: int, offset: int, compressed: bool, data: bytes) -> bytes:
+    return _chunk_header.pack(transfer_id, offset, compressed)+data
+
+def unpack_chunk(msg: bytes) -> tuple[int, int, bool, bytes]:
+    transfer_id, offset, compressed = _chunk_header.unpack_from(msg)
+    return transfer_id, offset, compressed, msg[_chunk_header.size:]
+
+
+class ChecksumError(Exception):
+    pass
+
+async def send_file(writer: asyncio.streams.StreamWriter, transfer_id: int, path: str|pathlib.Path, offset: int = 0, compress: bool = True) -> dict[str, Any]:
+    # client side: send file from offset onward. Returns size, modification time and digest
+    # of the whole file, to be sent to the master in FILE_PULL_END
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if offset>stat.st_size:
+            raise ValueError(f'Cannot continue transfer at {offset} bytes, file is only {stat.st_size} bytes')
+        h = hashlib.new(digest_algorithm)
+        compressor = zlib.compressobj(compress_level) if compress else None
+
+        def read_prefix():
+            # digest is of whole file, so also hash what was already sent
+            left = offset
+            while left and (data := f.read(min(left, chunk_size))):
+                h.update(data)
+                left -= len(data)
+        def read_chunk() -> tuple[bytes, bool, int]:
+            nonlocal compressor
+            data = f.read(chunk_size)
+            h.update(data)
+            if not data or not compressor:
+                return data, False, len(data)
+            packed = compressor.compress(data)+compressor.flush(zlib.Z_SYNC_FLUSH)
+            if len(packed)>=len(data)*min_compression:
+                # doesn't compress (e.g. video or already compressed data), don't spend time on trying
+                compressor = None
+                return data, False, len(data)
+            return packed, True, len(data)
+
+        loop = asyncio.get_running_loop()
+        if offset:
+            await loop.run_in_executor(None, read_prefix)
+        # NB: read the next chunk while the current one is being sent
+        read = loop.run_in_executor(None, read_chunk)
+        try:
+            while True:
+                data, compressed, length = await read
+                if not length:
+                    break
+                read = loop.run_in_executor(None, read_chunk)
+                await comms.typed_send(writer, message.Message.FILE_PULL_DATA, pack_chunk(transfer_id, offset, compressed, data))
+                offset += length
+        finally:
+            # don't close the file while it is still being read
+            await asyncio.wait([read])
+
+        if offset!=stat.st_size or os.fstat(f.fileno()).st_mtime!=stat.st_mtime:
+            raise RuntimeError('File changed while it was being sent')
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'digest': h.hexdigest()}
+
+
+class Receiver:
+    # master side: writes the chunks of a file into the partial file, continuing
+    # at offset. NB: methods do file I/O, call them off the event loop
+    def __init__(self, part_path: str|pathlib.Path, offset: int = 0):
+        self.part_path  = pathlib.Path(part_path)
+        self.offset     = offset
+        self.written    = 0         # bytes received in this transfer (uncompressed)
+        self.error      : Exception = None
+
+        self._file      = None
+        self._hash      = hashlib.new(digest_algorithm)
+        self._decompressor = zlib.decompressobj()
+
+    def open(self):
+        self.part_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.part_path, 'r+b' if self.offset else 'wb')
+        # digest is of whole file, so also hash what we already have
+        left = self.offset
+        while left and (data := self._file.read(min(left, chunk_size))):
+            self._hash.update(data)
+            left -= len(data)
+        if left:
+            raise ValueError(f'Partial file {self.part_path} is shorter than {self.offset} bytes')
+        self._file.seek(self.offset)
+        self._file.truncate()
+
+    def write(self, offset: int, compressed: bool, data: bytes):
+        # NB: once writing failed, further chunks are ignored, the error is reported at the end
+        if self.error:
+            return
+        try:
+            if offset!=self.offset+self.written:
+                raise ValueError(f'Expected data at offset {self.offset+self.written}, got {offset}')
+            if compressed:
+                data = self._decompressor.decompress(data)
+            self._file.write(data)
+            self._hash.update(data)
+            self.written += len(data)
+        except Exception as exc:
+            self.error = exc
+
+    def finish(self, end: dict[str, Any], dest_path: str|pathlib.Path):
+        # check transfer and move the partial file into place. end: contents of FILE_PULL_END
+        if isinstance(self.error, OSError):
+            raise self.error
+        elif self.error:
+            # data got corrupted
+            raise ChecksumError(str(self.error)) from self.error
+        self._file.close()
+        if self.offset+self.written!=end['size']:
+            raise ChecksumError(f'Received {self.offset+self.written} bytes, expected {end["size"]}')
+        if self._hash.hexdigest()!=end['digest']:
+            raise ChecksumError('Digest of received file does not match that of the file on the client')
+        os.utime(self.part_path, (end['mtime'], end['mtime']))
+        os.replace(self.part_path, dest_path)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+@dataclass
+class PulledFile:
+    client      : int
+    remote_path : str
+    rel_path    : str       # relative to search root, with / as separator
+    size        : int
+    mtime       : float
+    local_path  : pathlib.Path
+    status      : structs.Status    = structs.Status.Pending
+    error       : str       = None
+    skipped     : bool      = False # True if already present at destination
+    resumed_from: int       = 0     # bytes that were already present from an earlier, interrupted, transfer
+    attempts    : int       = 0
+    _receiver   : Receiver  = None
+
+    @property
+    def bytes_done(self) -> int:
+        if self.status==structs.Status.Finished:
+            return self.size
+        if self.status==structs.Status.Running and self._receiver:
+            return self._receiver.offset+self._receiver.written
+        return 0
+
+
+class Collection:
+    def __init__(self, files: dict[int, structs.DirListing], clients: dict[int, str], dest_folder: str|pathlib.Path,
+                 transfer: Callable[[int, str, Receiver], Awaitable[dict[str, Any]]],
+                 max_per_client: int = 2, max_total: int = 8, retries: int = 2):
+        # files: client id -> search results (names are paths relative to the listing's path).
+        # clients: client id -> name, files of each client go to a folder with the client's
+        # name in dest_folder. transfer is called to pull a single file from a client into a
+        # Receiver, and returns the contents of the FILE_PULL_END message. Transfers that fail
+        # their checksum or that could not be continued are tried again from scratch up to
+        # retries times
+        self.dest_folder    = pathlib.Path(dest_folder)
+        self.clients        = clients
+        self.max_per_client = max_per_client
+        self.max_total      = max_total
+        self.retries        = retries
+        self._transfer      = transfer
+
+        self.client_errors  : dict[int, str] = {}   # client id -> error, for clients whose files could not all be found
+        self.files          : list[PulledFile] = []
+        for c,listing in files.items():
+            client_folder = self.dest_folder/pathvalidate.sanitize_filename(clients[c], replacement_text='_')
+            root = listing.path.rstrip('\\/')
+            for i,name in enumerate(listing.names):
+                if listing.is_dirs[i]:
+                    continue
+                rel = name.replace('\\','/')
+                parts = [p for p in rel.split('/') if p]
+                if any(p=='..' for p in parts):
+                    continue
+                self.files.append(PulledFile(c, f'{root}/{name}', '/'.join(parts), listing.sizes[i], listing.mtimes[i], client_folder.joinpath(*parts)))
+
+        self._start_time    : float = None
+        self._done          : asyncio.Future = None
+        self._runner        : asyncio.Task = None
+
+    def start(self):
+        self._start_time = asyncio.get_running_loop().time()
+        self._done = asyncio.get_running_loop().create_future()
+        self._runner = asyncio.create_task(self._run())
+
+    async def wait(self) -> list[PulledFile]:
+        # wait until all files are pulled (or failed). Returns the files
+        await asyncio.shield(self._done)
+        return self.files
+
+    def is_done(self) -> bool:
+        return self._done is not None and self._done.done()
+
+    def cancel(self):
+        # partial files are kept, so that pulling can be continued later
+        if self._runner:
+            self._runner.cancel()
+
+    def get_progress(self) -> tuple[int, int, int, int, float]:
+        # (files done, files total, bytes done, bytes total, bytes per second since start)
+        files_done = sum(f.status in [structs.Status.Finished, structs.Status.Errored] for f in self.files)
+        bytes_done = sum(f.bytes_done for f in self.files)
+        # NB: only what was transferred in this run counts for the rate
+        transferred= sum(f._receiver.written for f in self.files if f._receiver)
+        elapsed = asyncio.get_running_loop().time()-self._start_time if self._start_time else 0.
+        return files_done, len(self.files), bytes_done, sum(f.size for f in self.files), transferred/elapsed if elapsed>0 else 0.
+
+    async def _run(self):
+        total = asyncio.Semaphore(self.max_total)
+        per_client = {c: asyncio.Semaphore(self.max_per_client) for c in self.clients}
+        pulls = [asyncio.create_task(self._pull(f, per_client[f.client], total)) for f in self.files]
+        try:
+            await asyncio.gather(*pulls)
+        finally:
+            for p in pulls:
+                p.cancel()
+            await asyncio.gather(*pulls, return_exceptions=True)
+            for f in self.files:
+                if f.status in [structs.Status.Pending, structs.Status.Running]:
+                    f.status = structs.Status.Errored
+                    f.error = 'Cancelled'
+            self._done.set_result(self.files)
+
+    async def _pull(self, f: PulledFile, per_client: asyncio.Semaphore, total: asyncio.Semaphore):
+        async with per_client, total:
+            f.status = structs.Status.Running
+            try:
+                f.skipped = await asyncio.to_thread(self._is_present, f)
+                while not f.skipped:
+                    f.attempts += 1
+                    offset = await asyncio.to_thread(self._get_offset, f)
+                    if f.attempts==1:
+                        f.resumed_from = offset
+                    f._receiver = Receiver(f.local_path.with_name(f.local_path.name+part_suffix), offset)
+                    try:
+                        await asyncio.to_thread(f._receiver.open)
+                        end = await self._transfer(f.client, f.remote_path, f._receiver)
+                        if 'error' in end:
+                            # NB: if we continued an earlier transfer, the file may have changed since. Try again from scratch
+                            if not offset:
+                                raise RuntimeError(end['error'])
+                            raise ChecksumError(end['error'])
+                        await asyncio.to_thread(f._receiver.finish, end, f.local_path)
+                    except ChecksumError:
+                        if f.attempts>self.retries:
+                            raise
+                        retry = True
+                    else:
+                        retry = False
+                    finally:
+                        await asyncio.to_thread(f._receiver.close)
+                    if not retry:
+                        break
+                    await asyncio.to_thread(self._remove_part, f)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                f.status = structs.Status.Errored
+                f.error = str(exc) or type(exc).__name__
+            else:
+                f.status = structs.Status.Finished
+
+    @staticmethod
+    def _is_present(f: PulledFile) -> bool:
+        # files that are already at the destination are not pulled again
+        try:
+            stat = os.stat(f.local_path)
+        except OSError:
+            return False
+        return stat.st_size==f.size and abs(stat.st_mtime-f.mtime)<=mtime_tolerance
+
+    @staticmethod
+    def _get_offset(f: PulledFile) -> int:
+        # continue an earlier transfer, if there is a partial file
+        part = f.local_path.with_name(f.local_path.name+part_suffix)
+        try:
+            size = os.stat(part).st_size
+        except OSError:
+            return 0
+        return size if size<=f.size else 0
+
+    @staticmethod
+    def _remove_part(f: PulledFile):
+        try:
+            os.unlink(f.local_path.with_name(f.local_path.name+part_suffix))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,232 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+from typing import Callable
+
+from . import file_actions, file_hash, structs
+
+# one-way sync of a directory tree to a destination (typically a folder on a network
+# share): only files that are not in the destination or that differ from it are copied.
+# Files are compared by size and modification time, or optionally by content hash.
+# The state of the destination after a sync is stored in a local manifest, so that
+# the next sync only needs to list the local source and not the (slow) destination.
+# NB: the manifest can only know about changes made by syncs. If the destination may
+# have been changed otherwise, sync without using the manifest
+
+default_manifest_folder = pathlib.Path(tempfile.gettempdir())/'labManager'/'sync_manifests'
+mtime_tolerance         = 2.    # s, FAT file systems and some SMB servers store modification times with 2 s resolution
+
+class Manifest:
+    # state of the destination of a sync: for each file in the destination that was put
+    # there by a sync, the size, modification time and (if known) digest of the source file
+    def __init__(self, folder: str|pathlib.Path, source: str, dest: str):
+        self.source     = source
+        self.dest       = dest
+        self.algorithm  : str = None
+        self.files      : dict[str, tuple[int, float, str|None]] = {}   # path -> (size, mtime, digest)
+
+        key = hashlib.sha256(f'{source}\n{dest}'.encode('utf8')).hexdigest()[:32]
+        self.path = pathlib.Path(folder or default_manifest_folder)/f'{key}.json'
+
+    def load(self) -> bool:
+        # returns False if there is no usable manifest
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('source')!=self.source or data.get('dest')!=self.dest:
+            return False
+        self.algorithm = data['algorithm']
+        self.files = {p:tuple(v) for p,v in data['files'].items()}
+        return True
+
+    def save(self):
+        # NB: write to temp file and rename, so that an interrupted write does not leave a corrupt manifest
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(self.path.name+'.tmp')
+        with open(temp, 'w', encoding='utf8') as f:
+            json.dump({'source': self.source, 'dest': self.dest, 'algorithm': self.algorithm, 'files': self.files}, f)
+        os.replace(temp, self.path)
+
+async def sync_path(source_path: str | pathlib.Path, dest_path: str | pathlib.Path,
+                    compare_hash: bool = False, algorithm: str = 'sha256', cache: file_hash.HashCache = None,
+                    delete_policy: structs.SyncDeletePolicy = structs.SyncDeletePolicy.Keep,
+                    dry_run: bool = False, use_manifest: bool = True, manifest_folder: str | pathlib.Path = None,
+                    progress: Callable[[int, int, int, int, float], None] = None, progress_interval: float = .5,
+                    max_workers: int = None) -> structs.SyncPlan:
+    # make dest contain the same files as the source directory. Files are copied (with
+    # metadata) if they are new or their size or modification time differ. With compare_hash,
+    # files of the same size are instead compared by their content hash. What is deleted from
+    # the destination is determined by delete_policy. A dry run only returns what would be
+    # done. With use_manifest, the state of the destination is taken from the manifest of the
+    # last sync, if there is one, instead of listing the destination. The returned plan
+    # lists what was done, and files that could not be compared, copied or deleted.
+    # progress: see file_actions.copy_path(), only reported while copying
+    # NB: will throw when source doesn't exist or is not a directory
+    file_actions.pathvalidate.validate_filepath(source_path, "auto")
+    file_actions.pathvalidate.validate_filepath(dest_path, "auto")
+    if compare_hash:
+        hashlib.new(algorithm)  # check algorithm is known before doing any work
+    delete_policy = structs.SyncDeletePolicy.get(delete_policy)
+    return await file_actions._CopyJob(progress, progress_interval).run(
+        _sync_path_sync, os.path.abspath(source_path), os.path.abspath(dest_path),
+        compare_hash, algorithm, cache, delete_policy, dry_run, use_manifest, manifest_folder, max_workers)
+
+def _sync_path_sync(job: file_actions._CopyJob, source_path: str, dest_path: str,
+                    compare_hash: bool, algorithm: str, cache: file_hash.HashCache|None,
+                    delete_policy: structs.SyncDeletePolicy, dry_run: bool, use_manifest: bool,
+                    manifest_folder: str|None, max_workers: int|None) -> structs.SyncPlan:
+    if not os.path.isdir(source_path):
+        raise NotADirectoryError(f"Source of a sync must be a directory: '{source_path}'")
+    plan = structs.SyncPlan(source_path, dest_path, dry_run)
+    source = {rel:(full, size, mtime) for rel, full, size, mtime in file_hash._list_files(source_path)}
+
+    # get state of destination
+    manifest = Manifest(manifest_folder, source_path, dest_path)
+    # NB: if the destination is not there (anymore), the manifest is of no use
+    have_manifest = os.path.isdir(dest_path) and manifest.load()
+    if manifest.algorithm!=algorithm:
+        # digests in manifest are of no use
+        manifest.files = {rel:(size, mtime, None) for rel,(size, mtime, _) in manifest.files.items()}
+        manifest.algorithm = algorithm
+    synced = set(manifest.files)    # files put in the destination by earlier syncs
+    if have_manifest and use_manifest and delete_policy!=structs.SyncDeletePolicy.Mirror:
+        # NB: to mirror, we need to know about all files in the destination, not only the ones we put there
+        plan.used_manifest = True
+        dest = manifest.files
+    else:
+        dest = {rel:(size, mtime, None) for rel, _, size, mtime in file_hash._list_files(dest_path)} if os.path.isdir(dest_path) else {}
+        # keep digests we know of files that did not change, so they don't need to be hashed again
+        for rel,(size, mtime, digest) in manifest.files.items():
+            if digest and rel in dest and dest[rel][0]==size and abs(dest[rel][1]-mtime)<=mtime_tolerance:
+                dest[rel] = (size, dest[rel][1], digest)
+        # rebuild manifest from what is actually in the destination
+        manifest.files = {rel:v for rel,v in dest.items() if rel in source or rel in synced}
+
+    # determine what to copy
+    to_hash: list[str] = []
+    for rel,(_, size, mtime) in source.items():
+        if rel not in dest:
+            plan.new.append(rel)
+        elif dest[rel][0]!=size:
+            plan.changed.append(rel)
+        elif compare_hash:
+            to_hash.append(rel)
+        elif abs(dest[rel][1]-mtime)>mtime_tolerance:
+            plan.changed.append(rel)
+        else:
+            plan.unchanged += 1
+    if to_hash:
+        def get_digests(rel: str) -> tuple[str, str]:
+            if job.stop.is_set():
+                raise file_actions.CopyCancelled
+            full, size, mtime = source[rel]
+            if cache is None or (src_digest := cache.get(algorithm, full, size, mtime)) is None:
+                src_digest = file_hash.hash_file(full, algorithm, size)
+                if cache is not None:
+                    cache.put(algorithm, full, size, mtime, src_digest)
+            dst_digest = dest[rel][2] or file_hash.hash_file(os.path.join(dest_path, rel), algorithm, size)
+            return src_digest, dst_digest
+        with concurrent.futures.ThreadPoolExecutor(max_workers or file_hash.default_max_workers) as executor:
+            futs = {executor.submit(get_digests, rel):rel for rel in to_hash}
+            try:
+                for fut in concurrent.futures.as_completed(futs):
+                    rel = futs[fut]
+                    try:
+                        src_digest, dst_digest = fut.result()
+                    except OSError as exc:
+                        plan.errors[rel] = str(exc)
+                        continue
+                    if src_digest!=dst_digest:
+                        plan.changed.append(rel)
+                    else:
+                        plan.unchanged += 1
+                        manifest.files[rel] = (source[rel][1], source[rel][2], src_digest)
+            except file_actions.CopyCancelled:
+                executor.shutdown(cancel_futures=True)
+                raise
+    plan.new.sort()
+    plan.changed.sort()
+    plan.copy_bytes = sum(source[rel][1] for rel in plan.new+plan.changed)
+
+    # determine what to delete
+    match delete_policy:
+        case structs.SyncDeletePolicy.Keep:
+            pass
+        case structs.SyncDeletePolicy.Synced:
+            # NB: only files we know we put there
+            plan.delete = sorted(rel for rel in synced if rel not in source and rel in dest)
+        case structs.SyncDeletePolicy.Mirror:
+            plan.delete = sorted(rel for rel in dest if rel not in source)
+
+    if dry_run:
+        return plan
+
+    # do the sync. Make sure that what we did is stored, also if we fail or are cancelled
+    try:
+        _copy_files(job, plan, source, dest_path, manifest, compare_hash, algorithm, cache, max_workers)
+        _delete_files(plan, source_path, dest_path, manifest)
+    finally:
+        manifest.save()
+    return plan
+
+def _copy_files(job: file_actions._CopyJob, plan: structs.SyncPlan, source: dict[str, tuple[str, int, float]], dest_path: str,
+                manifest: Manifest, compare_hash: bool, algorithm: str, cache: file_hash.HashCache|None, max_workers: int|None):
+    to_copy = plan.new+plan.changed
+    job.add_total(files=len(to_copy), bytes=plan.copy_bytes)
+    for d in sorted({os.path.dirname(rel) for rel in to_copy}):
+        if d:
+            os.makedirs(os.path.join(dest_path, d), exist_ok=True)
+
+    def copy_one(rel: str) -> str|None:
+        # NB: _copy_file() copies to a temporary file that then replaces the destination
+        # file, so that the destination file is never left half-written
+        full, size, mtime = source[rel]
+        file_actions._copy_file(job, full, os.path.join(dest_path, rel))
+        if not compare_hash:
+            return None
+        if cache is not None and (digest := cache.get(algorithm, full, size, mtime)) is not None:
+            return digest
+        return file_hash.hash_file(full, algorithm, size)
+
+    # NB: largest files first, so that we're not left waiting for a single large file at the end
+    to_copy.sort(key=lambda rel: source[rel][1], reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers or file_actions.default_copy_workers) as executor:
+        futs = {executor.submit(copy_one, rel):rel for rel in to_copy}
+        try:
+            for fut in concurrent.futures.as_completed(futs):
+                rel = futs[fut]
+                try:
+                    digest = fut.result()
+                except OSError as exc:
+                    plan.errors[rel] = str(exc)
+                    continue
+                manifest.files[rel] = (source[rel][1], source[rel][2], digest)
+        except file_actions.CopyCancelled:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+def _delete_files(plan: structs.SyncPlan, source_path: str, dest_path: str, manifest: Manifest):
+    dirs = set()
+    for rel in plan.delete:
+        try:
+            os.unlink(os.path.join(dest_path, rel))
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            plan.errors[rel] = str(exc)
+            continue
+        manifest.files.pop(rel, None)
+        while (rel := os.path.dirname(rel)):
+            dirs.add(rel)
+    # remove folders that are now empty and do not exist in the source.
+    # NB: children before their parents
+    for d in sorted(dirs, key=len, reverse=True):
+        if not os.path.isdir(os.path.join(source_path, d)):
+            with contextlib.suppress(OSError):
+                os.rmdir(os.path.join(dest_path, d))
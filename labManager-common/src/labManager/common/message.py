@@ -15,6 +15,7 @@ class Message(enum_helper.AutoNameDash):
 
     ## queries
     IDENTIFY            = auto()
+    CLIENT_ID           = auto()    # {client_id}, sent by master in response to IDENTIFY: id under which the master knows the client
 
     ## eye tracker
     ET_STATUS_REQUEST   = auto()
@@ -29,29 +30,51 @@ class Message(enum_helper.AutoNameDash):
 
     ## tasks
     # master -> client
-    TASK_CREATE         = auto()    # {task_id, type, payload, cwd, env} # payload is the executable and args of subprocess.Popen, cwd and env (optional) its cwd and env arguments
+    TASK_CREATE         = auto()    # {task_id, type, payload, payload_hash, cwd, env, interactive, pty, raw_output, placeholders, limits} # payload is the executable and args of subprocess.Popen, cwd and env (optional) its cwd and env arguments. For task types whose payload clients cache, only payload_hash is sent
+    TASK_GROUP_CREATE   = auto()    # {task_ids, type, payload, ...}, as TASK_CREATE but sent to all clients in a task group at once: task_ids maps client ids (see CLIENT_ID) to task ids
+    TASK_PAYLOAD        = auto()    # {task_id, payload} or {task_id, error}, payload of a task, in response to TASK_PAYLOAD_REQUEST
     TASK_INPUT          = auto()    # if you have an interactive task (e.g. shell, or some other process listening to stdin), you can send commands to it using this message type
-    TASK_CANCEL         = auto()    # cancel running or pending task
+    TASK_INPUT_RAW      = auto()    # binary: task id (see task.pack_raw_input()) followed by bytes to write to the task's stdin as is
+    TASK_RESIZE         = auto()    # {task_id, rows, cols}, change window size of an interactive task running in a pseudo-terminal
+    TASK_CANCEL         = auto()    # cancel running or pending task, running tasks are killed including any processes they started
     # client -> master
     TASK_OUTPUT         = auto()    # {task_id, stream_type, output}, task (stdout or stderr) output
-    TASK_UPDATE         = auto()    # {task_id, status, Optional[return_code]}, task status update (started running, errored, finished). Latter two include return code
+    TASK_OUTPUT_RAW     = auto()    # binary: task id and stream type (see task.pack_raw_output()) followed by output as is, for tasks with raw_output
+    TASK_UPDATE         = auto()    # {task_id, status, Optional[return_code], Optional[queue_position], Optional[limit]}, task status update (queued, started running, errored, finished). Latter two include return code, and if the task was killed because it exceeded one of its task.Limits, which
+    TASK_PAYLOAD_REQUEST= auto()    # {task_id, payload_hash}, request payload of task when it is not in the client's payload cache
+    TASK_STATS          = auto()    # {task_id, stats}, resources used by the task's process tree (see task.ResourceUsage), sent periodically while running and once at exit
+    TASK_RETURN         = auto()    # {task_id, result}, serialized return value or exception of a Python_function task, sent before its final TASK_UPDATE
+    TASK_RESULT         = auto()    # {task_id, results}, list of records the task wrote to its results file (see task.results_env_var)
 
     ## file browsing
     # master -> client
     FILE_GET_DRIVES     = auto()    # request information about known local harddrives and network names
     FILE_GET_SHARES     = auto()    # {net_name, user, password, domain, access_level} request accessible shares at a network name (user Guest without password is used if not provided)
-    FILE_GET_LISTING    = auto()    # {path} request contents of a local path
+    FILE_GET_LISTING    = auto()    # {path, [offset, limit, sort_key, descending, filter, refresh]} request contents of a local path. If a limit is given, a page of the sorted and filtered listing is sent
+    FILE_WATCH          = auto()    # {path} start watching a local directory for changes, which are sent as FILE_CHANGES
+    FILE_UNWATCH        = auto()    # {path} stop watching a local directory
+    FILE_SEARCH         = auto()    # {search_id, root, pattern, is_regex, min_size, max_size, min_mtime, max_mtime, max_depth, include_dirs} request search for files below a local path, see file_actions.search(). Results are sent as FILE_SEARCH_RESULTS
+    FILE_SEARCH_CANCEL  = auto()    # {search_id} stop a running file search
     # client -> master
-    FILE_LISTING        = auto()    # {path, dir_list}: listing of directories and files at path. path may be 'root' when listing accessible drives and net_names, or a \\net_name when listing shares for a network computer
+    FILE_LISTING        = auto()    # {path, listing}: listing of directories and files at path (a structs.DirListing when listing a directory, else a list of structs.DirEntry). path may be 'root' when listing accessible drives and net_names, or a \\net_name when listing shares for a network computer
+    FILE_CHANGES        = auto()    # {path, added, removed, changed, [error]}: changes in a watched directory (added and changed are structs.DirListing, removed a list of names). If error is set, the directory can no longer be watched
+    FILE_SEARCH_RESULTS = auto()    # {search_id, root, results, status, [error, cancelled]}: a batch of search results (a structs.DirListing of root, names are paths relative to root). Sent with status Running while searching, and once more with status Finished or Errored when done
 
     ## file actions (NB: local paths below includes network shares accessible by the client)
     # master -> client
     FILE_MAKE           = auto()    # {path, is_dir, action_id} request creation of a local path (empty file or directory)
     FILE_RENAME         = auto()    # {old_path, new_path, action_id} request renaming of a local path
-    FILE_COPY_MOVE      = auto()    # {source_path, dest_path, is_move, action_id} request a copy or move between two local paths
+    FILE_COPY_MOVE      = auto()    # {source_path, dest_path, is_move, max_workers, action_id} request a copy or move between two local paths. max_workers: number of files copied at the same time, None for the client's configured default. Status updates while copying include progress (files done, files total, bytes done, bytes total, bytes per second)
     FILE_DELETE         = auto()    # {path, action_id} request deleting a path
+    FILE_HASH           = auto()    # {path, algorithm, use_cache, action_id} request digests of a file or of all files in a directory tree. Status updates while hashing include progress (files done, files total, bytes done, bytes total), the final status a manifest (structs.HashManifest)
+    FILE_SYNC           = auto()    # {source_path, dest_path, compare_hash, delete_policy, dry_run, use_manifest, max_workers, action_id} request a one-way sync of a directory to a destination, copying only new and changed files. Status updates while copying include progress (files done, files total, bytes done, bytes total, bytes per second), the final status what was (or for a dry run, would be) done (structs.SyncPlan)
+    FILE_ACTION_CANCEL  = auto()    # {action_id} stop a running copy, move, hash or sync action. Its final status is Errored, with cancelled set
+    FILE_PULL           = auto()    # {transfer_id, path, offset, compress} request sending a file (from offset onward) to the master, see file_pull.send_file()
+    FILE_PULL_CANCEL    = auto()    # {transfer_id} stop sending a file
     # client -> master
     FILE_ACTION_STATUS  = auto()    # {path, action_id, action, status...} status update for file actions
+    FILE_PULL_DATA      = auto()    # binary: transfer id, offset and whether compressed (see file_pull.pack_chunk()) followed by a chunk of the file
+    FILE_PULL_END       = auto()    # {transfer_id, size, mtime, digest} or {transfer_id, error} file was sent completely, or sending failed
 
 
 @enum_helper.get
@@ -63,6 +86,7 @@ class Type(enum_helper.AutoNameDash):
 type_map = {
     Message.QUIT                : Type.SIMPLE,
     Message.IDENTIFY            : Type.JSON,
+    Message.CLIENT_ID           : Type.JSON,
 
     Message.ET_STATUS_REQUEST   : Type.SIMPLE,
     Message.ET_STATUS_INFORM    : Type.JSON,
@@ -74,21 +98,44 @@ type_map = {
     Message.SHARE_UNMOUNT       : Type.JSON,
 
     Message.TASK_CREATE         : Type.JSON,
+    Message.TASK_GROUP_CREATE   : Type.JSON,
+    Message.TASK_PAYLOAD        : Type.JSON,
     Message.TASK_INPUT          : Type.JSON,
+    Message.TASK_INPUT_RAW      : Type.BINARY,
+    Message.TASK_RESIZE         : Type.JSON,
     Message.TASK_CANCEL         : Type.JSON,
     Message.TASK_OUTPUT         : Type.JSON,
+    Message.TASK_OUTPUT_RAW     : Type.BINARY,
     Message.TASK_UPDATE         : Type.JSON,
+    Message.TASK_PAYLOAD_REQUEST: Type.JSON,
+    Message.TASK_STATS          : Type.JSON,
+    Message.TASK_RETURN         : Type.JSON,
+    Message.TASK_RESULT         : Type.JSON,
 
     Message.FILE_GET_DRIVES     : Type.JSON,
     Message.FILE_GET_SHARES     : Type.JSON,
     Message.FILE_GET_LISTING    : Type.JSON,
+    Message.FILE_WATCH          : Type.JSON,
+    Message.FILE_UNWATCH        : Type.JSON,
+    Message.FILE_SEARCH         : Type.JSON,
+    Message.FILE_SEARCH_CANCEL  : Type.JSON,
     Message.FILE_LISTING        : Type.JSON,
+    Message.FILE_CHANGES        : Type.JSON,
+    Message.FILE_SEARCH_RESULTS : Type.JSON,
 
     Message.FILE_MAKE           : Type.JSON,
     Message.FILE_RENAME         : Type.JSON,
     Message.FILE_COPY_MOVE      : Type.JSON,
     Message.FILE_DELETE         : Type.JSON,
+    Message.FILE_HASH           : Type.JSON,
+    Message.FILE_SYNC           : Type.JSON,
+    Message.FILE_ACTION_CANCEL  : Type.JSON,
     Message.FILE_ACTION_STATUS  : Type.JSON,
+
+    Message.FILE_PULL           : Type.JSON,
+    Message.FILE_PULL_CANCEL    : Type.JSON,
+    Message.FILE_PULL_DATA      : Type.BINARY,
+    Message.FILE_PULL_END       : Type.JSON,
     }
 
 
@@ -16,17 +16,15 @@ async def _read_with_length(reader: asyncio.streams.StreamReader, decode: bool)
             return ''
         msg_size = struct.unpack(message.SIZE_FMT, msg_size)[0]
 
-        msg = ''
-        left_over = msg_size
-        while left_over>0:
-            received = (await reader.read(min(4096, left_over)))
-            if not received:
-                # connection broken
-                return ''
-            if decode:
-                received = received.decode('utf8')
-            msg += received
-            left_over = msg_size-len(msg)
+        # NB: decode only once whole message is received, multi-byte
+        # characters may otherwise be split
+        try:
+            msg = await reader.readexactly(msg_size)
+        except asyncio.IncompleteReadError:
+            # connection broken
+            return ''
+        if decode:
+            msg = msg.decode('utf8')
         return msg
 
     except ConnectionError:
@@ -45,18 +43,27 @@ def prepare_transmission(msg: str|bytes) -> bytes:
 
     return length + msg
 
-async def send_with_length(writer: asyncio.streams.StreamWriter, msg: str|bytes) -> bool:
+def prepare_typed(msg_type: message.Message, msg: str='') -> bytes:
+    # serialize a typed message, e.g. to send the same message to
+    # multiple receivers while serializing it only once
+    return prepare_transmission(msg_type.value) + prepare_transmission(message.prepare(msg_type, msg))
+
+async def send_prepared(writer: asyncio.streams.StreamWriter, data: bytes) -> bool:
+    # send data prepared with prepare_transmission() or prepare_typed()
     if writer.is_closing():
         return False
     try:
-        # get data to put on the line and send
-        writer.write(prepare_transmission(msg))
+        writer.write(data)
 
         await writer.drain()
         return True
     except ConnectionError:
         return False
 
+async def send_with_length(writer: asyncio.streams.StreamWriter, msg: str|bytes) -> bool:
+    # get data to put on the line and send
+    return await send_prepared(writer, prepare_transmission(msg))
+
 
 async def typed_receive(reader: asyncio.streams.StreamReader) -> tuple[message.Message,str]:
     # get message type
@@ -72,9 +79,6 @@ async def typed_receive(reader: asyncio.streams.StreamReader) -> tuple[message.M
     return msg_type, msg
 
 async def typed_send(writer: asyncio.streams.StreamWriter, msg_type: message.Message, msg: str=''):
-    # send message type
-    await send_with_length(writer, msg_type.value)
-
-    # send associated data, if any
-    msg = message.prepare(msg_type, msg)
-    await send_with_length(writer, msg)
\ No newline at end of file
+    # send message type and associated data, if any. NB: written in one go so
+    # that messages sent concurrently on the same connection cannot interleave
+    await send_prepared(writer, prepare_typed(msg_type, msg))
\ No newline at end of file
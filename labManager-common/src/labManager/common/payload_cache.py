@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+
+# on-disk cache of task payloads (e.g. batch file or python script contents), keyed
+# by content hash, so that a payload only needs to be sent by the master once and is
+# written to disk only once. Least recently used payloads are evicted once the cache
+# grows beyond its maximum size. Payloads of running tasks are never evicted: get() and
+# put() return the payload already marked as in use, and the caller must release() it
+# (e.g. using in_use()) once done with it
+
+default_folder  = pathlib.Path(tempfile.gettempdir())/'labManager'/'payload_cache'
+default_max_size= 256*1024*1024 # bytes
+
+def digest(payload: str) -> str:
+    return hashlib.sha256(payload.encode('utf8')).hexdigest()
+
+class PayloadCache:
+    def __init__(self, folder: str|pathlib.Path = None, max_size: int = None):
+        self.folder     = pathlib.Path(folder or default_folder)
+        self.max_size   = max_size or default_max_size
+
+        self._entries   : dict[str, tuple[pathlib.Path, int]] = {}  # file name -> (path, size), least recently used first
+        self._in_use    : dict[str, int] = {}                       # file name -> number of running tasks using it
+        self._size      = 0
+        self._lock      = threading.Lock()
+
+        # pick up what is already in the cache from previous runs
+        self.folder.mkdir(parents=True, exist_ok=True)
+        files = []
+        for e in os.scandir(self.folder):
+            if e.is_file():
+                if e.name.endswith('.tmp'):
+                    # left over from an interrupted write
+                    with contextlib.suppress(OSError):
+                        os.unlink(e.path)
+                    continue
+                st = e.stat()
+                files.append((st.st_mtime, e.name, st.st_size))
+        for _,name,size in sorted(files):
+            self._entries[name] = (self.folder/name, size)
+            self._size += size
+
+    def get(self, payload_digest: str, suffix: str) -> pathlib.Path|None:
+        name = payload_digest+suffix
+        with self._lock:
+            if name not in self._entries:
+                return None
+            # mark as most recently used, and as in use so it can't be evicted before the caller gets to use it
+            path,_ = self._entries[name] = self._entries.pop(name)
+            self._acquire(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # removed behind our back
+            with self._lock:
+                self._release(name)
+                if name in self._entries:
+                    self._size -= self._entries.pop(name)[1]
+            return None
+        return path
+
+    async def put(self, payload_digest: str, suffix: str, payload: str) -> pathlib.Path:
+        if digest(payload)!=payload_digest:
+            raise ValueError(f'Received payload does not match its hash {payload_digest}')
+        return await asyncio.to_thread(self._put, payload_digest+suffix, payload)
+
+    def _put(self, name: str, payload: str) -> pathlib.Path:
+        path = self.folder/name
+        with self._lock:
+            if name in self._entries:
+                self._acquire(name)
+                return path
+
+        # write to temporary file first so that a half-written payload is never used
+        temp = path.with_name(name+'.tmp')
+        temp.write_text(payload)
+        os.replace(temp, path)
+
+        size = path.stat().st_size
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = (path, size)
+                self._size += size
+            self._acquire(name) # never evict the payload we're about to hand out
+            self._evict()
+        return path
+
+    def _evict(self):
+        for name in list(self._entries):
+            if self._size<=self.max_size:
+                break
+            if self._in_use.get(name):
+                continue
+            path, size = self._entries.pop(name)
+            self._size -= size
+            with contextlib.suppress(OSError):
+                path.unlink()
+
+    def _acquire(self, name: str):
+        # NB: call with lock held
+        self._in_use[name] = self._in_use.get(name, 0)+1
+
+    def _release(self, name: str):
+        # NB: call with lock held
+        self._in_use[name] -= 1
+        if not self._in_use[name]:
+            del self._in_use[name]
+
+    def release(self, path: pathlib.Path):
+        # payload returned by get() or put() is no longer used
+        with self._lock:
+            self._release(path.name)
+            self._evict()
+
+    @contextlib.contextmanager
+    def in_use(self, path: pathlib.Path):
+        # for the duration of the context, e.g. while a task runs, keep using a payload
+        # returned by get() or put(), then release it
+        try:
+            yield path
+        finally:
+            self.release(path)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import aiopath
+import asyncio
+import collections
+import functools
+import json
+import os
+import pathlib
+from dataclasses import dataclass, field
+from enum import auto
+from typing import Callable, Coroutine
+
+from . import enum_helper, structs, task
+
+# A pipeline is a set of steps (tasks) with dependencies between them, run on a set of
+# clients. Each client advances through the pipeline on its own: a step is launched on
+# a client as soon as all the steps it depends on have finished successfully on that
+# client, without waiting for other clients. When a step fails on a client, the steps
+# depending on it are skipped for that client. Each step is run as a task group, so
+# that its progress over clients can be followed like that of any other task group.
+# The state of a pipeline can be persisted to a file, so that when the same pipeline
+# is run again (e.g. after fixing a failing step), steps that already finished on a
+# client are not run again.
+
+@enum_helper.get
+class Status(enum_helper.AutoNameSpace):
+    Waiting     = auto()    # waiting for the steps it depends on
+    Running     = auto()
+    Finished    = auto()
+    Errored     = auto()
+    Skipped     = auto()    # a step it depends on errored
+statuses = [x.value for x in Status]
+
+@dataclass
+class Step:
+    name        : str
+    task        : task.TaskDef
+    depends_on  : list[str] = field(default_factory=list)   # names of steps that must have finished first
+
+
+class Pipeline:
+    def __init__(self, steps: list[Step], clients: dict[int, str], launch: Callable[[task.Task], Coroutine], state_file: str|pathlib.Path = None):
+        # clients: client id -> name. Names are used in the state file as client ids
+        # are not stable over runs. launch is called to start a single task
+        self.steps      = {s.name: s for s in steps}
+        self.clients    = clients
+        self.state_file = pathlib.Path(state_file) if state_file else None
+        self._launch    = launch
+
+        self.order      = self._check_graph(steps)
+        self._dependents: dict[str, list[str]] = {s: [] for s in self.steps}
+        for s in steps:
+            for d in s.depends_on:
+                self._dependents[d].append(s.name)
+
+        self.task_groups: dict[str, task.TaskGroup]     = {}    # step name -> task group
+        self.status     : dict[int, dict[str, Status]]  = {c: {s: Status.Waiting for s in self.order} for c in clients}
+        self._previous  : dict[str, dict[str, str]]     = {}    # client name -> step name -> status, from state file
+        self._done      : asyncio.Future                = None
+        self._launches  : set[asyncio.Task]             = set()
+        self._saver     : asyncio.Task                  = None  # writes state file
+        self._save_again: bool                          = False
+
+    @staticmethod
+    def _check_graph(steps: list[Step]) -> list[str]:
+        # check that all dependencies exist and that there are no cycles. Returns steps in topological order
+        names = [s.name for s in steps]
+        if len(set(names))!=len(names):
+            raise ValueError('Pipeline step names must be unique')
+        for s in steps:
+            for d in s.depends_on:
+                if d not in names:
+                    raise ValueError(f'Pipeline step "{s.name}" depends on unknown step "{d}"')
+        num_deps = {s.name: len(set(s.depends_on)) for s in steps}
+        ready = collections.deque(n for n in names if not num_deps[n])
+        order = []
+        while ready:
+            n = ready.popleft()
+            order.append(n)
+            for s in steps:
+                if n in s.depends_on:
+                    num_deps[s.name] -= 1
+                    if not num_deps[s.name]:
+                        ready.append(s.name)
+        if len(order)!=len(names):
+            raise ValueError(f'Pipeline steps have circular dependencies: {sorted(set(names)-set(order))}')
+        return order
+
+    async def prepare(self):
+        # create a task group for each step, with a task for each client
+        for name in self.order:
+            tdef = self.steps[name].task
+            payload = tdef.payload_text
+            if tdef.payload_type=='file':
+                payload = await aiopath.AsyncPath(tdef.payload_file).read_text()
+            tg = task.create_group(tdef.type, payload, list(self.clients), cwd=tdef.cwd, env=tdef.env, interactive=tdef.interactive, python_unbuf=tdef.python_unbuf, priority=tdef.priority, pty=tdef.pty, raw_output=tdef.raw_output, placeholders=tdef.placeholders)
+            for tsk in tg.tasks.values():
+                tsk.add_listener(functools.partial(self._on_task_state_change, name))
+            self.task_groups[name] = tg
+        # steps already done in a previous run of this pipeline are not run again
+        self._previous = await asyncio.to_thread(self._load_state)
+
+    def start(self):
+        self._done = asyncio.get_running_loop().create_future()
+        for c,name in self.clients.items():
+            for s,status in self._previous.get(name, {}).items():
+                if s in self.steps and status==Status.Finished.value:
+                    self.status[c][s] = Status.Finished
+                    tsk = self.task_groups[s].tasks[c]
+                    tsk.add_output('Step already finished in an earlier run of this pipeline\n')
+                    tsk.status = structs.Status.Finished
+        for c in self.clients:
+            self._advance(c)
+        self._save_state()
+        self._check_done()
+
+    async def wait(self) -> dict[int, dict[str, Status]]:
+        # wait until all clients are through the pipeline. Returns status of each step for each client
+        await asyncio.shield(self._done)
+        # make sure final state is on disk
+        if self._saver:
+            await asyncio.shield(self._saver)
+        return self.status
+
+    def is_done(self) -> bool:
+        return all(s not in [Status.Waiting, Status.Running] for c in self.status for s in self.status[c].values())
+
+    def client_disconnected(self, client_id: int):
+        # steps running on a client that disconnected will not finish
+        for s,status in self.status.get(client_id, {}).items():
+            if status==Status.Running:
+                tsk = self.task_groups[s].tasks[client_id]
+                tsk.add_output('\nClient disconnected while running this task\n')
+                tsk.status = structs.Status.Errored
+
+    def _advance(self, client_id: int):
+        # launch all steps of which all dependencies have finished
+        status = self.status[client_id]
+        for s in self.order:
+            if status[s]==Status.Waiting and all(status[d]==Status.Finished for d in self.steps[s].depends_on):
+                status[s] = Status.Running
+                launch = asyncio.create_task(self._launch(self.task_groups[s].tasks[client_id]))
+                self._launches.add(launch)
+                launch.add_done_callback(self._launches.discard)
+
+    def _skip_dependents(self, client_id: int, step: str):
+        status = self.status[client_id]
+        for s in self._dependents[step]:
+            if status[s]==Status.Waiting:
+                status[s] = Status.Skipped
+                tsk = self.task_groups[s].tasks[client_id]
+                tsk.add_output(f'Step skipped as step "{step}" it depends on did not finish successfully\n')
+                tsk.status = structs.Status.Errored
+                self._skip_dependents(client_id, s)
+
+    def _on_task_state_change(self, step: str, tsk: task.Task):
+        if not tsk.is_done() or self.status[tsk.client][step]!=Status.Running:
+            return
+        if tsk.status==structs.Status.Finished:
+            self.status[tsk.client][step] = Status.Finished
+            self._advance(tsk.client)
+        else:
+            self.status[tsk.client][step] = Status.Errored
+            self._skip_dependents(tsk.client, step)
+        self._save_state()
+        self._check_done()
+
+    def _check_done(self):
+        if self.is_done() and not self._done.done():
+            self._done.set_result(self.status)
+
+    def _load_state(self) -> dict[str, dict[str, str]]:
+        if not self.state_file or not self.state_file.is_file():
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)['clients']
+
+    def _save_state(self):
+        # state is written in a thread, so as not to block the event loop. Writes are coalesced:
+        # while a write is in progress, state changes are written once it completes
+        if not self.state_file:
+            return
+        if self._saver and not self._saver.done():
+            self._save_again = True
+            return
+        self._saver = asyncio.create_task(self._run_saver())
+
+    async def _run_saver(self):
+        while True:
+            # NB: keep state of clients that are not part of this run
+            clients = self._previous | {self.clients[c]: {s:st.value for s,st in self.status[c].items()} for c in self.status}
+            self._save_again = False
+            await asyncio.to_thread(self._write_state, {'steps': self.order, 'clients': clients})
+            if not self._save_again:
+                return
+
+    def _write_state(self, state: dict):
+        # write to temporary file first so that an interrupted write doesn't lose the state
+        temp = self.state_file.with_name(self.state_file.name+'.tmp')
+        with open(temp, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp, self.state_file)
@@ -0,0 +1,235 @@
+import asyncio
+import base64
+import json
+import os
+import runpy
+import secrets
+import shlex
+import sys
+import traceback
+
+import psutil
+
+# functions and return values of Python_function tasks are pickled. cloudpickle is used when
+# available as it can also serialize functions that are not importable on the other side
+# (e.g. defined in a script or interactively). NB: it is then needed both on master and clients
+try:
+    import cloudpickle as _pickle
+except ImportError:
+    import pickle as _pickle
+
+# Pool of pre-started python interpreters that run Python_script, Python_module and Python_function tasks,
+# so that these do not pay interpreter start-up and import cost. Each worker process
+# imports a configurable set of modules once, and then waits for jobs on its stdin. A
+# job's output is written to the worker's stdout and stderr, which the executor reads
+# like that of any other process. The end of a job is marked by a random per-job
+# sentinel on both streams, followed on stdout by the job's return code.
+# Workers are replaced after a number of jobs, or when their memory use has grown
+# too much, as state left behind by jobs (e.g. imported modules) accumulates
+
+_ready_marker = b'<labManager python worker ready>'
+
+
+class Worker:
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+        self.runs = 0
+        self.base_rss: int = None
+
+    async def submit(self, kind: str, target: str, cwd: str|None, result_file: str = None, env: dict[str,str] = None) -> bytes:
+        # kind is 'script' (target: path to script), 'module' (target: module name and arguments)
+        # or 'function' (target: file containing serialized call, see call_function()).
+        # env: environment variables to set for the duration of the job
+        sentinel = b'<labManager job end %s>' % secrets.token_hex(16).encode()
+        job = {'kind': kind, 'target': target, 'cwd': cwd, 'result': result_file, 'env': env, 'sentinel': sentinel.decode()}
+        self.proc.stdin.write(json.dumps(job).encode()+b'\n')
+        await self.proc.stdin.drain()
+        self.runs += 1
+        return sentinel
+
+    def rss(self) -> int|None:
+        try:
+            return psutil.Process(self.proc.pid).memory_info().rss
+        except psutil.Error:
+            return None
+
+    def kill(self):
+        if self.proc.returncode is None:
+            self.proc.kill()
+
+
+class WorkerPool:
+    def __init__(self, number: int, preload: list[str] = None, max_runs: int = 50, max_memory_growth: int = 500*1024*1024):
+        self.number             = number
+        self.preload            = preload or []
+        self.max_runs           = max_runs          # recycle worker after this many jobs
+        self.max_memory_growth  = max_memory_growth # bytes, recycle worker once it uses this much more memory than when it was started
+
+        self._idle  : list[Worker] = []
+        self._busy  : set[Worker]  = set()
+        self._starting: set[asyncio.Task] = set()
+
+    def start(self):
+        # workers start in the background, tasks arriving before
+        # a worker is ready are run in a new process instead
+        for _ in range(self.number):
+            self._spawn()
+
+    async def close(self):
+        for t in self._starting:
+            t.cancel()
+        workers = self._idle+list(self._busy)
+        for w in workers:
+            w.kill()
+        self._idle.clear()
+        self._busy.clear()
+        if workers:
+            await asyncio.wait([asyncio.create_task(w.proc.wait()) for w in workers])
+
+    def try_acquire(self) -> Worker|None:
+        # returns None when no warm worker is available, caller should then
+        # run the task in a new process instead
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.proc.returncode is None:
+                self._busy.add(worker)
+                return worker
+            # worker died, replace it
+            self._spawn()
+        return None
+
+    def release(self, worker: Worker, reusable: bool):
+        self._busy.discard(worker)
+        if reusable and worker.proc.returncode is None and worker.runs<self.max_runs:
+            rss = worker.rss()
+            if rss is not None and rss-worker.base_rss<self.max_memory_growth:
+                self._idle.append(worker)
+                return
+        # worker can't be reused, replace it
+        worker.kill()
+        self._spawn()
+
+    def _spawn(self):
+        t = asyncio.create_task(self._start_worker())
+        self._starting.add(t)
+        t.add_done_callback(self._starting.discard)
+
+    async def _start_worker(self):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-u', '-m', __name__, *self.preload,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            # wait until preloading is done, discarding any output it produced
+            await asyncio.gather(proc.stdout.readuntil(_ready_marker), proc.stderr.readuntil(_ready_marker))
+        except (asyncio.IncompleteReadError, asyncio.CancelledError):
+            if proc.returncode is None:
+                proc.kill()
+            raise
+        worker = Worker(proc)
+        worker.base_rss = worker.rss() or 0
+        self._idle.append(worker)
+
+
+def serialize(obj) -> str:
+    return base64.b64encode(_pickle.dumps(obj)).decode('ascii')
+
+def deserialize(data: str):
+    return _pickle.loads(base64.b64decode(data))
+
+def call_function(call_file: str, result_file: str) -> int:
+    # call_file contains serialize((func, args, kwargs)). Calls the function and stores
+    # serialize({'value': return value}) or serialize({'error': traceback}) in result_file
+    try:
+        with open(call_file) as f:
+            func, args, kwargs = deserialize(f.read())
+        result = {'value': func(*args, **kwargs)}
+        data = serialize(result)
+    except Exception:
+        result = {'error': traceback.format_exc()}
+        data = serialize(result)
+    with open(result_file, 'w') as f:
+        f.write(data)
+    if 'error' in result:
+        print(result['error'], file=sys.stderr, end='')
+        return 1
+    return 0
+
+
+# below runs inside the worker process
+def _run_job(job: dict) -> int:
+    old_cwd, old_argv, old_path = os.getcwd(), sys.argv, sys.path[:]
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    old_env = os.environ.copy()
+    return_code = 0
+    try:
+        if job['env']:
+            os.environ.update(job['env'])
+        if job['cwd']:
+            os.chdir(job['cwd'])
+        if job['kind']=='script':
+            # mimic `python script.py`
+            sys.argv = [job['target']]
+            sys.path.insert(0, os.path.dirname(job['target']))
+            runpy.run_path(job['target'], run_name='__main__')
+        elif job['kind']=='function':
+            return_code = call_function(job['target'], job['result'])
+        else:
+            # mimic `python -m module args`
+            args = shlex.split(job['target'], posix=False)
+            sys.argv = args
+            sys.path.insert(0, os.getcwd())
+            runpy.run_module(args[0], run_name='__main__', alter_sys=True)
+    except SystemExit as exc:
+        if exc.code is None:
+            return_code = 0
+        elif isinstance(exc.code, int):
+            return_code = exc.code
+        else:
+            print(exc.code, file=sys.stderr)
+            return_code = 1
+    except BaseException:
+        traceback.print_exc()
+        return_code = 1
+    finally:
+        os.chdir(old_cwd)
+        sys.argv, sys.path[:] = old_argv, old_path
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        os.environ.clear()
+        os.environ.update(old_env)
+    return return_code
+
+def _main(preload: list[str]):
+    # jobs are received on stdin, so jobs themselves should not be able to read from
+    # it. Move it out of the way and give jobs an empty stdin instead
+    control = os.fdopen(os.dup(sys.stdin.fileno()), 'rb')
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, sys.stdin.fileno())
+    os.close(devnull)
+
+    for mod in preload:
+        try:
+            __import__(mod)
+        except Exception:
+            traceback.print_exc()
+    stdout, stderr = sys.stdout.buffer, sys.stderr.buffer
+    stdout.write(_ready_marker); stdout.flush()
+    stderr.write(_ready_marker); stderr.flush()
+
+    # jobs come in as one json line each
+    for line in control:
+        job = json.loads(line)
+        return_code = _run_job(job)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sentinel = job['sentinel'].encode()
+        stderr.write(sentinel); stderr.flush()
+        stdout.write(sentinel+b'%d\n' % return_code); stdout.flush()
+
+if __name__ == '__main__':
+    if sys.argv[1:2]==['--call']:
+        # run a single Python_function task outside of a worker
+        sys.exit(call_function(*sys.argv[2:4]))
+    _main(sys.argv[1:])
@@ -24,6 +24,7 @@ class WaiterType(enum_helper.AutoNameDash):
     Task_Group              = auto()    # wait for all tasks in a task group to complete, by ID (parameter is int)
     File_Listing            = auto()    # wait for a file listing for a specific path from a specific client to become available (parameter one is a string/path, parameter two is a client ID)
     File_Action             = auto()    # wait for a specific file action to complete (parameter is int, file action id)
+    File_Search             = auto()    # wait for a file search to complete on all clients it was launched on (parameter is int, file search id)
 
 @dataclass(frozen=True)
 class Waiter:
@@ -49,6 +50,15 @@ class Status(enum_helper.AutoNameSpace):
 statuses = [x.value for x in Status]
 
 
+# what to do with files in the destination of a sync that are not in its source
+@enum_helper.get
+class SyncDeletePolicy(enum_helper.AutoNameSpace):
+    Keep        = auto()    # never delete anything from the destination
+    Synced      = auto()    # delete files that an earlier sync copied but that have since been removed from the source (needs the sync manifest)
+    Mirror      = auto()    # delete all files in the destination that are not in the source, also ones not put there by a sync
+sync_delete_policies = [x.value for x in SyncDeletePolicy]
+
+
 @dataclass
 class ConnectedClient:
     reader          : asyncio.streams.StreamReader
@@ -63,6 +73,7 @@ class ConnectedClient:
     et_events       : list[dict]            = field(default_factory=list)
     file_listings   : dict[str,dict]        = field(default_factory=dict)
     file_actions    : dict[int,dict]        = field(default_factory=dict)
+    file_searches   : dict[int,dict]        = field(default_factory=dict)
     mounted_shares  : dict[str,str]         = field(default_factory=dict)
 
     _waiters        : set[Waiter]           = field(default_factory=set)
@@ -107,4 +118,156 @@ class DirEntry:
         if self.ctime is not None and not isinstance(self.ctime, datetime.datetime):
             self.ctime = datetime.datetime.fromtimestamp(self.ctime)
         if self.mtime is not None and not isinstance(self.mtime, datetime.datetime):
-            self.mtime = datetime.datetime.fromtimestamp(self.mtime)
\ No newline at end of file
+            self.mtime = datetime.datetime.fromtimestamp(self.mtime)
+
+
+@dataclass
+class DirListing:
+    # columnar listing of a directory: one list per field instead of a DirEntry
+    # per item, which is much cheaper to make, send over the network and decode.
+    # Mime types are stored as an index into a table of the distinct mime types
+    # (-1 for no mime type). DirEntry objects are made when an item is accessed,
+    # so that a DirListing can be used as a read-only list of DirEntry
+    path        : str
+    names       : list[str]     = field(default_factory=list)
+    is_dirs     : list[bool]    = field(default_factory=list)
+    ctimes      : list[float]   = field(default_factory=list)
+    mtimes      : list[float]   = field(default_factory=list)
+    sizes       : list[int]     = field(default_factory=list)
+    mime_idxs   : list[int]     = field(default_factory=list)
+    mime_types  : list[str]     = field(default_factory=list)
+    # when this is a page of a sorted and filtered listing: position of the page in that
+    # listing, number of entries in that listing and how it was sorted and filtered
+    offset      : int           = 0
+    total       : int           = None
+    sort_key    : str           = None
+    descending  : bool          = False
+    filter      : str           = ''
+
+    _mime_lookup: dict[str,int]     = field(init=False, repr=False, default_factory=dict)
+    _entries    : dict[int,DirEntry]= field(init=False, repr=False, default_factory=dict)
+    _base_path  : pathlib.Path      = field(init=False, repr=False, default=None)
+
+    def __post_init__(self):
+        self._mime_lookup = {m:i for i,m in enumerate(self.mime_types)}
+
+    def is_page(self) -> bool:
+        return self.total is not None and (self.offset>0 or self.total>len(self))
+
+    def take(self, idxs: list[int]) -> DirListing:
+        # new listing with only the given entries, in the given order
+        return DirListing(self.path, [self.names[i] for i in idxs], [self.is_dirs[i] for i in idxs],
+                          [self.ctimes[i] for i in idxs], [self.mtimes[i] for i in idxs],
+                          [self.sizes[i] for i in idxs], [self.mime_idxs[i] for i in idxs],
+                          self.mime_types.copy())
+
+    def append(self, name: str, is_dir: bool, ctime: float, mtime: float, size: int, mime_type: str|None):
+        self.names.append(name)
+        self.is_dirs.append(is_dir)
+        self.ctimes.append(ctime)
+        self.mtimes.append(mtime)
+        self.sizes.append(size)
+        if mime_type is None:
+            self.mime_idxs.append(-1)
+        else:
+            if (idx := self._mime_lookup.get(mime_type)) is None:
+                idx = self._mime_lookup[mime_type] = len(self.mime_types)
+                self.mime_types.append(mime_type)
+            self.mime_idxs.append(idx)
+
+    def apply_changes(self, added: DirListing, removed: list[str], changed: DirListing):
+        # update listing with changes reported for the directory. Only meaningful
+        # for a full listing, not for a page of one. NB: an added entry may already be in the
+        # listing, if the listing was made after the change but before it was reported
+        removed = set(removed) | set(changed.names) | set(added.names)
+        if removed:
+            keep = [i for i,n in enumerate(self.names) if n not in removed]
+            for col in (self.names, self.is_dirs, self.ctimes, self.mtimes, self.sizes, self.mime_idxs):
+                col[:] = [col[i] for i in keep]
+            self._entries = {}
+        self.extend(changed)
+        self.extend(added)
+        if self.total is not None:
+            self.total = len(self)
+
+    def extend(self, other: DirListing):
+        for i in range(len(other)):
+            self.append(other.names[i], other.is_dirs[i], other.ctimes[i], other.mtimes[i], other.sizes[i], other.mime_type(i))
+
+    def mime_type(self, idx: int) -> str|None:
+        return self.mime_types[m] if (m:=self.mime_idxs[idx])>=0 else None
+
+    def full_path(self, idx: int) -> pathlib.Path:
+        if self._base_path is None:
+            self._base_path = pathlib.Path(self.path)
+        return self._base_path / self.names[idx]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, idx: int|slice) -> DirEntry|list[DirEntry]:
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx<0:
+            idx += len(self)
+        if (entry := self._entries.get(idx)) is None:
+            entry = self._entries[idx] = DirEntry(self.names[idx], self.is_dirs[idx], self.full_path(idx),
+                                                  self.ctimes[idx], self.mtimes[idx], self.sizes[idx],
+                                                  self.mime_type(idx))
+        return entry
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getstate__(self):
+        # only the columns are sent, caches are rebuilt on access
+        return {k:v for k,v in self.__dict__.items() if not k.startswith('_')}
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._mime_lookup = {m:i for i,m in enumerate(self.mime_types)}
+        self._entries = {}
+        self._base_path = None
+
+
+@dataclass
+class HashManifest:
+    # digests of the files in a directory tree (or of a single file), columnar like
+    # DirListing. Paths are relative to root and use / as separator, whatever the
+    # platform, so that manifests made on different machines can be compared
+    root        : str
+    algorithm   : str
+    paths       : list[str]     = field(default_factory=list)
+    sizes       : list[int]     = field(default_factory=list)
+    mtimes      : list[float]   = field(default_factory=list)
+    digests     : list[str]     = field(default_factory=list)
+    errors      : dict[str,str] = field(default_factory=dict)   # path -> error for files that could not be hashed
+
+    def append(self, path: str, size: int, mtime: float, digest: str):
+        self.paths.append(path)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.digests.append(digest)
+
+    def as_dict(self) -> dict[str, tuple[int, float, str]]:
+        # path -> (size, mtime, digest)
+        return {p:(s,m,d) for p,s,m,d in zip(self.paths, self.sizes, self.mtimes, self.digests)}
+
+    def __len__(self):
+        return len(self.paths)
+
+
+@dataclass
+class SyncPlan:
+    # what a one-way sync of source to dest does (or would do, for a dry run).
+    # Paths are relative to source and dest, and use / as separator
+    source      : str
+    dest        : str
+    dry_run     : bool          = False
+    new         : list[str]     = field(default_factory=list)   # files not in the destination
+    changed     : list[str]     = field(default_factory=list)   # files that differ between source and destination
+    delete      : list[str]     = field(default_factory=list)   # files to be removed from the destination
+    unchanged   : int           = 0
+    copy_bytes  : int           = 0
+    used_manifest : bool        = False # True if the destination was not listed, but its state taken from the sync manifest
+    errors      : dict[str,str] = field(default_factory=dict)   # path -> error for files that could not be compared, copied or deleted
@@ -3,17 +3,37 @@ from __future__ import annotations
 import asyncio
 import aiopath
 import aioshutil
+import codecs
+import collections
 import copy
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import json
+import math
+import os
+import psutil
 import shlex
 import shutil
 import pathlib
+import struct
 import traceback
 import sys
+if not sys.platform.startswith('win'):
+    import fcntl
+    import pty
+    import resource
+    import termios
+import tempfile
+import threading
+import time
+import weakref
 from enum import auto
 from dataclasses import dataclass, field
-from typing import Callable
+from typing import Any, BinaryIO, Callable, Coroutine
 
-from . import counter, enum_helper, message, structs
+from . import counter, enum_helper, message, payload_cache, python_worker, structs
 from .network import comms, wol
 
 # TODO: env is a dict and should support either adding or overriding specific variables
@@ -26,6 +46,7 @@ class Type(enum_helper.AutoNameSpace):
     Batch_file      = auto()    # invoke batch file
     Python_module   = auto()    # sys.executable + '-m'
     Python_script   = auto()    # sys.executable, invoke python script
+    Python_function = auto()    # call python function, return value is sent back to master
     Wake_on_LAN     = auto()    # special task to broadcast WoL packets
 types = [x.value for x in Type]
 
@@ -34,8 +55,44 @@ Type.Process_exec    .doc = 'Run executable'
 Type.Batch_file      .doc = 'Invoke batch file'
 Type.Python_module   .doc = 'Call client''s active python.exe (sys.executable) with -m command line switch'
 Type.Python_script   .doc = 'Execute Python script with the client''s active python.exe (sys.executable)'
+Type.Python_function .doc = 'Call a Python function with the client''s active python.exe (sys.executable) and return its result to the master. Only available through the API, see Master.map()'
 Type.Wake_on_LAN     .doc = 'Send Wake on LAN command'
 
+# payloads of these task types are cached by clients, see payload_cache. The master
+# sends only the payload's hash, clients request the payload itself if needed
+cached_payload_types = {Type.Batch_file: '.bat', Type.Python_script: '.py'}   # type -> file suffix
+
+@dataclass
+class ResourceUsage:
+    cpu_time    : float = 0.    # s, user+system, summed over all processes in the task's process tree
+    rss         : int   = 0     # bytes, current resident set size of the process tree
+    peak_rss    : int   = 0     # bytes, highest sampled resident set size of the process tree
+    read_bytes  : int   = 0     # bytes read by the process tree (not available on all platforms)
+    write_bytes : int   = 0     # bytes written by the process tree (not available on all platforms)
+    wall_time   : float = 0.    # s, since the process was started
+
+@dataclass
+class Limits:
+    # resource limits of a task, enforced by the client. When one is exceeded, the task's
+    # whole process tree is killed. None means no limit
+    wall_time   : float = None  # s, since the process was started
+    cpu_time    : float = None  # s, user+system, summed over the task's process tree
+    max_rss     : int   = None  # bytes, resident set size of the task's process tree
+    max_output  : int   = None  # bytes, stdout and stderr combined
+
+@dataclass
+class Schedule:
+    # how the master launches the tasks of a group (see GroupScheduler), e.g. to avoid overloading
+    # a shared resource such as a software share when all clients run a heavy install at once
+    max_in_flight   : int   = None  # max number of clients running the task at the same time. None: no maximum
+    wave_size       : int   = None  # launch in waves of this many clients, each wave starts once the previous is done. None: single wave
+    wave_pause      : float = 0.    # s, pause between waves
+    max_errors      : int   = None  # stop launching tasks once this many attempts have failed
+    max_error_rate  : float = None  # stop launching tasks once this fraction of attempts has failed, checked once min_attempts are done
+    min_attempts    : int   = 5
+    retries         : int   = 0     # number of times a failed task is retried on the same client
+    retry_backoff   : float = 5.    # s, wait before the first retry of a client, doubles for each next retry
+
 _task_id_provider = counter.CounterContext()
 @dataclass
 class Task:
@@ -44,7 +101,13 @@ class Task:
     cwd         : str = None    # if not None, working directory to execute from
     env         : dict= None    # if not None, environment variables when executing
     interactive : bool = False  # if True, stdin is connected to a pipe and commands can be sent by master to control
+    pty         : bool = False  # if True and interactive, task is run in a pseudo-terminal instead of with pipes (POSIX clients only, others use pipes)
+    raw_output  : bool = False  # if True, output is sent by the client and stored as is (bytes), and only decoded when needed (see get_output())
+    placeholders: bool = False  # if True, placeholders such as {hostname} in payload, cwd and env are replaced by the client (see expand_placeholders())
     python_unbuf: bool= False   # if task.Type is Python_module or Python_script, specify whether the -u flag should be passed to run in unbuffered mode
+    priority    : int = 0       # tasks with a higher priority are started first when the client has more tasks than it runs concurrently
+    limits      : Limits = None # if not None, resource limits enforced by the client
+    payload_hash: str = None    # for cached_payload_types, see payload_cache.digest()
 
     id          : int = None
     status      : structs.Status    # after https://stackoverflow.com/a/61480946/3103767
@@ -52,11 +115,30 @@ class Task:
 
     client      : int = None
     task_group_id: int = None
+    # while status is pending, client may report the task's position in its queue (0: next to be started)
+    queue_position: int = None
 
     # when running, client starts sending back stdout and stderr as they become available. Buffer to store them in:
     output      : str = ''
+    # or, for raw_output tasks:
+    output_bytes: bytearray|bytes = field(default_factory=bytearray)
+    output_encoding: str = 'utf8'   # encoding with which raw output is decoded, may be changed at any time
+    _output_decoder: _OutputDecoder = field(init=False, repr=False, default=None)
+    # once the task is done, its output is kept in output_store, see OutputStore
+    _output_ref : bytes = field(init=False, repr=False, default=None)
+    _output_release: weakref.finalize = field(init=False, repr=False, default=None)
     # when status finished or errored, client provides the return code:
     return_code : int = None
+    # if the task was killed because it exceeded one of its limits, name of that limit (field of Limits)
+    limit_exceeded: str = None
+    # while running, client periodically reports resources used by the task's process tree
+    resource_usage: ResourceUsage = None
+    # records the task wrote to its results file (see results_env_var), forwarded by the client while running
+    results     : list[Any] = field(default_factory=list)
+    # for Python_function tasks, when done client provides the function's return value, or
+    # the traceback of the exception it raised
+    return_value: Any = None
+    return_error: str = None
 
     _listeners: list[Callable[[Task], None]] = field(default_factory=list)
 
@@ -77,6 +159,8 @@ class Task:
             return
 
         self._status = value
+        if self.is_done():
+            self._store_output()
 
         # call any value changed observers
         to_del = []
@@ -95,6 +179,122 @@ class Task:
     def is_done(self):
         return self.status in [structs.Status.Finished, structs.Status.Errored]
 
+    def add_output(self, output: str|bytes):
+        if self._output_ref is not None:
+            # output changes, so can no longer be shared with other tasks
+            self._output_release()
+            self._output_ref = None
+        if self.raw_output:
+            # NB: text output for raw tasks is e.g. an error message from the client
+            if not isinstance(self.output_bytes, bytearray):
+                self.output_bytes = bytearray(self.output_bytes)
+            self.output_bytes += output if isinstance(output, (bytes, bytearray)) else output.encode(self.output_encoding, errors='replace')
+        else:
+            self.output += output if isinstance(output, str) else output.decode('utf8', errors='replace')
+        if self.is_done():
+            # output arriving after the task is done (e.g. a message from the master), store again
+            self._store_output()
+
+    def get_output(self) -> str:
+        # output as text. Raw output is decoded here, only the part
+        # that was not yet decoded the last time this was called
+        if not self.raw_output:
+            return self.output
+        if self._output_decoder is None or self._output_decoder.encoding!=self.output_encoding:
+            self._output_decoder = _OutputDecoder(self.output_encoding)
+        return self._output_decoder.decode(self.output_bytes, self.is_done())
+
+    def _store_output(self):
+        # when the same command is run on many clients, output is often identical. Once
+        # the task is done, move its output to the output store so that it is shared with
+        # other tasks that have the same output. The reference is released when this
+        # task is garbage collected
+        if self._output_ref is not None:
+            return
+        output = bytes(self.output_bytes) if self.raw_output else self.output
+        if not output:
+            return
+        self._output_ref, output = output_store.add(output)
+        self._output_release = weakref.finalize(self, output_store.release, self._output_ref)
+        # NB: raw output is now an immutable bytes object, add_output() makes a new bytearray if needed
+        if self.raw_output:
+            self.output_bytes = output
+        else:
+            self.output = output
+
+class OutputStore:
+    # Content-addressed store of task output: identical output is stored only once,
+    # with a reference count
+    def __init__(self):
+        self._entries   : dict[bytes, list[str|bytes, int]] = {}    # digest -> [output, reference count]
+        self._lock      = threading.Lock()
+
+    @staticmethod
+    def digest(output: str|bytes) -> bytes:
+        # NB: text and binary output with the same bytes are kept apart
+        if isinstance(output, str):
+            return b't'+hashlib.blake2b(output.encode('utf8', errors='surrogatepass'), digest_size=16).digest()
+        return b'b'+hashlib.blake2b(output, digest_size=16).digest()
+
+    def add(self, output: str|bytes) -> tuple[bytes, str|bytes]:
+        # returns digest and the stored output, to be used instead of the passed output
+        digest = self.digest(output)
+        with self._lock:
+            entry = self._entries.setdefault(digest, [output, 0])
+            entry[1] += 1
+            return digest, entry[0]
+
+    def release(self, digest: bytes):
+        with self._lock:
+            entry = self._entries[digest]
+            entry[1] -= 1
+            if not entry[1]:
+                del self._entries[digest]
+
+    def stats(self) -> tuple[int, int, int]:
+        # number of stored outputs, number of references to them, and their size in bytes/characters
+        with self._lock:
+            return len(self._entries), sum(e[1] for e in self._entries.values()), sum(len(e[0]) for e in self._entries.values())
+
+output_store = OutputStore()
+
+class _OutputDecoder:
+    def __init__(self, encoding: str):
+        self.encoding   = encoding
+        self.text       = ''
+        self._decoder   = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._pos       = 0
+        self._final     = False
+
+    def decode(self, data: bytearray, final: bool) -> str:
+        if self._pos<len(data) or (final and not self._final):
+            self.text += self._decoder.decode(data[self._pos:], final=final)
+            self._pos = len(data)
+            self._final = final
+        return self.text
+
+@dataclass
+class CallResult:
+    # result of a Python_function task, see Master.map()
+    client      : int
+    value       : Any = None
+    error       : str = None    # if not None, the call failed: traceback of exception raised by the function, or reason the call did not complete
+    task        : Task = None
+
+    @classmethod
+    def fromtask(cls, task: Task):
+        if task.status==structs.Status.Finished:
+            return cls(task.client, value=task.return_value, task=task)
+        if task.return_error:
+            error = task.return_error
+        elif task.limit_exceeded:
+            error = f'Call was killed because it exceeded its {task.limit_exceeded} limit'
+        elif task.is_done():
+            error = f'Call failed (return code {task.return_code}):\n{task.output}'
+        else:
+            error = 'Client disconnected before call completed'
+        return cls(task.client, error=error, task=task)
+
 @dataclass
 class TaskDef:
     name        : str       = ''    # just for showing in GUI
@@ -105,12 +305,17 @@ class TaskDef:
     cwd         : str       = ''
     env         : dict      = field(default_factory=dict)
     interactive : bool      = False
+    pty         : bool      = False
+    raw_output  : bool      = False
+    placeholders: bool      = False
     python_unbuf: bool      = False
+    priority    : int       = 0
+    schedule    : Schedule  = None
 
     @classmethod
     def fromtask(cls, task: Task):
         "Initialize TaskDef from a Task"
-        return cls(type=task.type, payload_text=task.payload, cwd=task.cwd, env=copy.deepcopy(task.env), interactive=task.interactive, python_unbuf=task.python_unbuf)
+        return cls(type=task.type, payload_text=task.payload, cwd=task.cwd, env=copy.deepcopy(task.env), interactive=task.interactive, pty=task.pty, raw_output=task.raw_output, placeholders=task.placeholders, python_unbuf=task.python_unbuf, priority=task.priority)
 
     @classmethod
     def fromdict(cls, task: dict):
@@ -125,7 +330,11 @@ class TaskDef:
         tdef.cwd         = task['cwd']
         tdef.env         = task['env']
         tdef.interactive = task['interactive']
+        tdef.pty         = task['pty']
+        tdef.raw_output  = task['raw_output']
+        tdef.placeholders= task['placeholders']
         tdef.python_unbuf= task['python_unbuffered']
+        tdef.priority    = task['priority']
         return tdef
 
 @dataclass
@@ -134,7 +343,134 @@ class RunningTask:
     handler             : asyncio.Task = None
     input               : asyncio.Queue= None
     tried_stdin_close   : bool = False
+    priority            : int = 0
+    resize              : Callable[[int, int], None] = None # set while task runs in a pseudo-terminal: call with rows, columns to change its window size
+
+
+# minimum interval (s) between queue position updates sent by the Scheduler
+_queue_announce_interval = 0.25
+
+# limits the number of tasks that a client runs concurrently. Tasks beyond the limit
+# are queued per priority level (higher first) and, within a priority level, per
+# master, with masters served round-robin so that one master fanning out many tasks
+# cannot starve another
+class Scheduler:
+    def __init__(self, max_concurrent: int = None):
+        # None or 0: as many tasks as there are CPU cores
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self._num_running   = 0
+        # priority -> master -> queue of (running task, writer, future to release it)
+        self._queues        : dict[int, dict[int, collections.deque[tuple[RunningTask, asyncio.StreamWriter, asyncio.Future]]]] = {}
+        self._announced     : dict[int, int] = {}   # task id -> last sent queue position
+        self._announce_handle: asyncio.TimerHandle = None
+
+    async def run(self, running_task: RunningTask, master: int, writer, launcher: Callable[[], Coroutine]):
+        # launcher is only called once the task may start. A task that is cancelled
+        # while still queued is thus cheap: no process was ever created for it
+        if self._num_running<self.max_concurrent and not self._queues:
+            self._num_running += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(running_task.priority, {}).setdefault(master, collections.deque()).append((running_task, writer, fut))
+            self._announce_positions()
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # we were already given a slot, give it back
+                    self._release()
+                else:
+                    self._remove(running_task, master)
+                    self._announce_positions()
+                self._announced.pop(running_task.id, None)
+                await comms.typed_send(
+                    writer,
+                    message.Message.TASK_UPDATE,
+                    {'task_id': running_task.id, 'status': structs.Status.Errored}
+                )
+                raise
+            self._announced.pop(running_task.id, None)
+
+        try:
+            return await launcher()
+        finally:
+            self._release()
+
+    def get_queue(self) -> list[tuple[RunningTask, asyncio.StreamWriter]]:
+        # order in which queued tasks will be started
+        order = []
+        for prio in sorted(self._queues, reverse=True):
+            # round-robin over masters: take one task of each in turn
+            queues = [list(q) for q in self._queues[prio].values()]
+            for i in range(max(len(q) for q in queues)):
+                order.extend((t,w) for t,w,_ in (q[i] for q in queues if i<len(q)))
+        return order
+
+    def _remove(self, running_task: RunningTask, master: int):
+        if running_task.priority not in self._queues or master not in self._queues[running_task.priority]:
+            return
+        queue = self._queues[running_task.priority][master]
+        for item in queue:
+            if item[0] is running_task:
+                queue.remove(item)
+                break
+        self._prune(running_task.priority, master)
 
+    def _prune(self, priority: int, master: int):
+        if not self._queues[priority][master]:
+            del self._queues[priority][master]
+            if not self._queues[priority]:
+                del self._queues[priority]
+
+    def _release(self):
+        self._num_running -= 1
+        while self._queues and self._num_running<self.max_concurrent:
+            # start next task: first master in the highest priority level. That master
+            # then goes to the back of the line for this priority level
+            prio    = max(self._queues)
+            masters = self._queues[prio]
+            master  = next(iter(masters))
+            _,_,fut = masters[master].popleft()
+            masters[master] = masters.pop(master)
+            self._prune(prio, master)
+            if not fut.done():  # skip tasks that were cancelled and haven't cleaned up yet
+                self._num_running += 1
+                fut.set_result(None)
+        self._announce_positions()
+
+    def _announce_positions(self):
+        # tell masters about the queue position of their tasks. Positions change for all
+        # queued tasks whenever one starts, so rate-limit these updates
+        if not self._announce_handle:
+            self._announce_handle = asyncio.get_running_loop().call_later(_queue_announce_interval, self._send_positions)
+
+    def _send_positions(self):
+        self._announce_handle = None
+        for pos,(tsk,writer) in enumerate(self.get_queue()):
+            if self._announced.get(tsk.id)==pos:
+                continue
+            self._announced[tsk.id] = pos
+            asyncio.create_task(comms.typed_send(
+                writer,
+                message.Message.TASK_UPDATE,
+                {'task_id': tsk.id, 'status': structs.Status.Pending, 'queue_position': pos}
+            ))
+
+
+@dataclass
+class TaskGroupProgress:
+    total       : int
+    pending     : int
+    running     : int
+    finished    : int
+    errored     : int
+    first_error : tuple[int,int]|None  # client and task id of the first task that errored
+
+@dataclass
+class OutputGroup:
+    return_code : int|None
+    clients     : list[int]
+    task        : Task          # task of the first of the clients, e.g. to get the output (see Task.get_output())
 
 _task_group_id_provider = counter.CounterContext()
 @dataclass
@@ -146,10 +482,24 @@ class TaskGroup:
     # index is client id
     tasks       : dict[int, Task]  = field(default_factory=dict)
 
-    num_finished: int = 0
     # status: running when any task has started, error when any has errored, finished when all finished successfully
     status      : structs.Status    # after https://stackoverflow.com/a/61480946/3103767
     _status     : structs.Status = field(init=False, repr=False, default=structs.Status.Pending)
+    # client and task id of the first task that errored
+    first_error : tuple[int,int] = None
+
+    # if set, called when a task errors. If it returns True, the error is handled (e.g. the task
+    # is retried, see replace_task()) and does not count towards the group's status
+    error_handler: Callable[[Task], bool] = None
+    scheduler   : GroupScheduler = None # if the group's tasks are launched by a GroupScheduler
+
+    # bookkeeping, so that task status changes are handled without looping over all tasks:
+    # status each task was last counted as, and number of tasks per status
+    _task_status: dict[int, structs.Status] = field(init=False, repr=False, default_factory=dict)
+    _counts     : dict[structs.Status, int] = field(init=False, repr=False, default_factory=lambda: {s:0 for s in structs.Status})
+    # clients of done tasks by their (output, return code), see output_summary()
+    _outputs    : dict[tuple[bytes,int], dict[int,None]] = field(init=False, repr=False, default_factory=dict)
+    _output_keys: dict[int, tuple[bytes,int]] = field(init=False, repr=False, default_factory=dict)  # task id -> key in _outputs
 
     _listeners: list[Callable[[TaskGroup], None]] = field(default_factory=list)
 
@@ -159,26 +509,89 @@ class TaskGroup:
             self.id = _task_group_id_provider.count
 
     def add_task(self, client_id: int, tsk: Task):
+        if client_id in self.tasks:
+            self._uncount(self.tasks[client_id])
         self.tasks[client_id] = tsk
+        self._task_status[tsk.id] = tsk.status
+        self._counts[tsk.status] += 1
         tsk.add_listener(self._on_task_state_change)
+        self._update_status()
+
+    def replace_task(self, client_id: int, tsk: Task):
+        # put a new task in place of the one for this client, e.g. to retry it
+        self.add_task(client_id, tsk)
+
+    def _uncount(self, tsk: Task):
+        if (status:=self._task_status.pop(tsk.id, None)) is not None:
+            self._counts[status] -= 1
+        self._ungroup_output(tsk)
+
+    def _group_output(self, tsk: Task):
+        self._ungroup_output(tsk)
+        key = (tsk._output_ref, tsk.return_code)
+        self._outputs.setdefault(key, {})[tsk.client] = None
+        self._output_keys[tsk.id] = key
+
+    def _ungroup_output(self, tsk: Task):
+        if (key:=self._output_keys.pop(tsk.id, None)) is not None:
+            del self._outputs[key][tsk.client]
+            if not self._outputs[key]:
+                del self._outputs[key]
 
     def _on_task_state_change(self, tsk: Task):
-        if tsk.id not in [self.tasks[c].id for c in self.tasks]:
-            # task not a part of this task group (shouldn't occur?), nothing to do
+        prev = self._task_status.get(tsk.id)
+        if prev is None:
+            # task not (or no longer) part of this task group, nothing to do
             return
-        if tsk.status==structs.Status.Running and self.status!=structs.Status.Running:
-            self.status = structs.Status.Running
-
-        # rest of logic is for when the task is finished
-        if not tsk.is_done():
+        if prev==tsk.status or prev in [structs.Status.Finished, structs.Status.Errored]:
+            # nothing changed (e.g. queue position update), or duplicate update for a task
+            # that is already done
             return
-        self.num_finished += 1
-        if tsk.status==structs.Status.Errored:
+        if tsk.status==structs.Status.Errored and self.error_handler and self.error_handler(tsk):
+            return
+
+        self._counts[prev] -= 1
+        self._counts[tsk.status] += 1
+        self._task_status[tsk.id] = tsk.status
+        if tsk.status==structs.Status.Errored and self.first_error is None:
+            self.first_error = (tsk.client, tsk.id)
+        if tsk.is_done():
+            self._group_output(tsk)
+        self._update_status()
+
+    def _update_status(self):
+        c = self._counts
+        if c[structs.Status.Errored]:
             # task group status is errored when any task has errored
-            self.status = structs.Status.Errored
-        elif self.num_finished==len(self.tasks):
+            status = structs.Status.Errored
+        elif c[structs.Status.Finished]==len(self.tasks):
             # task group status is finished when all tasks have finished
-            self.status = structs.Status.Finished
+            status = structs.Status.Finished
+        elif c[structs.Status.Running] or c[structs.Status.Finished]:
+            status = structs.Status.Running
+        else:
+            status = structs.Status.Pending
+        # only notify listeners when the group's status actually changes
+        if status!=self._status:
+            self.status = status
+
+    @property
+    def num_finished(self) -> int:
+        return self._counts[structs.Status.Finished]+self._counts[structs.Status.Errored]
+
+    def output_summary(self) -> list[OutputGroup]:
+        # clients whose task is done, grouped by identical output and return code. Largest group first,
+        # so that clients with deviating results are easily spotted
+        # NB: output may still be added to a task after it is done, regroup such tasks
+        stale = [tsk for key,clients in self._outputs.items() for c in clients if ((tsk:=self.tasks[c])._output_ref, tsk.return_code)!=key]
+        for tsk in stale:
+            self._group_output(tsk)
+        groups = [OutputGroup(key[1], list(clients), self.tasks[next(iter(clients))]) for key,clients in self._outputs.items()]
+        return sorted(groups, key=lambda g: len(g.clients), reverse=True)
+
+    def progress(self) -> TaskGroupProgress:
+        c = self._counts
+        return TaskGroupProgress(len(self.tasks), c[structs.Status.Pending], c[structs.Status.Running], c[structs.Status.Finished], c[structs.Status.Errored], self.first_error)
 
     @property
     def status(self) -> structs.Status:
@@ -210,90 +623,419 @@ class TaskGroup:
     def is_done(self):
         return self.status in [structs.Status.Finished, structs.Status.Errored]
 
+    def collect_results(self, key: str = None, last_only: bool = False) -> dict[int, list[Any]|Any]:
+        # results reported by the tasks of this group, indexed by client id. If key is
+        # provided, only that field of the records (records without it are skipped). If
+        # last_only, only the latest record (or field value) per client, clients without
+        # any are left out
+        out = {}
+        for c,tsk in self.tasks.items():
+            records = tsk.results if key is None else [r[key] for r in tsk.results if isinstance(r, dict) and key in r]
+            if last_only:
+                if records:
+                    out[c] = records[-1]
+            else:
+                out[c] = records
+        return out
+
+
+@dataclass
+class ScheduleProgress:
+    total       : int           # number of clients in the group
+    waiting     : int           # not yet launched, or waiting to be retried
+    running     : int           # launched and not yet done
+    finished    : int
+    errored     : int           # failed, and will not be retried
+    failed_attempts: int        # including those that were retried
+    wave        : int           # current wave (0-based)
+    num_waves   : int
+    stopped     : str|None      # reason why no more tasks are launched, if so
+    eta         : float|None    # s, estimated time until all tasks are done, based on progress so far
+
+class GroupScheduler:
+    # Launches the tasks of a group according to a Schedule: in waves, with a maximum
+    # number of clients running the task at the same time, retrying failed tasks and
+    # stopping when too many fail. Tasks that are not launched because the scheduler
+    # stopped are marked as errored. launch is called to start a single task
+    def __init__(self, task_group: TaskGroup, schedule: Schedule, launch: Callable[[Task], Coroutine]):
+        self.task_group = task_group
+        self.schedule   = schedule
+        self._launch    = launch
+
+        self.stopped    : str           = None
+        self.failed_attempts: int       = 0
+        self.attempts   : dict[int,int] = {}    # client id -> number of times launched
+        self._wave      = 0
+        self._num_waves = 1 if not schedule.wave_size else math.ceil(len(task_group.tasks)/schedule.wave_size)
+        self._start_time: float         = None
+        self._in_flight : set[int]      = set() # client ids
+        self._launched  : set[int]      = set() # task ids
+        self._retry     : set[int]      = set() # task ids of tasks that will be retried
+        self._retry_at  : dict[int,float] = {}  # client id -> time at which to retry
+        self._event     = asyncio.Event()
+
+        task_group.scheduler = self
+        task_group.error_handler = self._handle_error
+        for tsk in task_group.tasks.values():
+            tsk.add_listener(self._on_task_state_change)
+
+    async def run(self):
+        self._start_time = time.monotonic()
+        clients = list(self.task_group.tasks)
+        wave_size = self.schedule.wave_size or len(clients)
+        try:
+            for self._wave,i in enumerate(range(0, len(clients), wave_size)):
+                if self._wave and self.schedule.wave_pause:
+                    await asyncio.sleep(self.schedule.wave_pause)
+                if self.stopped:
+                    break
+                await self._run_wave(clients[i:i+wave_size])
+        finally:
+            if not self.stopped and any(t.id not in self._launched for t in self.task_group.tasks.values()):
+                self.stopped = 'Launching was cancelled'
+            self._error_unlaunched()
+
+    def stop(self, reason: str = 'Stopped by user'):
+        # launch no more tasks, tasks already running are not affected
+        if not self.stopped:
+            self.stopped = reason
+        self._event.set()
+
+    def client_disconnected(self, client_id: int):
+        # a task running on a client that disconnected will not finish, count it as failed
+        if client_id in self._in_flight:
+            tsk = self.task_group.tasks[client_id]
+            tsk.add_output('\nClient disconnected while running this task\n')
+            tsk.status = structs.Status.Errored
+
+    def progress(self) -> ScheduleProgress:
+        group   = self.task_group.progress()
+        finished, errored, total = group.finished, group.errored, group.total
+        done    = finished+errored
+        running = len(self._in_flight)
+        eta     = None
+        if done and done<total and not self.stopped:
+            # assume clients keep finishing at the rate they did so far
+            elapsed = time.monotonic()-self._start_time
+            eta     = elapsed/done*(total-done)
+        return ScheduleProgress(total, total-done-running, running, finished, errored, self.failed_attempts, self._wave, self._num_waves, self.stopped, eta)
+
+    async def _run_wave(self, clients: list[int]):
+        todo = collections.deque(clients)
+        wave = set(clients)
+        while not self.stopped:
+            self._event.clear()
+            # move clients whose retry is due to the launch queue
+            now = time.monotonic()
+            for c,t in list(self._retry_at.items()):
+                if t<=now:
+                    del self._retry_at[c]
+                    todo.append(c)
+            while todo and not self.stopped and (not self.schedule.max_in_flight or len(self._in_flight)<self.schedule.max_in_flight):
+                await self._launch_client(todo.popleft())
+
+            if not todo and not self._retry_at and not (self._in_flight & wave):
+                break   # wave done
+
+            # wait for a task to finish, or for the next retry to become due
+            timeout = max(min(self._retry_at.values())-time.monotonic(), 0) if self._retry_at else None
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _launch_client(self, client_id: int):
+        tsk = self.task_group.tasks[client_id]
+        self.attempts[client_id] = self.attempts.get(client_id, 0)+1
+        self._in_flight.add(client_id)
+        self._launched.add(tsk.id)
+        await self._launch(tsk)
+
+    def _handle_error(self, tsk: Task) -> bool:
+        # called by the task group before our own listener
+        if tsk.id not in self._launched:
+            return False
+        self.failed_attempts += 1
+        s = self.schedule
+        if not self.stopped:
+            attempts = sum(self.attempts.values())
+            if s.max_errors is not None and self.failed_attempts>=s.max_errors:
+                self.stop(f'{self.failed_attempts} attempts failed')
+            elif s.max_error_rate is not None and attempts>=s.min_attempts and self.failed_attempts/attempts>s.max_error_rate:
+                self.stop(f'{self.failed_attempts} of {attempts} attempts failed')
+        if self.stopped or self.attempts[tsk.client]>s.retries:
+            return False
+        self._retry.add(tsk.id)
+        return True
+
+    def _on_task_state_change(self, tsk: Task):
+        if not tsk.is_done() or tsk.client not in self._in_flight or self.task_group.tasks[tsk.client] is not tsk:
+            return
+        self._in_flight.discard(tsk.client)
+        if tsk.id in self._retry:
+            self._retry.discard(tsk.id)
+            new_task = Task(tsk.type, tsk.payload, cwd=tsk.cwd, env=tsk.env, interactive=tsk.interactive, pty=tsk.pty, raw_output=tsk.raw_output, placeholders=tsk.placeholders, python_unbuf=tsk.python_unbuf, priority=tsk.priority, limits=tsk.limits, payload_hash=tsk.payload_hash, client=tsk.client, task_group_id=tsk.task_group_id)
+            self.task_group.replace_task(tsk.client, new_task)
+            new_task.add_listener(self._on_task_state_change)   # NB: after task group's listener, see _handle_error()
+            self._retry_at[tsk.client] = time.monotonic()+self.schedule.retry_backoff*2**(self.attempts[tsk.client]-1)
+        self._event.set()
+
+    def _error_unlaunched(self):
+        for tsk in list(self.task_group.tasks.values()):
+            if tsk.id not in self._launched and not tsk.is_done():
+                tsk.add_output(f'Task was not started: {self.stopped}\n')
+                tsk.status = structs.Status.Errored
+
 
 @enum_helper.get
 class StreamType(enum_helper.AutoNameDash):
     STDOUT      = auto()
     STDERR      = auto()
 
+# header of binary TASK_OUTPUT_RAW (task id, stream type index) and TASK_INPUT_RAW (task id) messages
+_raw_output_header  = struct.Struct('!QB')
+_raw_input_header   = struct.Struct('!Q')
+
+def pack_raw_output(task_id: int, stream_type: StreamType, output: bytes) -> bytes:
+    return _raw_output_header.pack(task_id, list(StreamType).index(stream_type))+output
+
+def unpack_raw_output(msg: bytes) -> tuple[int, StreamType, bytes]:
+    task_id, stream_idx = _raw_output_header.unpack_from(msg)
+    return task_id, list(StreamType)[stream_idx], msg[_raw_output_header.size:]
+
+def pack_raw_input(task_id: int, payload: bytes) -> bytes:
+    return _raw_input_header.pack(task_id)+payload
+
+def unpack_raw_input(msg: bytes) -> tuple[int, bytes]:
+    return _raw_input_header.unpack_from(msg)[0], msg[_raw_input_header.size:]
+
+
+
+# output of a running process is read in blocks of this size, and sent to the master once
+# the flush interval (s) has passed since the first unsent read or once this many bytes are waiting
+_output_read_size       = 64*1024
+_output_flush_size      = 64*1024
+_output_flush_interval  = 0.02
 
+# every task is given a file in which it can write results, one JSON record per line. Its path is
+# provided in this environment variable. Records are forwarded to the master as they are written
+results_env_var         = 'LABMANAGER_RESULTS_FILE'
+_results_poll_interval  = 0.1   # s
+
+# interval (s) at which a task's resource use is checked against its limits
+_limit_check_interval   = 0.25
+
+# pseudo-terminals for interactive tasks are only available on POSIX
+pty_supported           = not sys.platform.startswith('win')
+_pty_default_size       = (24, 80)  # rows, columns
+_pty_eof                = b'\x04'  # Ctrl-D, sent when master closes the input of a task running in a pseudo-terminal
 
 # create instances through Executor.run()
 class Executor:
-    def __init__(self):
+    def __init__(self, stats_interval: float = 1.):
         self._proc: asyncio.subprocess.Process = None
         self._input: asyncio.Queue = None
+        self._stats_interval = stats_interval   # s, 0 or None to not report resource usage
+        self._usage: ResourceUsage = None
+        self._usage_per_proc: dict[int, tuple[float,int,int]] = {}
+        self._usage_offset: tuple[float,int,int] = (0., 0, 0)
+        self._start_time: float = None
+        self._results_file: str = None
+        self._limits: Limits = None
+        self._limit_exceeded: str = None
+        self._output_bytes = 0
+        self._raw_output = False
 
-    async def _read_stream(self, stream: asyncio.streams.StreamReader, stream_type: StreamType, writer, task_id):
-        full_line = b''
-        while True:
-            line = await stream.read(20)
-            if line:
-                try:
-                    msg = (full_line+line).decode('utf8')
-                except UnicodeDecodeError as exc:
-                    if len(full_line)+len(line)==exc.end:
-                        # our read split a utf8 codepoint in two
-                        # add to next read and try again
-                        full_line += line
-                        msg = None
-                    else:
-                        # replace string with error message
-                        msg = '<UnicodeDecodeError>'
-                finally:
-                    if msg is None:
+    async def _read_stream(self, stream: asyncio.streams.StreamReader, stream_type: StreamType, writer, task_id, terminator: bytes = None, flush_interval: float = None) -> bytes|None:
+        # read in large blocks and coalesce output, so that chatty processes
+        # don't flood the connection with tiny messages. Buffered output is
+        # sent once _output_flush_interval has passed since the first unsent
+        # read, or once _output_flush_size bytes are waiting. An incremental
+        # decoder takes care of utf8 codepoints split over two reads. For
+        # raw output, no decoding is done and bytes are sent.
+        # If a terminator is provided, reading stops once it is encountered
+        # and whatever followed it in the last read is returned
+        if flush_interval is None:
+            flush_interval = _output_flush_interval
+        if self._raw_output:
+            decode  = lambda data, final=False: data
+            join    = b''.join
+        else:
+            decode  = codecs.getincrementaldecoder('utf8')(errors='replace').decode
+            join    = ''.join
+        buffer  = []
+        buf_size= 0
+        deadline= None
+        read    = None
+        carry   = b''   # possible start of terminator, held back until next read
+        remainder = None
+        try:
+            while True:
+                if read is None:
+                    read = asyncio.create_task(stream.read(_output_read_size))
+                timeout = None if deadline is None else max(deadline-time.monotonic(), 0.)
+                done, _ = await asyncio.wait([read], timeout=timeout)
+                if done:
+                    try:
+                        data = read.result()
+                    except OSError:
+                        # reading a pseudo-terminal fails once the process has exited, treat as end of stream
+                        data = b''
+                    read = None
+                    if not data:
+                        # stream closed: everything that is left is sent below as one message
+                        break
+                    buf_size += len(data)
+                    self._output_bytes += len(data)
+                    if self._limits and self._limits.max_output is not None and self._output_bytes>self._limits.max_output:
+                        self._on_limit_exceeded('max_output')
+                    if terminator:
+                        data = carry+data
+                        if (idx := data.find(terminator))!=-1:
+                            remainder = data[idx+len(terminator):]
+                            carry = b''
+                            buffer.append(decode(data[:idx]))
+                            break
+                        keep = min(len(terminator)-1, len(data))
+                        data, carry = data[:len(data)-keep], data[len(data)-keep:]
+                    buffer.append(decode(data))
+                    if deadline is None:
+                        deadline = time.monotonic()+flush_interval
+                    if buf_size<_output_flush_size and time.monotonic()<deadline:
                         continue
-                    full_line = b''
-                    await comms.typed_send(
-                        writer,
-                        message.Message.TASK_OUTPUT,
-                        {'task_id': task_id, 'stream_type': stream_type, 'output': msg}
-                    )
-            else:
-                break
 
-    async def _write_stream(self, stream):
+                # flush interval elapsed or buffer full, send
+                await self._send_output(writer, task_id, stream_type, join(buffer))
+                buffer.clear()
+                buf_size = 0
+                deadline = None
+        finally:
+            if read is not None:
+                read.cancel()
+
+        buffer.append(decode(carry, final=True))
+        await self._send_output(writer, task_id, stream_type, join(buffer))
+        return remainder
+
+    async def _send_output(self, writer, task_id, stream_type: StreamType, output: str|bytes):
+        if not output:
+            return
+        if isinstance(output, bytes):
+            await comms.typed_send(
+                writer,
+                message.Message.TASK_OUTPUT_RAW,
+                pack_raw_output(task_id, stream_type, output)
+            )
+            return
+        await comms.typed_send(
+            writer,
+            message.Message.TASK_OUTPUT,
+            {'task_id': task_id, 'stream_type': stream_type, 'output': output}
+        )
+
+    async def _write_stream(self, stream, eof: bytes = None):
+        # input is str or, to pass through data as is, bytes. None closes the
+        # stream, or, if provided, sends eof instead
         while True:
             input = await self._input.get()
             if input is not None:
-                stream.write(input.encode())
+                stream.write(input if isinstance(input, bytes) else input.encode())
                 await stream.drain()
             else:
                 break
-        stream.close()
+        if eof is not None:
+            stream.write(eof)
+            await stream.drain()
+        else:
+            stream.close()
 
-    async def _stream_subprocess(self, id, use_shell, cmd, cwd, env, interactive, writer, cleanup=None):
+    async def _stream_subprocess(self, id, use_shell, cmd, cwd, env, interactive, writer, cleanup=None, result_file=None, use_pty=False, running_task: RunningTask=None):
+        # where available, let the OS enforce the CPU time limit as well, as a backstop
+        # for sampling. NB: applies to each process in the tree separately
+        cpu_limit = self._limits.cpu_time if self._limits and not sys.platform.startswith('win') else None
+        extra = {}
+        if use_pty:
+            # process gets the terminal as stdin, stdout and stderr, and in its own
+            # session so that the terminal can become its controlling terminal
+            pty_fd, tty_fd = pty.openpty()
+            self._resize_pty(pty_fd, *_pty_default_size)
+            stdin = stdout = stderr = tty_fd
+            extra['start_new_session'] = True
+        else:
+            stdin  = asyncio.subprocess.PIPE if interactive else None
+            stdout = stderr = asyncio.subprocess.PIPE
+        if cpu_limit is not None or use_pty:
+            extra['preexec_fn'] = functools.partial(_prepare_child, cpu_limit, use_pty)
         try:
             if use_shell:
                 self._proc = await asyncio.create_subprocess_shell(
                     cmd,
-                    stdin=asyncio.subprocess.PIPE if interactive else None,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
                     cwd=None if not cwd else cwd,
                     env=None if not env else env,
+                    **extra
                 )
             else:
                 self._proc = await asyncio.create_subprocess_exec(
                     *cmd,
-                    stdin=asyncio.subprocess.PIPE if interactive else None,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
                     cwd=None if not cwd else cwd,
                     env=None if not env else env,
+                    **extra
                 )
         except Exception as exc:
+            if use_pty:
+                os.close(pty_fd)
             await self._handle_error(exc, id, writer)
             # we're done
             return None
+        finally:
+            if use_pty:
+                # only the child should have the terminal side open, so that we get EOF once it exits
+                os.close(tty_fd)
 
-        # send that we're running
-        await comms.typed_send(
-            writer,
-            message.Message.TASK_UPDATE,
-            {'task_id': id, 'status': structs.Status.Running}
-        )
+        if use_pty:
+            pipe = self._pipe_pty(id, pty_fd, running_task, writer)
+        else:
+            pipe = self._pipe_process(id, interactive, writer)
+        return await self._supervise(id, writer, pipe, cleanup, result_file)
+
+    async def _pipe_pty(self, id, pty_fd, running_task: RunningTask, writer) -> int:
+        # forward everything the terminal outputs as is and right away (e.g. echo of
+        # typed characters), there is no separate stderr. Input is passed through as is
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        read_transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(pty_fd, 'rb', 0))
+        write_transport, write_protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(os.dup(pty_fd), 'wb', 0))
+        stream = asyncio.StreamWriter(write_transport, write_protocol, None, loop)
+        if running_task:
+            running_task.resize = functools.partial(self._resize_pty, pty_fd)
+
+        input_task = asyncio.create_task(self._write_stream(stream, eof=_pty_eof))
+        try:
+            await self._read_stream(reader, StreamType.STDOUT, writer, id, flush_interval=0.)
+        finally:
+            if running_task:
+                running_task.resize = None
+            input_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await input_task
+            write_transport.close()
+            read_transport.close()
+
+        # wait for return code to become available
+        return await self._proc.wait()
+
+    @staticmethod
+    def _resize_pty(pty_fd, rows: int, cols: int):
+        # the process is sent SIGWINCH by the OS
+        fcntl.ioctl(pty_fd, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
 
+    async def _pipe_process(self, id, interactive, writer) -> int:
         # listen to output streams and forward to master
         tasks = [
             asyncio.create_task(self._read_stream(self._proc.stdout, StreamType.STDOUT, writer, id)),
@@ -301,18 +1043,98 @@ class Executor:
         ]
         if interactive:
             tasks.append(asyncio.create_task(self._write_stream(self._proc.stdin)))
-        await asyncio.wait(tasks)
+        try:
+            await asyncio.wait(tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+        # wait for return code to become available
+        return await self._proc.wait()
+
+    async def _set_usage_baseline(self):
+        # process has been running for a while (warm worker), only count resources used from here on
+        await asyncio.to_thread(self._sample_resources)
+        if self._usage:
+            self._usage_offset = (self._usage.cpu_time, self._usage.read_bytes, self._usage.write_bytes)
+            self._usage = None
+
+    async def _stream_worker(self, id, pool: python_worker.WorkerPool, worker: python_worker.Worker, sentinel: bytes, writer, cleanup=None, result_file=None):
+        reusable = False
+        try:
+            return_code = await self._supervise(id, writer, self._pipe_worker(id, sentinel, writer), cleanup, result_file)
+            reusable = self._limit_exceeded is None
+            return return_code
+        finally:
+            if not reusable:
+                # also get rid of anything the job started
+                self._kill_tree()
+            pool.release(worker, reusable)
+
+    async def _pipe_worker(self, id, sentinel, writer) -> int:
+        # forward output until the job's end-of-job sentinel, return code follows it on stdout
+        out, _ = await asyncio.gather(
+            self._read_stream(self._proc.stdout, StreamType.STDOUT, writer, id, terminator=sentinel),
+            self._read_stream(self._proc.stderr, StreamType.STDERR, writer, id, terminator=sentinel)
+        )
+        if out is None:
+            # worker exited during the job
+            return await self._proc.wait()
+        if not out.endswith(b'\n'):
+            out += await self._proc.stdout.readuntil(b'\n')
+        return int(out)
 
-        # wait for return code to become available and forward to master
-        return_code = await self._proc.wait()
+    async def _supervise(self, id, writer, pipe: Coroutine, cleanup=None, result_file=None) -> int:
+        self._start_time = time.monotonic()
+
+        # send that we're running
         await comms.typed_send(
             writer,
             message.Message.TASK_UPDATE,
-            {
-                'task_id': id,
-                'status': structs.Status.Finished if return_code==0 else structs.Status.Errored,
-                'return_code': return_code
-            }
+            {'task_id': id, 'status': structs.Status.Running}
+        )
+        monitor = asyncio.create_task(self._monitor_resources(id, writer)) if self._stats_interval or self._has_sampled_limits() else None
+        if self._limits and self._limits.wall_time is not None:
+            wall_timer = asyncio.get_running_loop().call_later(self._limits.wall_time, self._on_limit_exceeded, 'wall_time')
+        else:
+            wall_timer = None
+        if self._results_file:
+            results_done = asyncio.Event()
+            results = asyncio.create_task(self._forward_results(id, writer, results_done))
+        else:
+            results = None
+
+        try:
+            return_code = await pipe
+        except BaseException:
+            if results:
+                results.cancel()
+            raise
+        finally:
+            if monitor:
+                monitor.cancel()
+            if wall_timer:
+                wall_timer.cancel()
+
+        # forward remaining results, final resource usage, return value if any, and return code to master
+        if results:
+            results_done.set()
+            await results
+        if self._stats_interval:
+            await self._send_resource_usage(id, writer, sample=False)
+        if result_file:
+            await self._send_return_value(id, writer, result_file)
+        update = {
+            'task_id': id,
+            'status': structs.Status.Finished if return_code==0 and not self._limit_exceeded else structs.Status.Errored,
+            'return_code': return_code
+        }
+        if self._limit_exceeded:
+            update['limit'] = self._limit_exceeded
+        await comms.typed_send(
+            writer,
+            message.Message.TASK_UPDATE,
+            update
         )
 
         # clean up if needed
@@ -321,7 +1143,16 @@ class Executor:
 
         return return_code
 
-    async def run(self, id: int, tsk_type: Type, payload: str, cwd: str, env: dict, interactive: bool, python_unbuf: bool, running_task: RunningTask, writer):
+    async def run(self, id: int, tsk_type: Type, payload: str, cwd: str, env: dict, interactive: bool, python_unbuf: bool, running_task: RunningTask, writer, payload_file: pathlib.Path = None, worker_pool: python_worker.WorkerPool = None, limits: Limits = None, use_pty: bool = False, raw_output: bool = False):
+        # payload_file: for cached_payload_types, file containing the payload (e.g. from a payload_cache.PayloadCache).
+        # If not provided, the payload is written to a temporary folder which is removed once the task finishes
+        # worker_pool: if provided, non-interactive Python_module and Python_script tasks that do not set
+        # environment variables are run by a warm worker from this pool, if one is available
+        # limits: if provided, the task's process tree is killed when it exceeds one of these
+        # use_pty: run interactive task in a pseudo-terminal, if supported (see pty_supported)
+        # raw_output: send output as is, without decoding it
+        self._raw_output = raw_output
+        self._limits = limits
         # setup executor
         match tsk_type:
             case Type.Shell_command:
@@ -330,7 +1161,8 @@ class Executor:
                 use_shell = False
 
         # build command line
-        filename = None
+        filename    = None
+        result_file = None
         match tsk_type:
             case Type.Shell_command:
                 # run command in shell
@@ -340,9 +1172,10 @@ class Executor:
                 cmd = shlex.split(payload, posix=False)
             case Type.Batch_file:
                 # invoke batch file
-                folder   = pathlib.Path(f'task{id}')
-                filename = (folder/'script.bat').resolve()
-                cmd = [str(filename)]
+                if not payload_file:
+                    folder   = pathlib.Path(f'task{id}')
+                    filename = (folder/'script.bat').resolve()
+                cmd = [str(payload_file or filename)]
             case Type.Python_module:
                 # sys.executable + '-m' + '-u' for unbuffered so that we get all output to stdout/stderr piped to us directly
                 cmd = [sys.executable, '-m']
@@ -351,12 +1184,22 @@ class Executor:
                 cmd += shlex.split(payload, posix=False)
             case Type.Python_script:
                 # sys.executable + '-u' for unbuffered so that we get all output to stdout/stderr piped to us directly
-                folder   = pathlib.Path(f'task{id}')
-                filename = (folder/'script.py').resolve()
+                if not payload_file:
+                    folder   = pathlib.Path(f'task{id}')
+                    filename = (folder/'script.py').resolve()
                 cmd = [sys.executable]
                 if python_unbuf:
                     cmd += ['-u']
-                cmd += [str(filename)]
+                cmd += [str(payload_file or filename)]
+            case Type.Python_function:
+                # call function in a new python process, which writes the return value to a file
+                folder      = pathlib.Path(f'task{id}')
+                filename    = (folder/'call.txt').resolve()
+                result_file = (folder/'return.txt').resolve()
+                cmd = [sys.executable]
+                if python_unbuf:
+                    cmd += ['-u']
+                cmd += ['-m', python_worker.__name__, '--call', str(filename), str(result_file)]
             case _:
                 raise ValueError(f'Task type {tsk_type} not understood')
 
@@ -368,46 +1211,238 @@ class Executor:
             await folder.mkdir()
             await aiopath.AsyncPath(filename).write_text(payload)
 
+        # make results file, and tell task where it is
+        fd, self._results_file = tempfile.mkstemp(prefix=f'labManager_task{id}_', suffix='_results.jsonl')
+        os.close(fd)
+        results_env = {results_env_var: self._results_file}
+
         # prep for input stream, if needed
         if interactive:
             self._input = running_task.input = asyncio.Queue()
 
         # TODO: deal with env argument. Should probably get current env and append to it/overwrite, not replace
 
+        # python tasks can be run by a warm worker, if available
+        worker = None
+        if worker_pool and tsk_type in [Type.Python_module, Type.Python_script, Type.Python_function] and not interactive and not env:
+            worker = worker_pool.try_acquire()
+
         # create coro to execute the command, await it to execute it
         try:
+            if worker:
+                match tsk_type:
+                    case Type.Python_module:
+                        kind, target = 'module', payload
+                    case Type.Python_script:
+                        kind, target = 'script', str(payload_file or filename)
+                    case Type.Python_function:
+                        kind, target = 'function', str(filename)
+                self._proc = worker.proc
+                await self._set_usage_baseline()
+                try:
+                    sentinel = await worker.submit(kind, target, cwd, str(result_file) if result_file else None, results_env)
+                except ConnectionError:
+                    # worker died in the meantime, run in a new process instead
+                    worker_pool.release(worker, False)
+                    self._proc = None
+                    self._usage_per_proc.clear()
+                    self._usage_offset = (0., 0, 0)
+                else:
+                    return await self._stream_worker(id, worker_pool, worker, sentinel, writer, cleanup=filename, result_file=result_file)
             return await self._stream_subprocess(
                 id,
                 use_shell,
                 cmd,
                 cwd,
-                env,
+                {**(env or os.environ), **results_env},
                 interactive,
                 writer,
-                cleanup=filename
+                cleanup=filename,
+                result_file=result_file,
+                use_pty=use_pty and interactive and pty_supported,
+                running_task=running_task
             )
         except asyncio.CancelledError as exc:
-            # notify master about cancellation and terminate task if necessary
+            # notify master about cancellation and kill task (including anything it started) if necessary
             await self._handle_error(exc, id, writer)
-            if self._proc:
-                self._proc.terminate()
+            if self._proc and self._proc.returncode is None:
+                self._kill_tree()
                 await self._proc.wait()
             raise   # as far as i understand the docs, this Exception should be propagated
+        finally:
+            with contextlib.suppress(OSError):
+                os.unlink(self._results_file)
 
-    async def _handle_error(self, exc, id, writer):
-            tb_lines = traceback.format_exception(exc)
-            # send error text
-            await comms.typed_send(
-                writer,
-                message.Message.TASK_OUTPUT,
-                {'task_id': id, 'stream_type': StreamType.STDERR, 'output': "".join(tb_lines)}
-            )
-            # send error status
+    async def _monitor_resources(self, id, writer):
+        # samples resource use, to report it to the master every stats interval
+        # and to check it against the task's limits
+        check_limits = self._has_sampled_limits()
+        interval = min(i for i in [self._stats_interval, _limit_check_interval if check_limits else None] if i)
+        # sample once right away, so that short-lived tasks also get some figures
+        await asyncio.to_thread(self._sample_resources)
+        last_report = time.monotonic()
+        while True:
+            if check_limits:
+                self._check_limits()
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self._sample_resources)
+            if self._stats_interval and time.monotonic()-last_report>=self._stats_interval-interval/2:
+                last_report = time.monotonic()
+                await self._send_resource_usage(id, writer, sample=False)
+
+    def _has_sampled_limits(self):
+        return self._limits is not None and (self._limits.cpu_time is not None or self._limits.max_rss is not None)
+
+    def _check_limits(self):
+        if self._usage is None:
+            return
+        if self._limits.cpu_time is not None and self._usage.cpu_time>self._limits.cpu_time:
+            self._on_limit_exceeded('cpu_time')
+        elif self._limits.max_rss is not None and self._usage.rss>self._limits.max_rss:
+            self._on_limit_exceeded('max_rss')
+
+    def _on_limit_exceeded(self, limit: str):
+        if self._limit_exceeded:
+            # already dealt with
+            return
+        self._limit_exceeded = limit
+        self._kill_tree()
+
+    def _kill_tree(self):
+        # kill process and everything it started. Collect the tree first, as
+        # children of a killed process can no longer be found
+        if not self._proc or self._proc.returncode is not None:
+            return
+        try:
+            root  = psutil.Process(self._proc.pid)
+            procs = [root]+root.children(recursive=True)
+        except psutil.Error:
+            return
+        for p in procs:
+            with contextlib.suppress(psutil.Error):
+                p.kill()
+
+    async def _send_resource_usage(self, id, writer, sample=True):
+        if sample:
+            await asyncio.to_thread(self._sample_resources)
+        if self._usage is None:
+            # process exited before it could be sampled, still report wall time
+            self._usage = ResourceUsage()
+        self._usage.wall_time = time.monotonic()-self._start_time
+        await comms.typed_send(
+            writer,
+            message.Message.TASK_STATS,
+            {'task_id': id, 'stats': dataclasses.asdict(self._usage)}
+        )
+
+    def _sample_resources(self):
+        try:
+            root  = psutil.Process(self._proc.pid)
+            procs = [root]+root.children(recursive=True)
+        except psutil.Error:
+            # process has already exited
+            return
+        if self._usage is None:
+            self._usage = ResourceUsage()
+
+        rss = 0
+        for p in procs:
+            try:
+                with p.oneshot():
+                    cpu = p.cpu_times()
+                    mem = p.memory_info()
+                    io  = p.io_counters() if hasattr(p, 'io_counters') else None
+            except psutil.Error:
+                continue
+            rss += mem.rss
+            # keep last known values for each process, so that usage of
+            # children that have exited still counts towards the total
+            self._usage_per_proc[p.pid] = (cpu.user+cpu.system, io.read_bytes if io else 0, io.write_bytes if io else 0)
+
+        self._usage.rss         = rss
+        self._usage.peak_rss    = max(self._usage.peak_rss, rss)
+        self._usage.cpu_time    = sum(u[0] for u in self._usage_per_proc.values())-self._usage_offset[0]
+        self._usage.read_bytes  = sum(u[1] for u in self._usage_per_proc.values())-self._usage_offset[1]
+        self._usage.write_bytes = sum(u[2] for u in self._usage_per_proc.values())-self._usage_offset[2]
+
+    async def _forward_results(self, id, writer, process_done: asyncio.Event):
+        # tail the results file, forwarding complete lines. Once the process is done,
+        # an unterminated last line is forwarded as well
+        # NB: file is opened and read in a thread, so as not to block the event loop
+        f = await asyncio.to_thread(open, self._results_file, 'rb')
+        try:
+            partial = b''
+            while True:
+                final = process_done.is_set()
+                lines = (partial+await asyncio.to_thread(f.read)).split(b'\n')
+                partial = lines.pop()
+                if final and partial.strip():
+                    lines.append(partial)
+                await self._send_results(id, writer, lines)
+                if final:
+                    return
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(process_done.wait(), _results_poll_interval)
+        finally:
+            f.close()
+
+    async def _send_results(self, id, writer, lines: list[bytes]):
+        records, invalid = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                invalid.append(f'labManager: ignoring result record that is not valid JSON: {line.decode("utf8", errors="replace").rstrip()}\n')
+        if records:
             await comms.typed_send(
                 writer,
-                message.Message.TASK_UPDATE,
-                {'task_id': id, 'status': structs.Status.Errored}
+                message.Message.TASK_RESULT,
+                {'task_id': id, 'results': records}
             )
+        if invalid:
+            await self._send_output(writer, id, StreamType.STDERR, ''.join(invalid))
+
+    async def _send_return_value(self, id, writer, result_file: pathlib.Path):
+        try:
+            result = await aiopath.AsyncPath(result_file).read_text()
+        except FileNotFoundError:
+            # process exited before the function returned
+            return
+        await comms.typed_send(
+            writer,
+            message.Message.TASK_RETURN,
+            {'task_id': id, 'result': result}
+        )
+
+    async def _handle_error(self, exc, id, writer):
+        await send_error(exc, id, writer)
+
+def _prepare_child(cpu_time: float|None, set_controlling_tty: bool):
+    # runs in the child process before the task is executed
+    if cpu_time is not None:
+        # soft limit sends SIGXCPU, the hard limit a second later SIGKILL
+        soft = max(math.ceil(cpu_time), 1)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft+1))
+    if set_controlling_tty:
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+
+async def send_error(exc: Exception, id: int, writer):
+    # report error to master: send traceback as task output and set task to errored
+    tb_lines = traceback.format_exception(exc)
+    # send error text
+    await comms.typed_send(
+        writer,
+        message.Message.TASK_OUTPUT,
+        {'task_id': id, 'stream_type': StreamType.STDERR, 'output': "".join(tb_lines)}
+    )
+    # send error status
+    await comms.typed_send(
+        writer,
+        message.Message.TASK_UPDATE,
+        {'task_id': id, 'status': structs.Status.Errored}
+    )
 
 async def send(task: Task|TaskGroup, client: list[structs.Client]|structs.Client):
     if isinstance(task, TaskGroup):
@@ -425,22 +1460,98 @@ async def send(task: Task|TaskGroup, client: list[structs.Client]|structs.Client
             await wol.send_magic_packet(*client.MACs)
             task.status = structs.Status.Finished   # This task is finished once its sent
         elif client.online:
+            msg = _get_create_message(task)
+            msg['task_id'] = task.id
+            await comms.typed_send(client.online.writer, message.Message.TASK_CREATE, msg)
+
+async def send_group(task_group: TaskGroup, clients: dict[int, structs.Client]):
+    # Send the tasks of a group to all its clients that are online. As the tasks are identical apart
+    # from their id, a single message is sent to all clients containing the task once together with
+    # the task id for each client (which picks out its own), so that it only needs to be serialized once
+    tasks = {c:t for c,t in task_group.tasks.items() if c in clients and clients[c].online}
+    if not tasks:
+        return
+    msg = _get_create_message(next(iter(tasks.values())))
+    msg['task_ids'] = {c:t.id for c,t in tasks.items()}
+    data = comms.prepare_typed(message.Message.TASK_GROUP_CREATE, msg)
+    await asyncio.gather(*(comms.send_prepared(clients[c].online.writer, data) for c in tasks))
+
+def _get_create_message(task: Task):
+    return {
+        'type': task.type,
+        'payload': task.payload if task.type not in cached_payload_types else None,
+        'payload_hash': _get_payload_hash(task),
+        'cwd': task.cwd,
+        'env': task.env,
+        'interactive': task.interactive,
+        'pty': task.pty,
+        'raw_output': task.raw_output,
+        'placeholders': task.placeholders,
+        'python_unbuf': task.python_unbuf,
+        'priority': task.priority,
+        'limits': dataclasses.asdict(task.limits) if task.limits else None,
+    }
+
+def expand_placeholders(text: str, values: dict[str, Any]) -> str:
+    # replace {name} in text for each name in values. Anything else in braces
+    # is left alone, so text does not need to escape its other braces
+    for name,value in values.items():
+        text = text.replace('{'+name+'}', str(value))
+    return text
+
+def _get_payload_hash(task: Task):
+    if task.type not in cached_payload_types:
+        return None
+    if task.payload_hash is None:
+        task.payload_hash = payload_cache.digest(task.payload)
+    return task.payload_hash
+
+async def send_payload(client: structs.ConnectedClient, task: Task):
+    # send payload in response to a TASK_PAYLOAD_REQUEST
+    await comms.typed_send(
+        client.writer,
+        message.Message.TASK_PAYLOAD,
+        {
+            'task_id': task.id,
+            'payload': task.payload,
+        }
+    )
+
+async def send_payload_error(client: structs.ConnectedClient, task_id: int, error: str):
+    # reply to a TASK_PAYLOAD_REQUEST that cannot be served, e.g. for an unknown task
+    await comms.typed_send(
+        client.writer,
+        message.Message.TASK_PAYLOAD,
+        {
+            'task_id': task_id,
+            'error': error,
+        }
+    )
+
+def make_call_payload(func: Callable, *args, **kwargs) -> str:
+    # payload for a Python_function task calling func(*args, **kwargs)
+    return python_worker.serialize((func, args, kwargs))
+
+def load_return_value(task: Task, result: str):
+    # store contents of a TASK_RETURN message in the task
+    try:
+        result = python_worker.deserialize(result)
+    except Exception as exc:
+        task.return_error = 'Return value could not be deserialized:\n'+''.join(traceback.format_exception(exc))
+        return
+    task.return_value = result.get('value')
+    task.return_error = result.get('error')
+
+async def send_input(payload: str|bytes, client, task: Task):
+    # bytes are passed to the task as is
+    if client.online:
+        if isinstance(payload, (bytes, bytearray)):
             await comms.typed_send(
                 client.online.writer,
-                message.Message.TASK_CREATE,
-                {
-                    'task_id': task.id,
-                    'type': task.type,
-                    'payload': task.payload,
-                    'cwd': task.cwd,
-                    'env': task.env,
-                    'interactive': task.interactive,
-                    'python_unbuf': task.python_unbuf,
-                }
+                message.Message.TASK_INPUT_RAW,
+                pack_raw_input(task.id, payload)
             )
-
-async def send_input(payload, client, task: Task):
-    if client.online:
+            return
         await comms.typed_send(
             client.online.writer,
             message.Message.TASK_INPUT,
@@ -450,6 +1561,25 @@ async def send_input(payload, client, task: Task):
             }
         )
 
+async def stream_input(source: BinaryIO, client, task: Task, chunk_size: int = 256*1024):
+    # send contents of a binary file object to the task's stdin, in chunks. Sending
+    # waits for the connection to drain, so the source is read no faster than it is sent
+    while client.online and (chunk := await asyncio.to_thread(source.read, chunk_size)):
+        await send_input(chunk, client, task)
+
+async def send_resize(rows: int, cols: int, client, task: Task):
+    # change window size of a task running in a pseudo-terminal
+    if client.online:
+        await comms.typed_send(
+            client.online.writer,
+            message.Message.TASK_RESIZE,
+            {
+                'task_id': task.id,
+                'rows': rows,
+                'cols': cols,
+            }
+        )
+
 async def send_cancel(client, task: Task):
     if client.online:
         await comms.typed_send(
@@ -460,14 +1590,15 @@ async def send_cancel(client, task: Task):
             }
         )
 
-def create_group(tsk_type: str|Type, payload: str, clients: list[int], cwd: str=None, env: dict=None, interactive=False, python_unbuf=False) -> tuple[TaskGroup, bool]:
+def create_group(tsk_type: str|Type, payload: str, clients: list[int], cwd: str=None, env: dict=None, interactive=False, python_unbuf=False, priority=0, limits: Limits=None, pty=False, raw_output=False, placeholders=False) -> tuple[TaskGroup, bool]:
     tsk_type = Type.get(tsk_type)
     task_group = TaskGroup(tsk_type)
+    payload_hash = payload_cache.digest(payload) if tsk_type in cached_payload_types else None
 
     # make individual tasks
     for c in clients:
         # create task
-        task = Task(tsk_type, payload, cwd=cwd, env=env, interactive=interactive, python_unbuf=python_unbuf, client=c, task_group_id=task_group.id)
+        task = Task(tsk_type, payload, cwd=cwd, env=env, interactive=interactive, pty=pty, raw_output=raw_output, placeholders=placeholders, python_unbuf=python_unbuf, priority=priority, limits=limits, payload_hash=payload_hash, client=c, task_group_id=task_group.id)
         # add to task group
         task_group.add_task(c,task)
 
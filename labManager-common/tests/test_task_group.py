@@ -0,0 +1,35 @@
+from labManager.common import task, structs
+
+
+def _finish(tsk: task.Task, output: str, return_code: int = 0):
+    tsk.status = structs.Status.Running
+    tsk.add_output(output)
+    tsk.return_code = return_code
+    tsk.status = structs.Status.Finished
+
+def _summary(tg: task.TaskGroup) -> list[tuple[list[int], str]]:
+    return [(sorted(g.clients), g.task.get_output()) for g in tg.output_summary()]
+
+
+def test_output_summary_groups_identical_output():
+    tg = task.create_group(task.Type.Shell_command, 'echo hi', [1, 2, 3])
+    for c in [1, 2]:
+        _finish(tg.tasks[c], 'hi\n')
+    _finish(tg.tasks[3], 'ho\n')
+    assert _summary(tg)==[([1, 2], 'hi\n'), ([3], 'ho\n')]
+
+def test_output_summary_output_added_after_done():
+    tg = task.create_group(task.Type.Shell_command, 'echo hi', [1, 2, 3])
+    for c in tg.tasks:
+        _finish(tg.tasks[c], 'hi\n')
+    assert _summary(tg)==[([1, 2, 3], 'hi\n')]
+
+    # output arriving after the task finished moves it to its own group
+    tg.tasks[3].add_output('late\n')
+    assert _summary(tg)==[([1, 2], 'hi\n'), ([3], 'hi\nlate\n')]
+
+    # and tasks that end up with the same output are grouped again
+    tg.tasks[2].add_output('late\n')
+    assert _summary(tg)==[([2, 3], 'hi\nlate\n'), ([1], 'hi\n')]
+    tg.tasks[1].add_output('late\n')
+    assert _summary(tg)==[([1, 2, 3], 'hi\nlate\n')]
@@ -1,5 +1,7 @@
 import asyncio
+import codecs
 import concurrent
+import copy
 import json
 import time
 import math
@@ -98,6 +100,7 @@ class MainGUI:
         self._computer_GUI_interactive_tasks: dict[tuple[int,int],str] = {}
         self._computer_GUI_interactive_history: dict[tuple[int,int],History] = {}
         self._computer_GUI_interactive_sent_finish: dict[tuple[int,int],bool] = {}
+        self._computer_GUI_pty_size: dict[tuple[int,int],tuple[int,int]] = {}
         self._computer_GUI_command_copy_t = None
         self._computer_GUI_cwd_copy_t = None
 
@@ -646,6 +649,13 @@ class MainGUI:
         for t in to_del:
             del self._computer_GUI_interactive_history[t]
 
+        to_del = []
+        for t in self._computer_GUI_pty_size:
+            if t[0]==client_id:
+                to_del.append(t)
+        for t in to_del:
+            del self._computer_GUI_pty_size[t]
+
     def _task_status_changed(self, _, client_id: int, tsk: task.Task):
         key = (client_id, tsk.id)
         if tsk.status in [structs.Status.Finished, structs.Status.Errored]:
@@ -655,6 +665,8 @@ class MainGUI:
                 del self._computer_GUI_interactive_sent_finish[key]
             if key in self._computer_GUI_interactive_history:
                 del self._computer_GUI_interactive_history[key]
+            if key in self._computer_GUI_pty_size:
+                del self._computer_GUI_pty_size[key]
 
     def _draw_about_popup(self):
         def popup_content():
@@ -811,6 +823,8 @@ class MainGUI:
         imgui.end()
         if imgui.begin('task_type_pane'):
             for t in task.Type:
+                if t==task.Type.Python_function:
+                    continue    # only available through the API
                 if imgui.radio_button(t.value, self._task_prep.type==t):
                     old_type = self._task_prep.type
                     self._task_prep.type = t
@@ -1101,9 +1115,50 @@ class MainGUI:
                     utils.pop_disabled()
                 _, self._task_prep.interactive = imgui.checkbox('Interactive', self._task_prep.interactive)
                 utils.draw_hover_text('If enabled, it is possible to send input (stdin) to the running command',text='')
+                if self._task_prep.interactive:
+                    imgui.same_line()
+                    _, self._task_prep.pty = imgui.checkbox('Terminal', self._task_prep.pty)
+                    utils.draw_hover_text('If enabled, the command is run in a pseudo-terminal, so that it behaves as when used in a terminal (e.g. shows prompts, echoes input and does not buffer its output). Only supported by clients running on Linux or macOS, others run the command without terminal',text='')
+                if self._task_prep.type!=task.Type.Wake_on_LAN:
+                    _, self._task_prep.raw_output = imgui.checkbox('Raw output', self._task_prep.raw_output)
+                    utils.draw_hover_text('If enabled, the output of the command is transferred as is and only decoded when viewed, with an encoding that can be chosen in the task result view. Use when the command does not produce UTF-8 output',text='')
+                    imgui.same_line()
+                    _, self._task_prep.placeholders = imgui.checkbox('Placeholders', self._task_prep.placeholders)
+                    utils.draw_hover_text('If enabled, {hostname} and {client_id} in the command, working directory and environment variables are replaced on each computer by its name and its id',text='')
                 if self._task_prep.type in [task.Type.Python_module, task.Type.Python_script]:
                     _, self._task_prep.python_unbuf = imgui.checkbox('Unbuffered mode', self._task_prep.python_unbuf)
                     utils.draw_hover_text('If enabled, the "-u" switch is specified for the python call, so that all output of the process is directly visible in the task result view',text='')
+                if self._task_prep.type!=task.Type.Wake_on_LAN:
+                    imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                    _, self._task_prep.priority = imgui.input_int('Priority', self._task_prep.priority)
+                    utils.draw_hover_text('Clients run a limited number of tasks at the same time and queue the rest. Tasks with a higher priority are started first',text='')
+                    changed, staggered = imgui.checkbox('Staggered launch', self._task_prep.schedule is not None)
+                    utils.draw_hover_text('If enabled, the task is not launched on all selected computers at once, but on a limited number at a time and/or in waves. Use e.g. for heavy installs that would otherwise overload the network or a shared drive',text='')
+                    if changed:
+                        self._task_prep.schedule = task.Schedule() if staggered else None
+                    if (sched:=self._task_prep.schedule) is not None:
+                        imgui.indent()
+                        imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                        _, val = imgui.input_int('Max running', sched.max_in_flight or 0)
+                        sched.max_in_flight = max(val,0) or None
+                        utils.draw_hover_text('Maximum number of computers running the task at the same time (0: no maximum)',text='')
+                        imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                        _, val = imgui.input_int('Wave size', sched.wave_size or 0)
+                        sched.wave_size = max(val,0) or None
+                        utils.draw_hover_text('Launch in waves of this many computers, a wave starts once the task is done on all computers of the previous wave (0: single wave)',text='')
+                        if sched.wave_size:
+                            imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                            _, val = imgui.input_float('Wave pause (s)', sched.wave_pause)
+                            sched.wave_pause = max(val,0.)
+                        imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                        _, val = imgui.input_int('Retries', sched.retries)
+                        sched.retries = max(val,0)
+                        utils.draw_hover_text(f'Number of times the task is retried on a computer where it failed, waiting {sched.retry_backoff:.0f} s before the first retry and doubling the wait for each next retry',text='')
+                        imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                        _, val = imgui.input_int('Stop after failures', sched.max_errors or 0)
+                        sched.max_errors = max(val,0) or None
+                        utils.draw_hover_text('Launch no more tasks once this many runs of the task have failed (0: never stop)',text='')
+                        imgui.unindent()
         imgui.end()
         if imgui.begin('task_confirm_pane'):
             with self.master.clients_lock:
@@ -1132,7 +1187,12 @@ class MainGUI:
                         self._task_prep.cwd,
                         self._task_prep.env,
                         self._task_prep.interactive,
-                        self._task_prep.python_unbuf
+                        self._task_prep.python_unbuf,
+                        self._task_prep.priority,
+                        pty=self._task_prep.pty,
+                        raw_output=self._task_prep.raw_output,
+                        placeholders=self._task_prep.placeholders,
+                        schedule=copy.deepcopy(self._task_prep.schedule)
                     )
                 )
                 # deal with history
@@ -1491,6 +1551,10 @@ class MainGUI:
                                 action_str = 'Move' if action["is_move"] else 'Copy'
                             case message.Message.FILE_DELETE:
                                 action_str = 'Delete'
+                            case message.Message.FILE_HASH:
+                                action_str = 'Hash'
+                            case message.Message.FILE_SYNC:
+                                action_str = 'Sync (dry run)' if action["dry_run"] else 'Sync'
                         # get path
                         path = None
                         if 'path' in action:
@@ -1505,7 +1569,7 @@ class MainGUI:
                             path2 = action['new_path']
                         elif 'dest_path' in action:
                             path2 = action['dest_path']
-                        actions.append([a, self.master.clients[c].name, action, action_str, path, path2])
+                        actions.append([a, self.master.clients[c].name, action, action_str, path, path2, c])
 
             # sort
             sort_specs = imgui.table_get_sort_specs()
@@ -1555,6 +1619,19 @@ class MainGUI:
                                     spinner_radii = [x/22*symbol_size for x in [22, 16, 10]]
                                     lw = 3.5/22*symbol_size
                                     imspinner.spinner_ang_triple(f'loadingSpinner', *spinner_radii, lw, c1=imgui.get_style().color_(imgui.Col_.text_selected_bg), c2=imgui.get_style().color_(imgui.Col_.text), c3=imgui.get_style().color_(imgui.Col_.text_selected_bg))
+                                    if 'progress' in action[2]:
+                                        # (files done, files total, bytes done, bytes total[, bytes per second])
+                                        progress = action[2]['progress']
+                                        imgui.same_line()
+                                        imgui.text(f'{progress[2]/progress[3]*100 if progress[3] else 0.:.0f}%' + (f' ({utils.format_size(progress[4])}/s)' if len(progress)>4 else ''))
+                                        if imgui.is_item_hovered():
+                                            utils.draw_tooltip(f'{progress[0]}/{progress[1]} files, {utils.format_size(progress[2])}/{utils.format_size(progress[3])}')
+                                    if action[2]['action'] in [message.Message.FILE_COPY_MOVE, message.Message.FILE_HASH, message.Message.FILE_SYNC]:
+                                        imgui.same_line()
+                                        if imgui.small_button(f'{icons_fontawesome.ICON_FA_BAN}##cancel_file_action_{action[0]}'):
+                                            async_thread.run(self.master.cancel_client_file_action(self.master.clients[action[6]], action[0]))
+                                        if imgui.is_item_hovered():
+                                            utils.draw_tooltip('Cancel')
                                 case structs.Status.Finished:
                                     imgui.text_colored((.0,1.,0.,1.),icons_fontawesome.ICON_FA_CHECK)
                                 case structs.Status.Errored:
@@ -1843,9 +1920,55 @@ class MainGUI:
                             else:
                                 imgui.set_tooltip("Copy")
                     imgui.align_text_to_frame_padding()
-                    imgui.text(tsk.status.value)
+                    if tsk.status==structs.Status.Pending and tsk.queue_position is not None:
+                        imgui.text(f'{tsk.status.value} (queue position {tsk.queue_position+1})')
+                    else:
+                        imgui.text(tsk.status.value)
+                    if (tg:=self.master.task_groups.get(tsk.task_group_id)) and tg.scheduler:
+                        p = tg.scheduler.progress()
+                        txt = f'group: {p.finished+p.errored}/{p.total} done ({p.errored} errored), {p.running} running'
+                        if p.num_waves>1:
+                            txt += f', wave {p.wave+1}/{p.num_waves}'
+                        if p.eta is not None:
+                            txt += f', about {p.eta:.0f} s remaining'
+                        imgui.text(txt)
+                        if p.stopped:
+                            imgui.text(f'group launch stopped: {p.stopped}')
                     if tsk.return_code is not None:
                         imgui.text(f'return code: {tsk.return_code}')
+                    if tsk.is_done() and tg and len(tg.tasks)>1:
+                        summary = tg.output_summary()
+                        same = next((g for g in summary if tsk.client in g.clients), None)
+                        if same:
+                            num_done = sum(len(g.clients) for g in summary)
+                            imgui.text(f'same output and return code on {len(same.clients)} of {num_done} finished computers')
+                            if len(summary)>1 and imgui.is_item_hovered():
+                                with self.master.clients_lock:
+                                    lines = [f'{len(g.clients)}x return code {g.return_code}: {", ".join(self.master.clients[c].name for c in g.clients[:5] if c in self.master.clients)}{", ..." if len(g.clients)>5 else ""}' for g in summary]
+                                imgui.set_tooltip('\n'.join(lines))
+                    if tsk.limit_exceeded:
+                        imgui.text(f'killed: exceeded {tsk.limit_exceeded.replace("_"," ")} limit')
+                    if (usage:=tsk.resource_usage) is not None:
+                        imgui.text(f'CPU time: {usage.cpu_time:.1f} s, wall time: {usage.wall_time:.1f} s')
+                        imgui.text(f'memory: {utils.format_size(usage.rss)} (peak {utils.format_size(usage.peak_rss)})')
+                        imgui.text(f'I/O: {utils.format_size(usage.read_bytes)} read, {utils.format_size(usage.write_bytes)} written')
+                    if tsk.raw_output:
+                        imgui.align_text_to_frame_padding()
+                        imgui.text('output encoding:')
+                        imgui.same_line()
+                        imgui.set_next_item_width(imgui.calc_text_size('x'*12).x)
+                        changed, encoding = imgui.input_text(f'##output_encoding{tid[1]}', tsk.output_encoding, flags=imgui.InputTextFlags_.enter_returns_true)
+                        utils.draw_hover_text('Encoding with which the output of this task is shown, e.g. utf8, cp1252 or latin1. Press enter to apply',text='')
+                        if changed:
+                            try:
+                                codecs.lookup(encoding)
+                                tsk.output_encoding = encoding
+                            except LookupError:
+                                pass
+                    if tsk.results:
+                        imgui.text(f'results: {len(tsk.results)} record{"s" if len(tsk.results)>1 else ""}')
+                        if imgui.is_item_hovered():
+                            imgui.set_tooltip(f'latest: {tsk.results[-1]}')
                     if tsk.status in [structs.Status.Pending, structs.Status.Running]:
                         imgui.same_line()
                         if tsk.status==structs.Status.Pending:
@@ -1873,9 +1996,20 @@ class MainGUI:
             if item.online and (tid := self._computer_GUI_tasks[item.id]) is not None:
                 if tid[0]=='task' and (tsk:=item.online.tasks[tid[1]]).type!=task.Type.Wake_on_LAN:
                     imgui.push_font(imgui_md.get_code_font())
-                    imgui.input_text_multiline(f"##output_content", tsk.output, size=(imgui.get_content_region_avail().x,-imgui.get_frame_height_with_spacing()), flags=imgui.InputTextFlags_.read_only)
+                    output = tsk.get_output()
+                    imgui.input_text_multiline(f"##output_content", output, size=(imgui.get_content_region_avail().x,-imgui.get_frame_height_with_spacing()), flags=imgui.InputTextFlags_.read_only)
+                    # if task runs in a pseudo-terminal, tell it the size of the output box (when first shown and upon resize)
+                    if tsk.pty and tsk.interactive and tsk.status==structs.Status.Running:
+                        box_size = imgui.get_item_rect_size()
+                        char_size = imgui.calc_text_size('x')
+                        style = imgui.get_style()
+                        rows = max(1, int((box_size.y-2*style.frame_padding.y)/char_size.y))
+                        cols = max(1, int((box_size.x-2*style.frame_padding.x-style.scrollbar_size)/char_size.x))
+                        if self._computer_GUI_pty_size.get((item.id, tid[1]))!=(rows, cols):
+                            self._computer_GUI_pty_size[(item.id, tid[1])] = (rows, cols)
+                            async_thread.run(task.send_resize(rows, cols, item, tsk))
                     # scroll to bottom if output has changed
-                    output_length = len(tsk.output)
+                    output_length = len(output)
                     if tid[2]!=output_length:
                         if tid[2]>0:
                             # need one frame delay for win.scroll_max.y to be updated
@@ -30,6 +30,7 @@ class FileCommander:
         self.left  = filepicker.FilePicker(start_machine=client_name, start_dir=start_dir_left , file_action_provider=file_action_provider)
         self.right = filepicker.FilePicker(start_machine=client_name, start_dir=start_dir_right, file_action_provider=file_action_provider)
         self.right._listing_cache = self.left._listing_cache                # share listing cache
+        self.right._listing_pages = self.left._listing_pages
         # right pane cannot chose machine, we track machine selected on the left and force right to match
         self.right.allow_selecting_machine = False
         self.left_machine = self.left.machine
@@ -55,9 +56,9 @@ class FileCommander:
 
     def draw(self):
         # check if either of the file pickers needs a refresh
-        if not self.left.refreshing and (self.left.elapsed>2 or imgui.is_key_pressed(imgui.Key.f5)):
+        if self.left.needs_refresh():
             self.left.refresh()
-        if not self.right.refreshing and (self.right.elapsed>2 or imgui.is_key_pressed(imgui.Key.f5)):
+        if self.right.needs_refresh():
             self.right.refresh()
         # if left machine changed, also change for right
         if self.left.machine!=self.left_machine:
@@ -128,6 +129,8 @@ class FileCommander:
                 if win := hello_imgui.get_runner_params().docking_params.dockable_window_of_name(self.win_name):
                     win.is_visible = False
             closed = True
+            self.left.stop_watching()
+            self.right.stop_watching()
         imgui.end_child()
 
         utils.handle_popup_stack(self.popup_stack)
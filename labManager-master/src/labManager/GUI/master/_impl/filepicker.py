@@ -1,5 +1,6 @@
 import pathlib
 import typing
+import functools
 from imgui_bundle import hello_imgui, imgui, icons_fontawesome, imspinner
 import sys
 import natsort
@@ -23,16 +24,14 @@ FILE_ICON = icons_fontawesome.ICON_FA_FILE
 
 @dataclass
 class DirEntryWithCache(structs.DirEntry):
-    # display fields
-    display_name: str = ''
-    ctime_str: str = None
-    mtime_str: str = None
-    size_str: str = None
+    # display strings are made when first needed, so that only those of
+    # the entries that are actually shown have to be made
 
     def __init__(self, item: structs.DirEntry):
         super().__init__(item.name, item.is_dir, item.full_path, item.ctime, item.mtime, item.size, item.mime_type, item.extra)
 
-        # prep display strings
+    @functools.cached_property
+    def display_name(self) -> str:
         if self.mime_type and self.mime_type.startswith('labManager/drive'):
             icon = DRIVE_ICON
         elif self.mime_type=='labManager/net_name':
@@ -41,23 +40,21 @@ class DirEntryWithCache(structs.DirEntry):
             icon = DIR_ICON
         else:
             icon = FILE_ICON
-        self.display_name   = icon + "  " + self.name
+        return icon + "  " + self.name
 
-        self.ctime_str      = self.ctime.strftime("%Y-%m-%d %H:%M:%S") if self.ctime else None
-        self.mtime_str      = self.mtime.strftime("%Y-%m-%d %H:%M:%S") if self.mtime else None
+    @functools.cached_property
+    def ctime_str(self) -> str|None:
+        return self.ctime.strftime("%Y-%m-%d %H:%M:%S") if self.ctime else None
 
-        # size
+    @functools.cached_property
+    def mtime_str(self) -> str|None:
+        return self.mtime.strftime("%Y-%m-%d %H:%M:%S") if self.mtime else None
+
+    @functools.cached_property
+    def size_str(self) -> str|None:
         if not self.is_dir or (self.mime_type and self.mime_type.startswith('labManager/drive')):
-            i = 0
-            units = ['B', 'KiB', 'MiB', 'GiB', 'TiB']
-            size = self.size
-            while size>1024:
-                i+=1
-                size /= 1024
-            if i==0:
-                self.size_str = f'{size:.0f} {units[i]}'
-            else:
-                self.size_str = f'{size:.1f} {units[i]}'
+            return utils.format_size(self.size)
+        return None
 
 class RemoteNotFound(Exception):
     ...
@@ -73,10 +70,15 @@ class FileActionProvider:
         if action_callback:
             self.action_callback.append(action_callback)
         self.remote_disconnected_callbacks: list[Callable[[structs.ConnectedClient, int],None]] = []
+        # called with machine and path when a watched directory changed and its listing should be requested again
+        self.listing_changed_callbacks: list[Callable[[str, str|pathlib.Path], None]] = []
 
         self.master = master
-        # install hook
+        # install hooks
         self.master.add_hook('client_disconnected', self._remote_disconnected)
+        self.master.add_hook('file_listing_change', self._remote_listing_changed)
+        # remote directories being watched for changes: (client_id, path) -> {path, number of watchers, active}
+        self._watches: dict[tuple[int,str], dict[str,Any]] = {}
 
         # remote action provider. If set, any actions on remotes are routed
         # through this provider. If not, self.master member functions are used
@@ -145,11 +147,67 @@ class FileActionProvider:
         with self.master.clients_lock:
             remote_name = self.master.clients[client_id].name
         remote_full_name = self.get_full_machine_name(remote_name)
+        self._watches = {k:w for k,w in self._watches.items() if k[0]!=client_id}
         for c in self.remote_disconnected_callbacks:
             c(remote_name, remote_full_name)
 
+    def watch_listing(self, machine: str, path: str|pathlib.Path):
+        # have the remote machine report changes to the directory, so that it doesn't
+        # have to be listed again periodically. Local directories are not watched
+        try:
+            machine, is_local, client_id = self.resolve_machine(machine)
+        except RemoteNotFound:
+            return
+        if is_local or path=='root' or file_actions.get_net_computer(path) or not self.supports_remote():
+            return
+        key = (client_id, str(path))
+        if key in self._watches:
+            self._watches[key]['count'] += 1
+            return
+        self._watches[key] = {'path': path, 'count': 1, 'active': True}
+        async_thread.run(self.master.watch_client_directory(self.master.clients[client_id], path))
+
+    def unwatch_listing(self, machine: str, path: str|pathlib.Path):
+        try:
+            machine, is_local, client_id = self.resolve_machine(machine)
+        except RemoteNotFound:
+            return
+        key = (client_id, str(path))
+        if is_local or key not in self._watches:
+            return
+        self._watches[key]['count'] -= 1
+        if self._watches[key]['count']<=0:
+            del self._watches[key]
+            async_thread.run(self.master.unwatch_client_directory(self.master.clients[client_id], path))
+
+    def is_watched(self, machine: str, path: str|pathlib.Path) -> bool:
+        try:
+            machine, is_local, client_id = self.resolve_machine(machine)
+        except RemoteNotFound:
+            return False
+        return not is_local and (w := self._watches.get((client_id, str(path)))) is not None and w['active']
+
+    def _remote_listing_changed(self, client: structs.ConnectedClient, client_id: int, path: str, changes: dict[str,Any]):
+        if (watch := self._watches.get((client_id, path))) is None:
+            return  # not watched by us
+        with self.master.clients_lock:
+            machine = self.get_full_machine_name(self.master.clients[client_id].name)
+        if 'error' in changes:
+            # directory can no longer be watched
+            watch['active'] = False
+        listing = client.file_listings.get(path)
+        if 'error' not in changes and listing and isinstance(listing['listing'], structs.DirListing) and not listing['listing'].is_page():
+            # the master has brought the complete listing up to date, deliver that
+            for c in self.listing_callbacks:
+                c(machine, watch['path'], listing['listing'])
+        else:
+            for c in self.listing_changed_callbacks:
+                c(machine, watch['path'])
 
-    def get_listing(self, machine: str, path: str|pathlib.Path) -> list[structs.DirEntry]|concurrent.futures.Future:
+
+    def get_listing(self, machine: str, path: str|pathlib.Path, page: dict[str,Any] = None) -> list[structs.DirEntry]|concurrent.futures.Future:
+        # page: arguments for requesting a page of a directory listing (offset, limit, sort_key, etc,
+        # see master.get_client_file_listing()). Only used for remote directories, local listings are complete
         try:
             machine, is_local, client_id = self.resolve_machine(machine)
         except RemoteNotFound as exc:
@@ -196,7 +254,7 @@ class FileActionProvider:
                     path = f'//{net_comp}/'
                 else:
                     # normal directory or share on a network computer, no special handling needed
-                    async_thread.run(self.master.get_client_file_listing(self.master.clients[client_id],path))
+                    async_thread.run(self.master.get_client_file_listing(self.master.clients[client_id],path,**(page or {})))
             fut = async_thread.run(asyncio.wait_for(self.master.add_waiter('file-listing', path, client_id), timeout=None), lambda f: self._listing_done(f, machine, path))
         if fut:
             self.waiters.add(fut)
@@ -349,8 +407,14 @@ class FilePicker:
         file_action_provider.listing_callbacks.append(self._listing_done)
         file_action_provider.action_callbacks .append(self._action_done)
         file_action_provider.remote_disconnected_callbacks.append(self._remote_lost)
+        file_action_provider.listing_changed_callbacks.append(self._listing_changed)
 
         self._listing_cache: dict[tuple(str,str|pathlib.Path), dict[int,DirEntryWithCache]] = {}
+        # for large remote directories, only the pages of the listing that are shown are requested
+        # from the remote machine, sorted and filtered there. The entries of such listings are
+        # keyed by their position in the sorted listing. Info about these listings is stored here
+        self._listing_pages: dict[tuple(str,str|pathlib.Path), dict[str,Any]] = {}
+        self.page_size = 500
         self.popup_stack = []
         self.dialog_provider = DialogProvider(self, self._launch_action)
         self.disable_keyboard_navigation = False
@@ -364,6 +428,13 @@ class FilePicker:
         self.require_sort = False
         self.sorted_items: list[int] = []
         self.last_clicked_id: int = None
+        self._sort_key = 'name'             # primary sort key, for sorting by remote machine
+        self._sort_descending = False
+        self._shown_view: tuple[str,bool,str] = None    # sort key, descending and filter of shown page(s), if showing a partially loaded listing
+        self._visible_rows = (0,0)
+        self._page_requested = False
+        self._watched: tuple[str,str|pathlib.Path] = None  # remote location watched for changes
+        self._dir_changed = False
 
         self.machine: str = None
         self.allow_selecting_machine = True
@@ -433,6 +504,8 @@ class FilePicker:
                 utils.set_all(self.selected, False)
             # changing location clear filter box
             self.filter_box_text = ''
+            self._page_requested = False
+            self._visible_rows = (0,0)
             # load from cache if available
             if (self.machine,self.loc) in self._listing_cache:
                 self._update_listing(self.machine, self.loc, True)
@@ -448,20 +521,104 @@ class FilePicker:
         # when the client is actually fully gone (at this stage it is about to be
         # removed)
         self.refreshing = False
+        # watch is gone with the remote
+        self._watched = None
 
-    def refresh(self):
+    def needs_refresh(self) -> bool:
+        # F5 pressed, watched directory changed, or time for periodic refresh (only
+        # needed if the directory is not watched for changes)
+        if self.refreshing:
+            return False
+        return imgui.is_key_pressed(imgui.Key.f5) or self._dir_changed or \
+            (self.elapsed>2 and not self.file_action_provider.is_watched(self.machine, self.loc))
+
+    def refresh(self, force: bool = None):
+        # force: have the remote machine list the directory again, instead of serving it
+        # from the listing it has cached. By default only done when F5 is pressed or when
+        # the directory is not watched: changes to a watched directory are applied to the
+        # cached listing
+        if force is None:
+            force = imgui.is_key_pressed(imgui.Key.f5) or not self.file_action_provider.is_watched(self.machine, self.loc)
+        self._dir_changed = False
+        self._update_watch()
         # launch refresh
-        self.refreshing = True
-        self._request_listing(self.machine, self.loc)
+        if (self.machine,self.loc) in self._listing_pages and self._shown_view:
+            # partially loaded listing, reload the shown page. If not forced,
+            # the remote machine may serve it from the listing it has cached
+            if self._page_requested:
+                return
+            self.refreshing = True
+            self._request_page(self._visible_rows[0], force)
+        else:
+            self.refreshing = True
+            self._request_listing(self.machine, self.loc, force)
 
-    def _request_listing(self, machine: str, path: str|pathlib.Path):
-        self.file_action_provider.get_listing(machine, path)
+    def _update_watch(self):
+        # watch shown location for changes, stop watching previous location
+        if self._watched==(self.machine,self.loc):
+            return
+        self.stop_watching()
+        self._watched = (self.machine,self.loc)
+        self.file_action_provider.watch_listing(self.machine, self.loc)
+
+    def stop_watching(self):
+        if self._watched:
+            self.file_action_provider.unwatch_listing(*self._watched)
+            self._watched = None
+
+    def _listing_changed(self, machine: str, path: str|pathlib.Path):
+        if machine==self.machine and str(path)==str(self.loc):
+            self._dir_changed = True
+
+    def _request_listing(self, machine: str, path: str|pathlib.Path, refresh=False):
+        # NB: for a remote directory, we request the first page. If that
+        # turns out to be the whole listing, we don't need any paging
+        self.file_action_provider.get_listing(machine, path, {'limit': self.page_size, 'sort_key': self._sort_key, 'descending': self._sort_descending, 'refresh': refresh})
+
+    def _request_page(self, row: int, refresh=False):
+        # request the page of the listing of the current location containing row, sorted and filtered as currently set
+        self._page_requested = True
+        page = {'offset': row//self.page_size*self.page_size, 'limit': self.page_size, 'sort_key': self._sort_key, 'descending': self._sort_descending, 'filter': self.filter_box_text, 'refresh': refresh}
+        self.file_action_provider.get_listing(self.machine, self.loc, page)
+
+    def _check_pages(self):
+        # for partially loaded listings, request the first page again if sorting or filter changed,
+        # else request any page that is not loaded but (partially) visible
+        # NB: one page request at a time
+        info = self._listing_pages.get((self.machine,self.loc))
+        if not info or self._page_requested:
+            return
+        if self._shown_view!=(self._sort_key, self._sort_descending, self.filter_box_text):
+            self._request_page(0)
+            return
+        start, end = self._visible_rows
+        if (missing := next((r for r in range(start, min(end, info['total'])) if r not in self.items), None)) is not None:
+            self._request_page(missing)
 
     def _listing_done(self, machine: str, path: str|pathlib.Path, items: list[structs.DirEntry]|Exception):
+        key = (machine,path)
+        is_current = machine==self.machine and str(path)==str(self.loc)
+        if is_current:
+            self._page_requested = False
         # deal with cache
-        if not isinstance(items, Exception):
-            items = {i:DirEntryWithCache(item) for i,item in enumerate(items)}
-        self._listing_cache[(machine,path)] = items
+        if isinstance(items, structs.DirListing) and (items.is_page() or items.filter):
+            # page of a large directory listing
+            view = (items.sort_key, items.descending, items.filter)
+            if is_current and self._shown_view and view!=(self._sort_key, self._sort_descending, self.filter_box_text):
+                # not the sorting or filter we want (anymore)
+                self.refreshing = False
+                return
+            info = self._listing_pages.get(key)
+            cached = self._listing_cache.get(key)
+            if not info or info['view']!=view or info['total']!=items.total or not isinstance(cached, dict):
+                cached = {}
+            self._listing_pages[key] = {'view': view, 'total': items.total}
+            items = cached | {items.offset+i:DirEntryWithCache(item) for i,item in enumerate(items)}
+        else:
+            self._listing_pages.pop(key, None)
+            if not isinstance(items, Exception):
+                items = {i:DirEntryWithCache(item) for i,item in enumerate(items)}
+        self._listing_cache[key] = items
 
         if str(path)==str(self.loc):
             # also load all parent paths if not in cache already, so path bar
@@ -484,6 +641,8 @@ class FilePicker:
             self.selected.clear()
             self.msg = None
             items = self._listing_cache[(machine,path)]
+            info = self._listing_pages.get((machine,path))
+            self._shown_view = info['view'] if info else None
             if isinstance(items, Exception):
                 self.msg = f"Cannot open this folder!\n:{items}"
             else:
@@ -692,7 +851,7 @@ class FilePicker:
             utils.draw_hover_text(text='', hover_text='Refreshing...')
         else:
             if imgui.button(icons_fontawesome.ICON_FA_REDO):
-                self.refresh()
+                self.refresh(force=True)
         # Location bar
         imgui.same_line(spacing=imgui.get_style().item_spacing.x/2)
         # determine size
@@ -986,9 +1145,12 @@ class FilePicker:
                 imgui.table_setup_column("Size")  # 5
                 imgui.table_setup_scroll_freeze(int(self.allow_multiple), 1)  # Sticky column headers and selector row
 
+                # partially loaded listing: get pages we need
+                self._check_pages()
                 with self.items_lock:
                     sort_specs = imgui.table_get_sort_specs()
                     self.sort_items(sort_specs)
+                    page_info = self._listing_pages.get((self.machine,self.loc))
 
                     # Headers
                     imgui.table_next_row(imgui.TableRowFlags_.headers)
@@ -1032,9 +1194,21 @@ class FilePicker:
                         # default to topmost if last_clicked unknown, or no longer on screen due to filter
                         self.last_clicked_id = self.sorted_items[0]
                     clipper = imgui.ListClipper()
-                    clipper.begin(len(self.sorted_items))
+                    clipper.begin(page_info['total'] if page_info else len(self.sorted_items))
+                    visible_rows = None
                     while clipper.step():
-                        for iid in self.sorted_items[clipper.display_start:clipper.display_end]:
+                        if page_info:
+                            # for partially loaded listings, rows may not be loaded yet
+                            rows = [r if r in self.items else None for r in range(clipper.display_start, clipper.display_end)]
+                            visible_rows = (clipper.display_start if visible_rows is None else min(visible_rows[0], clipper.display_start), clipper.display_end)
+                        else:
+                            rows = self.sorted_items[clipper.display_start:clipper.display_end]
+                        for iid in rows:
+                            if iid is None:
+                                imgui.table_next_row(min_row_height=frame_height)
+                                imgui.table_set_column_index(int(self.allow_multiple))
+                                imgui.text_disabled('loading...')
+                                continue
                             imgui.table_next_row()
 
                             selectable_clicked = False
@@ -1148,6 +1322,8 @@ class FilePicker:
                         if selected_ids and imgui.is_key_pressed(imgui.Key.delete, repeat=False):
                             self.dialog_provider.show_delete_path_dialog(self.items, selected_ids)
 
+                if visible_rows:
+                    self._visible_rows = visible_rows
                 if new_loc:
                     self.goto(self.machine, new_loc)
                 last_y = imgui.get_cursor_screen_pos().y
@@ -1186,7 +1362,7 @@ class FilePicker:
 
     def tick(self):
         # Auto refresh
-        if not self.refreshing and (self.elapsed>2 or imgui.is_key_pressed(imgui.Key.f5)):
+        if self.needs_refresh():
             self.refresh()
 
         # Setup popup
@@ -1206,6 +1382,7 @@ class FilePicker:
             opened = 0
             cancelled = closed = True
         if closed:
+            self.stop_watching()
             if not cancelled and self.callback:
                 with self.items_lock:
                     selected = [self.items[iid].full_path for iid in self.items if iid in self.selected and self.selected[iid]]
@@ -1218,6 +1395,18 @@ class FilePicker:
         if sort_specs_in.specs_dirty or self.require_sort:
             ids = list(self.items)
             sort_specs = [sort_specs_in.get_specs(i) for i in range(sort_specs_in.specs_count)]
+            # primary sort, for when remote machine does the sorting
+            if sort_specs:
+                self._sort_key = {2: 'ctime', 3: 'mtime', 4: 'type', 5: 'size'}.get(sort_specs[0].column_index+int(not self.allow_multiple), 'name')
+                self._sort_descending = bool(sort_specs[0].get_sort_direction() - 1)
+            if (self.machine,self.loc) in self._listing_pages:
+                # partially loaded listing, sorted and filtered by remote machine
+                # NB: entries are keyed by their position in the listing
+                self.sorted_items = sorted(ids)
+                sort_specs_in.specs_dirty = False
+                self.require_sort = False
+                return
+
             for sort_spec in reversed(sort_specs):
                 match sort_spec.column_index+int(not self.allow_multiple):
                     case 2:     # Date created
@@ -39,6 +39,17 @@ def trim_str(text: str, length=None, till_newline=True, newline_ellipsis=False):
     return text
 
 
+def format_size(size: int|float):
+    i = 0
+    units = ['B', 'KiB', 'MiB', 'GiB', 'TiB']
+    while size>1024:
+        i+=1
+        size /= 1024
+    if i==0:
+        return f'{size:.0f} {units[i]}'
+    else:
+        return f'{size:.1f} {units[i]}'
+
 def set_all(input: dict[int, bool], value, subset: list[int] = None, predicate: Callable = None):
     if subset is None:
         subset = (r for r in input)
@@ -9,9 +9,9 @@ import pathlib
 import platform
 import unicodedata
 import time
-from typing import Any, Callable
+from typing import Any, AsyncIterator, Callable
 
-from labManager.common import async_thread, config, counter, eye_tracker, file_actions, message, structs, task
+from labManager.common import async_thread, config, counter, eye_tracker, file_actions, file_pull, message, pipeline, structs, task
 from labManager.common.network import admin_conn, comms, ifs, keepalive, mdns, ssdp, toems
 from labManager.common.network import utils as net_utils
 
@@ -51,9 +51,14 @@ class Master:
 
         # tasks
         self.task_groups        : dict[int, task.TaskGroup]     = {}
+        self._schedulers        : set[asyncio.Task]             = set()
+        self._pipelines         : list[pipeline.Pipeline]       = []
 
         # file actions
         self._file_action_id_provider = counter.CounterContext()
+        self._file_search_id_provider = counter.CounterContext()
+        self._file_pull_id_provider = counter.CounterContext()
+        self._file_pulls        : dict[int, tuple[int, file_pull.Receiver, asyncio.Future]] = {} # transfer id -> (client id, receiver, future for FILE_PULL_END)
 
         # hooks
         self.login_state_change_hooks: \
@@ -66,6 +71,10 @@ class Master:
             list[Callable[[structs.ConnectedClient, int], None]]= []
         self.task_state_change_hooks: \
             list[Callable[[structs.ConnectedClient, int, task.Task], None]] = []
+        self.file_listing_change_hooks: \
+            list[Callable[[structs.ConnectedClient, int, str, dict], None]] = []
+        self.file_search_hooks: \
+            list[Callable[[structs.ConnectedClient, int, int, dict], None]] = []
 
     def __del__(self):
         # if there are any registered waiters, cancel them
@@ -239,6 +248,8 @@ class Master:
         return self._server is not None and self._server.is_serving()
 
     async def stop_server(self):
+        for t in self._schedulers:
+            t.cancel()
         if self._ssdp_server is not None:
             await self._ssdp_server.stop()
         if self._mnds_announcer_task and not self._mnds_announcer_task.done():
@@ -318,6 +329,9 @@ class Master:
             case structs.WaiterType.File_Action:
                 assert isinstance(parameter, int),\
                     f'When creating a {waiter_type.value} waiter, parameter should be an int (file action id)'
+            case structs.WaiterType.File_Search:
+                assert isinstance(parameter, int),\
+                    f'When creating a {waiter_type.value} waiter, parameter should be an int (file search id)'
 
         # its valid, create our waiter
         if not async_thread.loop:
@@ -398,6 +412,9 @@ class Master:
                             # action is already finished
                             waiter.fut.set_result(None)
                         break
+            case structs.WaiterType.File_Search:
+                if self._file_search_is_done(parameter):
+                    waiter.fut.set_result(None)
 
         return waiter.fut
 
@@ -427,6 +444,8 @@ class Master:
                         if 'image_info' in msg:
                             me.image_info = msg['image_info']
                         client_id = self._client_connected(me, msg['name'], msg['MACs'])
+                        # let client know its id, needed for it to find its task in a TASK_GROUP_CREATE
+                        await comms.typed_send(writer, message.Message.CLIENT_ID, {'client_id': client_id})
 
                         # if available, tell client to mount project share as drive
                         if self.has_share_access:
@@ -464,12 +483,34 @@ class Master:
                     case message.Message.TASK_OUTPUT:
                         mytask = me.tasks[msg['task_id']]
                         # NB: ignore msg['stream_type'] and just concat all to one text buffer
-                        mytask.output += msg['output']
+                        mytask.add_output(msg['output'])
+                    case message.Message.TASK_OUTPUT_RAW:
+                        task_id, _, output = task.unpack_raw_output(msg)
+                        me.tasks[task_id].add_output(output)
+                    case message.Message.TASK_PAYLOAD_REQUEST:
+                        # NB: always reply, the client's task waits for it
+                        if (mytask := me.tasks.get(msg['task_id'])) is not None:
+                            await task.send_payload(me, mytask)
+                        else:
+                            await task.send_payload_error(me, msg['task_id'], f'unknown task {msg["task_id"]}')
+                    case message.Message.TASK_STATS:
+                        mytask = me.tasks[msg['task_id']]
+                        mytask.resource_usage = task.ResourceUsage(**msg['stats'])
+                    case message.Message.TASK_RESULT:
+                        mytask = me.tasks[msg['task_id']]
+                        mytask.results.extend(msg['results'])
+                    case message.Message.TASK_RETURN:
+                        mytask = me.tasks[msg['task_id']]
+                        task.load_return_value(mytask, msg['result'])
                     case message.Message.TASK_UPDATE:
                         mytask = me.tasks[msg['task_id']]
-                        mytask.status = msg['status']
+                        mytask.queue_position = msg.get('queue_position')
+                        # NB: set status last, so that all info is available to listeners
                         if 'return_code' in msg:
                             mytask.return_code = msg['return_code']
+                        if 'limit' in msg:
+                            mytask.limit_exceeded = msg['limit']
+                        mytask.status = msg['status']
                         # call hooks, if any
                         self._call_hooks(self.task_state_change_hooks, me, client_id, mytask)
                         if mytask.is_done():
@@ -488,6 +529,38 @@ class Master:
                                 # immediately, but call_soon()
                                 if not w.fut.done():
                                     w.fut.set_result(None)
+                    case message.Message.FILE_CHANGES:
+                        path = str(msg.pop('path'))
+                        # bring stored listing up to date. Pages of a listing cannot be updated,
+                        # those have to be requested again
+                        if 'error' not in msg and (listing := me.file_listings.get(path)) is not None \
+                            and isinstance(listing['listing'], structs.DirListing) and not listing['listing'].is_page():
+                            listing['listing'].apply_changes(msg['added'], msg['removed'], msg['changed'])
+                            listing['age'] = time.time()
+                        self._call_hooks(self.file_listing_change_hooks, me, client_id, path, msg)
+                    case message.Message.FILE_SEARCH_RESULTS:
+                        search_id = msg.pop('search_id')
+                        search = me.file_searches.setdefault(search_id, {'root': msg['root'], 'results': structs.DirListing(str(msg['root']))})
+                        search['results'].extend(msg.pop('results'))
+                        search |= msg
+                        self._call_hooks(self.file_search_hooks, me, client_id, search_id, search)
+                        # check if there are any waiters for this search, notify them
+                        if msg['status'] in [structs.Status.Finished, structs.Status.Errored] and self._file_search_is_done(search_id):
+                            for w in self._waiters:
+                                if w.waiter_type==structs.WaiterType.File_Search and w.parameter==search_id:
+                                    # NB: no need for lock as callback is not called
+                                    # immediately, but call_soon()
+                                    if not w.fut.done():
+                                        w.fut.set_result(None)
+                    case message.Message.FILE_PULL_DATA:
+                        transfer_id, offset, compressed, data = file_pull.unpack_chunk(msg)
+                        if (pull := self._file_pulls.get(transfer_id)) is not None:
+                            # NB: next message from this client is not read until the chunk is written,
+                            # so the client cannot send faster than we can write
+                            await asyncio.to_thread(pull[1].write, offset, compressed, data)
+                    case message.Message.FILE_PULL_END:
+                        if (pull := self._file_pulls.get(msg['transfer_id'])) is not None and not pull[2].done():
+                            pull[2].set_result(msg)
                     case message.Message.FILE_ACTION_STATUS:
                         action_id = msg.pop('action_id')
                         me.file_actions[action_id] = msg
@@ -528,6 +601,10 @@ class Master:
                 self.client_disconnected_hooks.append(fun)
             case 'task_state_change':
                 self.task_state_change_hooks.append(fun)
+            case 'file_listing_change':
+                self.file_listing_change_hooks.append(fun)
+            case 'file_search':
+                self.file_search_hooks.append(fun)
             case _:
                 raise ValueError('add_hook: hook type "{which}" not understood')
 
@@ -605,6 +682,18 @@ class Master:
     def _client_disconnected(self, client: structs.ConnectedClient, client_id: int):
         # call hooks, if any
         self._call_hooks(self.client_disconnected_hooks, client, client_id)
+        # tasks running on the client won't finish, let schedulers know
+        for tg in self.task_groups.values():
+            if tg.scheduler and client_id in tg.tasks:
+                tg.scheduler.client_disconnected(client_id)
+        self._pipelines = [p for p in self._pipelines if not p.is_done()]
+        for p in self._pipelines:
+            p.client_disconnected(client_id)
+
+        # files being pulled from the client won't arrive
+        for c,_,fut in self._file_pulls.values():
+            if c==client_id and not fut.done():
+                fut.set_exception(ConnectionError('Client disconnected while a file was being pulled from it'))
 
         # clean up ConnectedClient
         with self.clients_lock:
@@ -628,6 +717,9 @@ class Master:
             elif w.waiter_type==structs.WaiterType.Client_Connected_Nr and num_clients==w.parameter:
                 # waiting for a specific number of clients to be connected
                 finish_future = True
+            elif w.waiter_type==structs.WaiterType.File_Search and w.parameter in client.file_searches and self._file_search_is_done(w.parameter):
+                # waiting for a file search that the client was still doing
+                finish_future = True
 
             if finish_future and not w.fut.done():
                 w.fut.set_result(None)
@@ -676,7 +768,13 @@ class Master:
                        cwd: str=None,
                        env: dict=None,
                        interactive=False,
-                       python_unbuf=False):
+                       python_unbuf=False,
+                       priority=0,
+                       limits: task.Limits=None,
+                       pty=False,
+                       raw_output=False,
+                       placeholders=False,
+                       schedule: task.Schedule=None):
         tsk_type = task.Type.get(tsk_type)
         # clients has a special value '*' which means all clients
         if clients=='*':
@@ -702,44 +800,148 @@ class Master:
                 payload = await aiopath.AsyncPath(payload).read_text()
 
         # make task group
-        task_group = task.create_group(tsk_type, payload, clients, cwd=cwd, env=env, interactive=interactive, python_unbuf=python_unbuf)
+        task_group = task.create_group(tsk_type, payload, clients, cwd=cwd, env=env, interactive=interactive, python_unbuf=python_unbuf, priority=priority, limits=limits, pty=pty, raw_output=raw_output, placeholders=placeholders)
 
         # execute
-        return await self.execute_task_group(task_group)
-
-    async def execute_task_group(self, task_group: task.TaskGroup):
+        return await self.execute_task_group(task_group, schedule)
+
+    async def map(self, func: Callable, clients: str | int | list[int], *args, timeout: float=None, priority=0, limits: task.Limits=None, **kwargs) -> AsyncIterator[task.CallResult]:
+        # call func(*args, **kwargs) on each of the clients and yield a task.CallResult
+        # per client as soon as its call completes. Calls that fail (func raised, client
+        # disconnected, timeout expired) yield a CallResult with the error set, and do not
+        # affect the other calls. Calls still running when the timeout (s) expires, or when
+        # iteration is stopped early, are cancelled.
+        # NB: func, args, kwargs and the return value are pickled. Without cloudpickle (which,
+        # if used, must be installed on master and clients), func must be importable on the clients
+        payload = task.make_call_payload(func, *args, **kwargs)
+        task_group_id, _ = await self.run_task(task.Type.Python_function, payload, clients, priority=priority, limits=limits)
+        if task_group_id is None:
+            return
+        task_group = self.task_groups[task_group_id]
+
+        done = asyncio.Queue()
+        def task_done(tsk: task.Task):
+            if tsk.is_done():
+                done.put_nowait(tsk.client)
+        def client_disconnected(_, client_id: int):
+            if client_id in task_group.tasks:
+                done.put_nowait(client_id)
+        for c in task_group.tasks:
+            task_group.tasks[c].add_listener(task_done)
+            if task_group.tasks[c].is_done():
+                done.put_nowait(c)
+        self.client_disconnected_hooks.append(client_disconnected)
+
+        pending = set(task_group.tasks)
+        deadline = None if timeout is None else time.monotonic()+timeout
+        try:
+            while pending:
+                try:
+                    c = await asyncio.wait_for(done.get(), None if deadline is None else max(deadline-time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if c not in pending:
+                    continue
+                pending.discard(c)
+                yield task.CallResult.fromtask(task_group.tasks[c])
+        finally:
+            if client_disconnected in self.client_disconnected_hooks:
+                self.client_disconnected_hooks.remove(client_disconnected)
+            for c in pending:
+                if c in self.clients:
+                    await task.send_cancel(self.clients[c], task_group.tasks[c])
+
+        # only get here if timeout expired
+        for c in sorted(pending):
+            yield task.CallResult(c, error=f'Call did not complete within {timeout} s', task=task_group.tasks[c])
+
+    async def execute_task_group(self, task_group: task.TaskGroup, schedule: task.Schedule=None):
         self.task_groups[task_group.id] = task_group
 
+        if schedule and not task.task_group_launch_as_group(task_group):
+            # tasks are launched over time by a scheduler, see task.GroupScheduler
+            scheduler = task.GroupScheduler(task_group, schedule, self._launch_task)
+            sched_task = asyncio.create_task(scheduler.run())
+            self._schedulers.add(sched_task)
+            sched_task.add_done_callback(self._schedulers.discard)
+            return task_group.id, [task_group.tasks[c].id for c in task_group.tasks]
+
         # start tasks
-        launch_as_group = task.task_group_launch_as_group(task_group)
-        coros = []
         for c in task_group.tasks:  # NB: index is client ID
             mytask = task_group.tasks[c]
             # add to client task list
             if self.clients[c].online:
                 self.clients[c].online.tasks[mytask.id] = mytask
-            if not launch_as_group:
-                # send
-                coros.append(task.send(mytask, self.clients[c]))
-        if launch_as_group:
-            coros.append(task.send(task_group, self.clients))
-
-        await asyncio.gather(*coros)
+        if task.task_group_launch_as_group(task_group):
+            await task.send(task_group, self.clients)
+        else:
+            # one message for all clients, see task.send_group()
+            await task.send_group(task_group, self.clients)
 
         # return TaskGroup.id and [Task.id, ...] for all constituent tasks
         return task_group.id, [task_group.tasks[c].id for c in task_group.tasks]
 
+    async def run_pipeline(self,
+                           steps: list[pipeline.Step],
+                           clients: str | list[int],
+                           state_file: str|pathlib.Path=None) -> pipeline.Pipeline:
+        # run a pipeline of steps with dependencies between them, see labManager.common.pipeline.
+        # Returns the started pipeline, use its wait() method to wait for it to complete
+        # clients has a special value '*' which means all clients
+        with self.clients_lock:
+            if clients=='*':
+                clients = [c for c in self.clients if self.clients[c].online]
+            for c in clients:
+                if c not in self.clients:
+                    raise ValueError(f'client with id {c} is not known')
+            clients = {c:self.clients[c].name for c in clients}
+
+        pipe = pipeline.Pipeline(steps, clients, self._launch_task, state_file)
+        await pipe.prepare()
+        for tg in pipe.task_groups.values():
+            self.task_groups[tg.id] = tg
+        self._pipelines.append(pipe)
+        pipe.start()
+        return pipe
+
+    async def _launch_task(self, mytask: task.Task):
+        # launch a single task of a group, for task.GroupScheduler and pipeline.Pipeline
+        if mytask.client not in self.clients or not self.clients[mytask.client].online:
+            mytask.add_output('Client is not connected\n')
+            mytask.status = structs.Status.Errored
+            return
+        self.clients[mytask.client].online.tasks[mytask.id] = mytask
+        await task.send(mytask, self.clients[mytask.client])
+
 
     async def get_client_drives(self, client: structs.Client):
         if not client.online:
             return
         await comms.typed_send(client.online.writer, message.Message.FILE_GET_DRIVES)
 
-    async def get_client_file_listing(self, client: structs.Client, path: str|pathlib.Path):
+    async def get_client_file_listing(self, client: structs.Client, path: str|pathlib.Path, offset: int = 0, limit: int = None, sort_key: str = 'name', descending: bool = False, filter: str = '', refresh: bool = False):
+        # if a limit is given, a page of the listing is requested: entries offset to offset+limit after
+        # sorting (by 'name', 'ctime', 'mtime', 'type' or 'size', directories first) and filtering (only
+        # entries whose name contains filter). The client keeps the listing for a short while, so that
+        # further pages are cheap. Set refresh to True to list the directory again instead (e.g. on F5)
+        if not client.online:
+            return
+        msg = {'path': path}
+        if limit is not None:
+            msg |= {'offset': offset, 'limit': limit, 'sort_key': sort_key, 'descending': descending, 'filter': filter, 'refresh': refresh}
+        await comms.typed_send(client.online.writer, message.Message.FILE_GET_LISTING, msg)
+
+    async def watch_client_directory(self, client: structs.Client, path: str|pathlib.Path):
+        # client reports changes to the directory, these are applied to the stored listing
+        # of the directory (if any) and passed to the file_listing_change hooks
+        if not client.online:
+            return
+        await comms.typed_send(client.online.writer, message.Message.FILE_WATCH, {'path': str(path)})
+
+    async def unwatch_client_directory(self, client: structs.Client, path: str|pathlib.Path):
         if not client.online:
             return
-        await comms.typed_send(client.online.writer, message.Message.FILE_GET_LISTING,
-                               {'path': path})
+        await comms.typed_send(client.online.writer, message.Message.FILE_UNWATCH, {'path': str(path)})
 
     async def get_client_remote_shares(self, client: structs.Client, net_name: str, user: str = 'Guest', password: str = '', domain: str = ''):
         # list shares on specified target machine that are accessible from this client
@@ -780,21 +982,170 @@ class Master:
                                             {'old_path': old_path,
                                              'new_path': new_path})
 
-    async def _copy_move_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path, dirs_exist_ok: bool, is_move: bool):
+    async def _copy_move_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path, dirs_exist_ok: bool, is_move: bool, max_workers: int|None):
         return await self._send_file_action(client, message.Message.FILE_COPY_MOVE,
                                             {'source_path': source_path,
                                              'dest_path': dest_path,
                                              'dirs_exist_ok': dirs_exist_ok,    # NB: applies only to copy of a directory, not to copy of file or move of anything
-                                             'is_move': is_move})
-    async def copy_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path, dirs_exist_ok: bool = False):
-        return await self._copy_move_client_file_folder(client, source_path, dest_path, dirs_exist_ok, False)
-    async def move_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path):
-        return await self._copy_move_client_file_folder(client, source_path, dest_path, False, True)
+                                             'is_move': is_move,
+                                             'max_workers': max_workers})       # NB: None: use number configured on the client for the destination
+    async def copy_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path, dirs_exist_ok: bool = False, max_workers: int = None):
+        return await self._copy_move_client_file_folder(client, source_path, dest_path, dirs_exist_ok, False, max_workers)
+    async def move_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path, max_workers: int = None):
+        return await self._copy_move_client_file_folder(client, source_path, dest_path, False, True, max_workers)
 
     async def delete_client_file_folder(self, client: structs.Client, path: str|pathlib.Path):
         return await self._send_file_action(client, message.Message.FILE_DELETE,
                                             {'path': path})
 
+    async def cancel_client_file_action(self, client: structs.Client, action_id: int):
+        # only copies, moves and hashes can be cancelled. A partially copied file is removed
+        if not client.online:
+            return
+        await comms.typed_send(client.online.writer, message.Message.FILE_ACTION_CANCEL, {'action_id': action_id})
+
+    async def hash_client_file_folder(self, client: structs.Client, path: str|pathlib.Path, algorithm: str = 'sha256', use_cache: bool = True):
+        # get digests of a file or of all files below a directory. While running, the status of the
+        # action includes progress, when finished a manifest of path, size, mtime and digest of each
+        # file (a structs.HashManifest). With use_cache, files the client has hashed before and that
+        # did not change since (same size and modification time) are not read again
+        return await self._send_file_action(client, message.Message.FILE_HASH,
+                                            {'path': path,
+                                             'algorithm': algorithm,
+                                             'use_cache': use_cache})
+
+    async def sync_client_file_folder(self, client: structs.Client, source_path: str|pathlib.Path, dest_path: str|pathlib.Path,
+                                      compare_hash: bool = False, delete_policy: structs.SyncDeletePolicy = structs.SyncDeletePolicy.Keep,
+                                      dry_run: bool = False, use_manifest: bool = True, max_workers: int = None):
+        # one-way sync of a directory on the client to a destination (e.g. a folder on a share):
+        # only files that are new or changed (size or modification time differs, or content
+        # hash with compare_hash) are copied. delete_policy determines which files in the
+        # destination that are not in the source are removed. With use_manifest, the client
+        # remembers the state of the destination after a sync, so that it doesn't need to
+        # list the destination the next time. When finished, the status of the action includes
+        # what was done (or for a dry run, what would be done) in a structs.SyncPlan
+        return await self._send_file_action(client, message.Message.FILE_SYNC,
+                                            {'source_path': source_path,
+                                             'dest_path': dest_path,
+                                             'compare_hash': compare_hash,
+                                             'delete_policy': delete_policy,
+                                             'dry_run': dry_run,
+                                             'use_manifest': use_manifest,
+                                             'max_workers': max_workers})
+
+
+    async def search_client_files(self,
+                                  clients: str | int | list[int],
+                                  root: str|pathlib.Path,
+                                  pattern: str = '*',
+                                  is_regex: bool = False,
+                                  min_size: int = None,
+                                  max_size: int = None,
+                                  min_mtime: float = None,
+                                  max_mtime: float = None,
+                                  max_depth: int = None,
+                                  include_dirs: bool = False) -> int|None:
+        # search for files below root on each of the clients, see file_actions.search() for the
+        # meaning of the arguments. Returns the id of the search. Results come in in batches while
+        # the clients search, and are collected in client.online.file_searches[search_id]['results'].
+        # Use the 'file_search' hook to be notified of each batch, or a File_Search waiter to wait
+        # for the search to finish on all clients
+        if clients=='*':
+            with self.clients_lock:
+                clients = [c for c in self.clients if self.clients[c].online]
+        elif isinstance(clients, int):
+            clients = [clients]
+        clients = [c for c in clients if c in self.clients and self.clients[c].online]
+        if not clients:
+            return None
+
+        search_id = self._file_search_id_provider.get_next()
+        msg = {'search_id': search_id, 'root': str(root), 'pattern': pattern, 'is_regex': is_regex,
+               'min_size': min_size, 'max_size': max_size, 'min_mtime': min_mtime, 'max_mtime': max_mtime,
+               'max_depth': max_depth, 'include_dirs': include_dirs}
+        # store locally as pending searches, then launch on all clients at once
+        for c in clients:
+            self.clients[c].online.file_searches[search_id] = {'root': str(root), 'results': structs.DirListing(str(root)), 'status': structs.Status.Pending}
+        await asyncio.gather(*[comms.typed_send(self.clients[c].online.writer, message.Message.FILE_SEARCH, msg) for c in clients])
+        return search_id
+
+    async def cancel_client_file_search(self, search_id: int):
+        # results found so far are kept
+        with self.clients_lock:
+            clients = [self.clients[c].online for c in self.clients if self.clients[c].online and search_id in self.clients[c].online.file_searches]
+        await asyncio.gather(*[comms.typed_send(c.writer, message.Message.FILE_SEARCH_CANCEL, {'search_id': search_id}) for c in clients
+                               if c.file_searches[search_id]['status'] in [structs.Status.Pending, structs.Status.Running]])
+
+    async def pull_client_files(self,
+                                clients: str | int | list[int],
+                                root: str|pathlib.Path,
+                                dest_folder: str|pathlib.Path,
+                                pattern: str = '*',
+                                is_regex: bool = False,
+                                min_size: int = None,
+                                max_size: int = None,
+                                min_mtime: float = None,
+                                max_mtime: float = None,
+                                max_depth: int = None,
+                                compress: bool = True,
+                                max_per_client: int = 2,
+                                max_total: int = 8,
+                                retries: int = 2) -> file_pull.Collection|None:
+        # copy files below root on each of the clients to this machine. Which files is determined
+        # by a search, see search_client_files() for the meaning of those arguments. Files are
+        # stored in dest_folder/<client name>/<path relative to root>. At most max_per_client
+        # files are pulled from a client at the same time, and at most max_total in total.
+        # Files already present at the destination are skipped, transfers interrupted earlier
+        # (e.g. by a client disconnecting) are continued, see labManager.common.file_pull.
+        # Returns the started collection, use its wait() method to wait for it to complete,
+        # or None if there were no clients to pull from
+        search_id = await self.search_client_files(clients, root, pattern, is_regex, min_size, max_size, min_mtime, max_mtime, max_depth)
+        if search_id is None:
+            return None
+        await self.add_waiter(structs.WaiterType.File_Search, search_id)
+
+        files: dict[int, structs.DirListing] = {}
+        names: dict[int, str] = {}
+        errors: dict[int, str] = {}
+        with self.clients_lock:
+            for c in self.clients:
+                if not self.clients[c].online or (search := self.clients[c].online.file_searches.pop(search_id, None)) is None:
+                    continue
+                files[c] = search['results']
+                names[c] = self.clients[c].name
+                if 'error' in search:
+                    errors[c] = str(search['error'])
+        collection = file_pull.Collection(files, names, dest_folder,
+                                          lambda client_id, path, receiver: self._pull_client_file(client_id, path, receiver, compress),
+                                          max_per_client, max_total, retries)
+        collection.client_errors = errors
+        collection.start()
+        return collection
+
+    async def _pull_client_file(self, client_id: int, path: str, receiver: file_pull.Receiver, compress: bool) -> dict[str, Any]:
+        # pull a single file into receiver, returns contents of the client's FILE_PULL_END message
+        client = self.clients.get(client_id)
+        if not client or not client.online:
+            raise ConnectionError('Client is not connected')
+        writer = client.online.writer
+        transfer_id = self._file_pull_id_provider.get_next()
+        fut = asyncio.get_running_loop().create_future()
+        self._file_pulls[transfer_id] = (client_id, receiver, fut)
+        try:
+            await comms.typed_send(writer, message.Message.FILE_PULL,
+                                   {'transfer_id': transfer_id, 'path': path, 'offset': receiver.offset, 'compress': compress})
+            return await fut
+        except asyncio.CancelledError:
+            await comms.typed_send(writer, message.Message.FILE_PULL_CANCEL, {'transfer_id': transfer_id})
+            raise
+        finally:
+            self._file_pulls.pop(transfer_id, None)
+
+    def _file_search_is_done(self, search_id: int) -> bool:
+        # searches on clients that disconnected are not waited for
+        return not any(self.clients[c].online.file_searches[search_id]['status'] in [structs.Status.Pending, structs.Status.Running]
+                       for c in self.clients if self.clients[c].online and search_id in self.clients[c].online.file_searches)
+
 
     async def toems_get_computers(self) -> list[dict[str,Any]]:
         with self.clients_lock:
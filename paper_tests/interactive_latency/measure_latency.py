@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Measure keystroke-to-echo latency of interactive tasks.
+
+Runs interactive tasks with a labManager task executor, once with pipes and once in a
+pseudo-terminal (POSIX only), and measures the time from handing a line of input to the
+executor until output containing it arrives at the other end of a (loopback) master
+connection. Programs that fully buffer their output when not connected to a terminal
+never echo in pipe mode, these are reported as timeouts.
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+from labManager.common import message, task
+from labManager.common.network import comms
+
+PROGRAMS = [
+    'cat',                                                  # echoes as soon as it reads a line
+    f'"{sys.executable}" -c "import sys; [print(l, end=\'\') for l in iter(sys.stdin.readline, \'\')]"',  # fully buffers output when not on a terminal
+]
+
+def drain(queue: asyncio.Queue):
+    while not queue.empty():
+        queue.get_nowait()
+
+async def measure(program: str, use_pty: bool, args):
+    # master side of the connection, timestamps output as it arrives
+    received = asyncio.Queue()
+    closed = asyncio.Event()
+    async def master_side(reader, _):
+        while True:
+            msg_type, msg = await comms.typed_receive(reader)
+            if not msg_type:
+                break
+            if msg_type==message.Message.TASK_OUTPUT:
+                received.put_nowait((time.perf_counter(), msg['output']))
+        closed.set()
+    server = await asyncio.start_server(master_side, '127.0.0.1', 0)
+    _, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+
+    running_task = task.RunningTask(0)
+    runner = asyncio.create_task(task.Executor(stats_interval=0).run(0, task.Type.Shell_command, program, None, None, True, False, running_task, writer, use_pty=use_pty))
+    # let program start and discard any startup output
+    await asyncio.sleep(.5)
+    drain(received)
+
+    latencies = []
+    timeouts = 0
+    for i in range(args.iterations):
+        token = f'key{i:05d}'
+        t0 = time.perf_counter()
+        await running_task.input.put(token+'\n')
+        output = ''
+        try:
+            while token not in output:
+                t1, out = await asyncio.wait_for(received.get(), args.timeout)
+                output += out
+            latencies.append(t1-t0)
+        except asyncio.TimeoutError:
+            timeouts += 1
+            if timeouts>=3 and not latencies:
+                # program doesn't echo at all, no point in continuing
+                break
+        # wait for rest of output (e.g. terminal echo followed by program output) before next keystroke
+        await asyncio.sleep(args.interval)
+        drain(received)
+
+    # stop program
+    runner.cancel()
+    try:
+        await runner
+    except asyncio.CancelledError:
+        pass
+    writer.close()
+    await closed.wait()
+    server.close()
+    await server.wait_closed()
+    return latencies, timeouts
+
+async def main(args):
+    modes = [False, True] if task.pty_supported else [False]
+    if not task.pty_supported:
+        print('pseudo-terminals are not supported on this platform, only measuring pipe mode')
+    print(f'{"program":<60} {"mode":<5} {"n":>5} {"median (ms)":>12} {"95% (ms)":>10} {"timeouts":>9}')
+    for program in args.programs or PROGRAMS:
+        for use_pty in modes:
+            latencies, timeouts = await measure(program, use_pty, args)
+            if latencies:
+                latencies = [l*1000 for l in latencies]
+                median = f'{statistics.median(latencies):.2f}'
+                p95 = f'{statistics.quantiles(latencies, n=20)[-1]:.2f}' if len(latencies)>1 else median
+            else:
+                median = p95 = '-'
+            print(f'{program[-60:]:<60} {"pty" if use_pty else "pipe":<5} {len(latencies):>5} {median:>12} {p95:>10} {timeouts:>9}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure keystroke-to-echo latency of interactive labManager tasks, with pipes and in a pseudo-terminal')
+    parser.add_argument('-n', '--iterations', type=int, default=200, help='number of lines to send per program and mode')
+    parser.add_argument('-t', '--timeout', type=float, default=.5, help='time (s) to wait for the echo of a line')
+    parser.add_argument('-i', '--interval', type=float, default=.02, help='time (s) between lines')
+    parser.add_argument('programs', nargs='*', help='shell commands to test, defaults to cat and a python line-echo loop')
+    asyncio.run(main(parser.parse_args()))